@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Company Change Events (Outbox)
+
+ExcelToPostgresSync emits an event whenever a company is created, its
+ticker changes, or a field relevant for symbol detection changes.
+Downstream jobs read the events after their own cursor and only process
+the companies that actually changed.
+
+Event types:
+- created: new company inserted by the sync
+- ticker_changed: extra_data['Ticker'] changed (drives price scheduling)
+- symbol_fields_changed: wkn/isin or any *symbol*/*ticker* field changed
+"""
+
+from datetime import datetime
+
+EVENT_CREATED = 'created'
+EVENT_TICKER_CHANGED = 'ticker_changed'
+EVENT_SYMBOL_FIELDS_CHANGED = 'symbol_fields_changed'
+
+# Core columns SymbolPopulationService falls back to
+SYMBOL_CORE_FIELDS = ('wkn', 'isin')
+
+PAGE_SIZE = 1000
+
+# Attempts before a consumer gives up on a failing company (until it changes again)
+MAX_RETRIES = 5
+
+
+def is_symbol_field(key):
+    """Whether an extra_data key can feed symbol detection (see populate_symbols.py)"""
+    key_lower = str(key).lower()
+    return 'symbol' in key_lower or 'ticker' in key_lower
+
+
+def detect_company_changes(existing_company, company_data):
+    """
+    Compare an existing company with the data the sync is about to write
+
+    Only keys present in company_data are compared, because the sync merges
+    extra_data into the existing JSONB instead of replacing it.
+
+    Returns: list of (event_type, payload) tuples
+    """
+    events = []
+    existing_extra = existing_company.get('extra_data') or {}
+    new_extra = company_data.get('extra_data') or {}
+
+    if 'Ticker' in new_extra and new_extra['Ticker'] != existing_extra.get('Ticker'):
+        events.append((EVENT_TICKER_CHANGED, {
+            'old': existing_extra.get('Ticker'),
+            'new': new_extra['Ticker']
+        }))
+
+    changed_fields = [
+        key for key, value in new_extra.items()
+        if is_symbol_field(key) and value != existing_extra.get(key)
+    ]
+    changed_fields += [
+        field for field in SYMBOL_CORE_FIELDS
+        if field in company_data and company_data[field] != existing_company.get(field)
+    ]
+
+    if changed_fields:
+        events.append((EVENT_SYMBOL_FIELDS_CHANGED, {'fields': changed_fields}))
+
+    return events
+
+
+class ChangeEventOutbox:
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def emit(self, events):
+        """
+        Insert events in one batch
+
+        Args:
+            events: list of (company_id, event_type, payload) tuples
+        """
+        if not events:
+            return 0
+
+        rows = [
+            {'company_id': company_id, 'event_type': event_type, 'payload': payload or {}}
+            for company_id, event_type, payload in events
+        ]
+        self.supabase.table('company_change_events').insert(rows).execute()
+        return len(rows)
+
+    def latest_event_id(self):
+        """Get the newest event id (0 if the outbox is empty)"""
+        response = self.supabase.table('company_change_events') \
+            .select('id') \
+            .order('id', desc=True) \
+            .limit(1) \
+            .execute()
+        return response.data[0]['id'] if response.data else 0
+
+
+class ChangeEventConsumer:
+    def __init__(self, supabase, consumer):
+        self.supabase = supabase
+        self.consumer = consumer
+
+    def get_cursor(self):
+        """Get the last processed event id, or None if this consumer never ran"""
+        response = self.supabase.table('change_event_cursors') \
+            .select('last_event_id') \
+            .eq('consumer', self.consumer) \
+            .execute()
+        return response.data[0]['last_event_id'] if response.data else None
+
+    def poll(self, cursor):
+        """
+        Get all events after cursor, oldest first
+
+        Not filtered by type on purpose: the cursor must move past events a
+        consumer ignores, otherwise they would be re-read on every run.
+        """
+        events = []
+
+        while True:
+            batch = self.supabase.table('company_change_events') \
+                .select('id, company_id, event_type, payload') \
+                .gt('id', cursor) \
+                .order('id') \
+                .limit(PAGE_SIZE) \
+                .execute().data
+            events.extend(batch)
+
+            if len(batch) < PAGE_SIZE:
+                break
+            cursor = batch[-1]['id']
+
+        return events
+
+    def ack(self, last_event_id):
+        """Move the cursor forward to last_event_id"""
+        self.supabase.table('change_event_cursors').upsert({
+            'consumer': self.consumer,
+            'last_event_id': last_event_id,
+            'updated_at': datetime.now().isoformat()
+        }).execute()
+
+    def get_retries(self):
+        """Get {company_id: attempts} of failed companies still worth retrying"""
+        response = self.supabase.table('change_event_retries') \
+            .select('company_id, attempts') \
+            .eq('consumer', self.consumer) \
+            .lt('attempts', MAX_RETRIES) \
+            .execute()
+        return {row['company_id']: row['attempts'] for row in response.data}
+
+    def record_failures(self, errors, retries):
+        """
+        Remember failed companies so the cursor can move past them
+
+        Args:
+            errors: {company_id: error message}
+            retries: get_retries() result, to count the attempts
+
+        Returns: company ids that reached MAX_RETRIES and are given up on
+        """
+        if not errors:
+            return []
+
+        rows = [
+            {
+                'consumer': self.consumer,
+                'company_id': company_id,
+                'attempts': retries.get(company_id, 0) + 1,
+                'last_error': str(error)[:500],
+                'updated_at': datetime.now().isoformat()
+            }
+            for company_id, error in errors.items()
+        ]
+        self.supabase.table('change_event_retries').upsert(rows).execute()
+        return [row['company_id'] for row in rows if row['attempts'] >= MAX_RETRIES]
+
+    def clear_retries(self, company_ids):
+        """Forget companies that were processed (or no longer need processing)"""
+        if company_ids:
+            self.supabase.table('change_event_retries') \
+                .delete() \
+                .eq('consumer', self.consumer) \
+                .in_('company_id', list(company_ids)) \
+                .execute()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Company Registry
+Compact in-memory view of the companies table shared by the Python jobs
+
+Records use __slots__ and only hold id, lookup keys, the sync fingerprint and
+hot fields (ticker, price_checked_at). The extra_data JSONB blob (80+ Excel
+fields) is not loaded with the registry; it is fetched lazily, in batches,
+for the records that actually need it (see load_extra_data).
+
+Records behave like the PostgREST row dicts the jobs used before
+(record['id'], record.get('extra_data', {})), so call sites don't change.
+"""
+
+import sys
+import json
+import hashlib
+
+PAGE_SIZE = 1000
+
+# Company ids per PostgREST in() filter (keeps the URL short)
+ID_CHUNK_SIZE = 200
+
+COLUMNS = 'id, name, satellog, symbol, wkn, isin, sync_fingerprint, price_checked_at, ticker:extra_data->>Ticker'
+
+_NOT_LOADED = object()
+
+
+def _intern(value):
+    """Intern short repeated strings (ids, keys) so duplicates share memory"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def fingerprint(company_data):
+    """Stable hash of the data the Excel sync writes for a company"""
+    payload = json.dumps(company_data, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class CompanyRecord:
+    __slots__ = ('id', 'name', 'satellog', 'symbol', 'wkn', 'isin', 'fingerprint', 'price_checked_at', 'ticker',
+                 '_extra_data', '_registry')
+
+    def __init__(self, row, registry):
+        self.id = _intern(row['id'])
+        self.name = row.get('name')
+        self.satellog = _intern(row.get('satellog'))
+        self.symbol = _intern(row.get('symbol'))
+        self.wkn = _intern(row.get('wkn'))
+        self.isin = _intern(row.get('isin'))
+        self.fingerprint = row.get('sync_fingerprint')
+        self.price_checked_at = row.get('price_checked_at')
+        self.ticker = _intern(row.get('ticker'))
+        self._extra_data = (row['extra_data'] or {}) if 'extra_data' in row else _NOT_LOADED
+        self._registry = registry
+
+    @property
+    def extra_data(self):
+        """extra_data blob, fetched on first access"""
+        if self._extra_data is _NOT_LOADED:
+            self._registry.load_extra_data([self])
+        return self._extra_data
+
+    def release_extra_data(self):
+        """Drop the cached blob once it is no longer needed"""
+        self._extra_data = _NOT_LOADED
+
+    # Dict-style access for code written against PostgREST rows
+
+    def __getitem__(self, key):
+        if key == 'sync_fingerprint':
+            return self.fingerprint
+        if key in self.__slots__ and not key.startswith('_'):
+            return getattr(self, key)
+        if key == 'extra_data':
+            return self.extra_data
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __repr__(self):
+        return f"CompanyRecord(id={self.id!r}, name={self.name!r})"
+
+
+class CompanyRegistry:
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.records = []
+        self.by_id = {}
+        self.by_name = {}
+        self.by_satellog = {}
+
+    @classmethod
+    def load(cls, supabase, company_ids=None, symbol_missing=False, with_extra_data=False, limit=None):
+        """
+        Load companies into a registry
+
+        Args:
+            company_ids: only load these ids (default: all companies)
+            symbol_missing: only companies without symbol
+            with_extra_data: fetch extra_data up front (when every record needs it)
+            limit: maximum number of companies
+        """
+        registry = cls(supabase)
+        columns = COLUMNS + (', extra_data' if with_extra_data else '')
+
+        def query():
+            q = supabase.table('companies').select(columns)
+            if symbol_missing:
+                q = q.is_('symbol', None)
+            return q
+
+        if company_ids is not None:
+            for i in range(0, len(company_ids), ID_CHUNK_SIZE):
+                rows = query().in_('id', company_ids[i:i + ID_CHUNK_SIZE]).execute().data
+                # Stop at the limit before indexing, so records and the lookups agree
+                registry.add_rows(rows[:limit - len(registry)] if limit else rows)
+                if limit and len(registry) >= limit:
+                    break
+            return registry
+
+        if limit:
+            registry.add_rows(query().limit(limit).execute().data)
+            return registry
+
+        # Paginate past Supabase 1000-row default limit
+        offset = 0
+        while True:
+            batch = query().order('id').range(offset, offset + PAGE_SIZE - 1).execute().data
+            registry.add_rows(batch)
+            if len(batch) < PAGE_SIZE:
+                return registry
+            offset += PAGE_SIZE
+
+    def add_rows(self, rows):
+        """Index PostgREST rows as records"""
+        for row in rows:
+            record = CompanyRecord(row, self)
+            self.records.append(record)
+            self.by_id[record.id] = record
+
+            name = (record.name or '').strip()
+            satellog = (record.satellog or '').strip()
+            if name:
+                self.by_name[name] = record
+            if satellog:
+                self.by_satellog[satellog] = record
+
+    def load_extra_data(self, records):
+        """Fetch extra_data for records that don't have it yet, in batches"""
+        missing = [r.id for r in records if r._extra_data is _NOT_LOADED]
+
+        for i in range(0, len(missing), ID_CHUNK_SIZE):
+            response = self.supabase.table('companies') \
+                .select('id, extra_data') \
+                .in_('id', missing[i:i + ID_CHUNK_SIZE]) \
+                .execute()
+            for row in response.data:
+                record = self.by_id.get(row['id'])
+                if record is not None:
+                    record._extra_data = row.get('extra_data') or {}
+
+        # Rows deleted in the meantime
+        for record in records:
+            if record._extra_data is _NOT_LOADED:
+                record._extra_data = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Price Metrics Engine
+Computes derived metrics for all companies in one vectorized pass:
+returns, rolling volatility, moving averages, drawdown and gap-to-target
+
+Daily closes from stock_prices are loaded into a (companies x trading days)
+NumPy matrix, so every metric is a handful of array operations instead of a
+per-company loop. Results are upserted into company_price_metrics in one
+bulk statement.
+
+Runs daily via cron after market close
+"""
+
+import os
+import sys
+import warnings
+from datetime import datetime, timedelta
+
+from pg_connection import get_connection, psycopg2
+from job_profiler import JobProfiler
+
+try:
+    import numpy as np
+except ImportError:
+    print("❌ numpy not installed. Installing...")
+    os.system(f"{sys.executable} -m pip install numpy")
+    import numpy as np
+
+# Calendar days of history to load (covers 252 trading days + SMA 200 warm-up)
+LOOKBACK_DAYS = 400
+
+# Return horizons in trading days
+RETURN_HORIZONS = {
+    'return_1d': 1,
+    'return_1w': 5,
+    'return_1m': 21,
+    'return_3m': 63,
+    'return_1y': 252,
+}
+
+VOLATILITY_WINDOW = 30
+TRADING_DAYS_PER_YEAR = 252
+
+# Trading days without a real close after which a company's metrics are NULL
+# (forward-filling further would report returns/volatility of a flat line)
+MAX_STALE_DAYS = 5
+
+METRIC_COLUMNS = [
+    'company_id', 'as_of', 'last_close',
+    'return_1d', 'return_1w', 'return_1m', 'return_3m', 'return_1y',
+    'volatility_30d', 'sma_50', 'sma_200', 'drawdown', 'max_drawdown',
+    'target_price', 'price_gap_percent', 'data_points',
+]
+
+
+def build_close_matrix(company_ids, days, closes):
+    """
+    Pivot (company_id, day, close) rows into a dense matrix
+
+    Returns: (companies, trading_days, matrix, observed) with NaN for missing
+    days, forward-filled so holidays/gaps of one listing don't break the
+    others; observed marks the real (not forward-filled) closes
+    """
+    companies, company_idx = np.unique(company_ids, return_inverse=True)
+    trading_days, day_idx = np.unique(days, return_inverse=True)
+
+    matrix = np.full((len(companies), len(trading_days)), np.nan)
+    matrix[company_idx, day_idx] = closes
+
+    # Vectorized forward fill along the time axis
+    valid = ~np.isnan(matrix)
+    last_valid = np.where(valid, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(last_valid, axis=1, out=last_valid)
+    filled = matrix[np.arange(matrix.shape[0])[:, None], last_valid]
+
+    return companies, trading_days, filled, valid
+
+
+def trailing_mean(matrix, window):
+    """Mean of the last `window` columns; NaN unless the window is fully populated"""
+    tail = matrix[:, -window:]
+    if tail.shape[1] < window:
+        return np.full(matrix.shape[0], np.nan)
+    counts = np.sum(~np.isnan(tail), axis=1)
+    means = np.nanmean(tail, axis=1)
+    return np.where(counts == window, means, np.nan)
+
+
+def compute_metrics(matrix, observed):
+    """
+    Compute all price metrics for a forward-filled close matrix (one row per company)
+
+    Companies without a real close in the last MAX_STALE_DAYS trading days
+    get NaN for every metric (see stale)
+    """
+    last_close = matrix[:, -1]
+    metrics = {'last_close': last_close}
+
+    # Short histories produce NaN (not errors) for the metrics they can't support
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        # Simple returns over fixed trading-day horizons
+        for name, horizon in RETURN_HORIZONS.items():
+            if matrix.shape[1] > horizon:
+                metrics[name] = last_close / matrix[:, -1 - horizon] - 1
+            else:
+                metrics[name] = np.full(matrix.shape[0], np.nan)
+
+        # Annualized volatility of daily log returns
+        log_returns = np.diff(np.log(matrix), axis=1)
+        tail = log_returns[:, -VOLATILITY_WINDOW:]
+        enough = np.sum(~np.isnan(tail), axis=1) >= 2
+        volatility = np.nanstd(tail, axis=1, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR)
+        metrics['volatility_30d'] = np.where(enough, volatility, np.nan)
+
+        # Moving averages
+        metrics['sma_50'] = trailing_mean(matrix, 50)
+        metrics['sma_200'] = trailing_mean(matrix, 200)
+
+        # Drawdown against the running high (fmax ignores leading NaNs)
+        running_high = np.fmax.accumulate(matrix, axis=1)
+        drawdowns = matrix / running_high - 1
+        metrics['drawdown'] = drawdowns[:, -1]
+        metrics['max_drawdown'] = np.nanmin(drawdowns, axis=1)
+
+    # Real closes only: forward-filled days would count every day after the first
+    metrics['data_points'] = np.sum(observed, axis=1)
+
+    # Trading days since the last real close
+    last_observed = matrix.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1)
+    metrics['stale'] = matrix.shape[1] - 1 - last_observed > MAX_STALE_DAYS
+    for name, values in metrics.items():
+        if name not in ('data_points', 'stale'):
+            metrics[name] = np.where(metrics['stale'], np.nan, values)
+
+    return metrics
+
+
+def parse_price(value):
+    """Parse a price from extra_data, treating 0/invalid as missing (like Number(x) || null)"""
+    try:
+        price = float(str(value).replace(',', '').replace('$', '').strip())
+    except (TypeError, ValueError):
+        return None
+    if price != price or price == 0:
+        return None
+    return price
+
+
+def to_db(value):
+    """Convert a NumPy scalar to a DB value (NaN/inf -> NULL)"""
+    if value is None:
+        return None
+    value = float(value)
+    if not np.isfinite(value):
+        return None
+    return value
+
+
+class PriceMetricsEngine:
+    def __init__(self, lookback_days=LOOKBACK_DAYS, profile=None):
+        self.conn = get_connection()
+        self.lookback_days = lookback_days
+        self.profiler = JobProfiler('compute_price_metrics', enabled=profile)
+
+        # Stats
+        self.stats = {
+            'start_time': None,
+            'end_time': None,
+            'price_rows': 0,
+            'companies': 0,
+            'trading_days': 0,
+            'stale': 0,
+            'metrics_written': 0,
+            'success': False,
+            'error_message': None
+        }
+
+    def load_daily_closes(self):
+        """Load the last close per company and day into NumPy arrays"""
+        print("\n📥 Loading daily closes from stock_prices...")
+
+        since = datetime.now() - timedelta(days=self.lookback_days)
+
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT ON (company_id, "timestamp"::date)
+                    company_id::text, "timestamp"::date, close
+                FROM stock_prices
+                WHERE "timestamp" >= %s
+                ORDER BY company_id, "timestamp"::date, "timestamp" DESC
+            """, (since,))
+            rows = cur.fetchall()
+
+        self.stats['price_rows'] = len(rows)
+        print(f"   ✅ Loaded {len(rows)} daily closes")
+
+        if not rows:
+            return None
+
+        company_ids, days, closes = zip(*rows)
+        return (
+            np.array(company_ids),
+            np.array(days, dtype='datetime64[D]'),
+            np.array(closes, dtype=np.float64),
+        )
+
+    def load_targets(self):
+        """Get current price and purchase target per company"""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT id::text, current_price,
+                       extra_data->>'Purchase_$', extra_data->>'IPO_Price_$'
+                FROM companies
+                WHERE current_price IS NOT NULL
+                   OR extra_data ? 'Purchase_$'
+                   OR extra_data ? 'IPO_Price_$'
+            """)
+            return {
+                row[0]: (
+                    float(row[1]) if row[1] is not None else None,
+                    parse_price(row[2]) or parse_price(row[3]),
+                )
+                for row in cur.fetchall()
+            }
+
+    def write_metrics(self, records):
+        """Upsert all metric rows in a single statement"""
+        print(f"\n💾 Writing {len(records)} metric rows...")
+
+        updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in METRIC_COLUMNS[1:])
+
+        with self.conn.cursor() as cur:
+            psycopg2.extras.execute_values(
+                cur,
+                f"""
+                INSERT INTO company_price_metrics ({', '.join(METRIC_COLUMNS)})
+                VALUES %s
+                ON CONFLICT (company_id) DO UPDATE SET {updates}, computed_at = NOW()
+                """,
+                records,
+                page_size=len(records)
+            )
+        self.conn.commit()
+
+        print(f"   ✅ Wrote {len(records)} rows")
+        return len(records)
+
+    def run(self):
+        """Run the metrics computation"""
+        self.stats['start_time'] = datetime.now()
+        print("=" * 60)
+        print("📐 PRICE METRICS ENGINE")
+        print("=" * 60)
+        print(f"Started at: {self.stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Lookback: {self.lookback_days} days")
+
+        try:
+            # 1. Load price history
+            with self.profiler.stage('load_daily_closes'):
+                loaded = self.load_daily_closes()
+            if loaded is None:
+                print("\n⚠️  No price history found")
+                self.stats['success'] = True
+                return True
+
+            # 2. Compute metrics for every company at once
+            print("\n🧮 Computing metrics...")
+            with self.profiler.stage('compute_metrics'):
+                companies, trading_days, matrix, observed = build_close_matrix(*loaded)
+                metrics = compute_metrics(matrix, observed)
+
+            self.stats['companies'] = len(companies)
+            self.stats['trading_days'] = len(trading_days)
+            self.stats['stale'] = int(np.sum(metrics['stale']))
+            print(f"   ✅ {len(companies)} companies x {len(trading_days)} trading days")
+            if self.stats['stale']:
+                print(f"   ⚠️  {self.stats['stale']} companies without a close in the last {MAX_STALE_DAYS} trading days")
+
+            # 3. Gap to purchase target (same rule as the Buy Radar analysis)
+            with self.profiler.stage('load_targets'):
+                targets = self.load_targets()
+            as_of = trading_days[-1].astype(datetime)
+
+            records = []
+            for i, company_id in enumerate(companies):
+                current_price, target = targets.get(company_id, (None, None))
+                price = current_price or to_db(metrics['last_close'][i])
+                gap = (price - target) / target * 100 if price and target else None
+
+                records.append((
+                    company_id, None if metrics['stale'][i] else as_of, to_db(metrics['last_close'][i]),
+                    to_db(metrics['return_1d'][i]), to_db(metrics['return_1w'][i]),
+                    to_db(metrics['return_1m'][i]), to_db(metrics['return_3m'][i]),
+                    to_db(metrics['return_1y'][i]),
+                    to_db(metrics['volatility_30d'][i]),
+                    to_db(metrics['sma_50'][i]), to_db(metrics['sma_200'][i]),
+                    to_db(metrics['drawdown'][i]), to_db(metrics['max_drawdown'][i]),
+                    target, gap, int(metrics['data_points'][i]),
+                ))
+
+            # 4. Bulk write
+            with self.profiler.stage('write_metrics'):
+                self.stats['metrics_written'] = self.write_metrics(records)
+
+            self.stats['success'] = True
+            print("\n" + "=" * 60)
+            print("✅ METRICS COMPLETED")
+
+        except Exception as e:
+            print(f"\n❌ METRICS FAILED: {e}")
+            self.conn.rollback()
+            self.stats['success'] = False
+            self.stats['error_message'] = str(e)
+
+        finally:
+            self.stats['end_time'] = datetime.now()
+            duration = (self.stats['end_time'] - self.stats['start_time']).total_seconds()
+            self.conn.close()
+
+            print("=" * 60)
+            print("📊 METRICS STATISTICS")
+            print("=" * 60)
+            print(f"Duration: {duration:.1f}s")
+            print(f"Price Rows: {self.stats['price_rows']}")
+            print(f"Companies: {self.stats['companies']}")
+            print(f"Trading Days: {self.stats['trading_days']}")
+            print(f"Stale Companies: {self.stats['stale']}")
+            print(f"Metrics Written: {self.stats['metrics_written']}")
+            print(f"Status: {'✅ SUCCESS' if self.stats['success'] else '❌ FAILED'}")
+            if self.stats['error_message']:
+                print(f"Error: {self.stats['error_message']}")
+            print("=" * 60)
+
+            self.profiler.write_reports()
+
+        return self.stats['success']
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compute price metrics for all companies')
+    parser.add_argument('--lookback-days', type=int, default=LOOKBACK_DAYS,
+                        help=f'Calendar days of history to load (default: {LOOKBACK_DAYS})')
+    parser.add_argument('--profile', action='store_true', help='Write per-stage CPU/memory profiles (see job_profiler.py)')
+    args = parser.parse_args()
+
+    engine = PriceMetricsEngine(lookback_days=args.lookback_days, profile=args.profile or None)
+    success = engine.run()
+    sys.exit(0 if success else 1)
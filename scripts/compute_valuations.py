@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Valuation Engine
+Precomputes market value, P&L and day change per portfolio and watchlist
+
+Only portfolios/watchlists that contain the given companies are recomputed
+(the StockPriceUpdater passes the companies of each price batch), or all of
+them when run without --company-ids. Positions are loaded in one query and
+aggregated per portfolio with NumPy (np.unique + np.bincount) instead of a
+per-portfolio loop; results are upserted into portfolio_valuations in one
+bulk statement.
+
+Amounts are summed in the positions' quote currency without FX conversion;
+currency is NULL when a portfolio mixes currencies.
+"""
+
+import os
+import sys
+from datetime import datetime, timezone
+
+from pg_connection import get_connection, psycopg2
+from job_profiler import JobProfiler
+
+try:
+    import numpy as np
+except ImportError:
+    print("❌ numpy not installed. Installing...")
+    os.system(f"{sys.executable} -m pip install numpy")
+    import numpy as np
+
+VALUATION_COLUMNS = [
+    'kind', 'owner_id', 'positions', 'priced_positions', 'currency',
+    'cost_basis', 'market_value', 'unrealized_pnl', 'unrealized_pnl_percent',
+    'day_change', 'day_change_percent', 'dividends', 'fees',
+    'advancers', 'decliners', 'prices_as_of',
+]
+
+# Every position of every portfolio/watchlist kind, as (kind, owner_id, company_id, quantity, cost_price)
+MEMBERS_SQL = """
+    SELECT 'portfolio' AS kind, portfolio_id AS owner_id, company_id,
+           quantity::float8 AS quantity, average_purchase_price::float8 AS cost_price
+    FROM holdings
+    UNION ALL
+    SELECT 'watchlist', watchlist_id, company_id, NULL, NULL FROM watchlist_items
+    UNION ALL
+    SELECT 'user_watchlist', user_id, company_id, NULL, NULL FROM watchlist
+"""
+
+
+def to_float(value):
+    """Parse a number from extra_data text (NaN if missing/invalid)"""
+    try:
+        return float(str(value).replace(',', '').rstrip('%').strip())
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def to_db(value):
+    """Convert a NumPy scalar to a DB value (NaN/inf -> NULL)"""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def group_sum(groups, values, mask, size):
+    """Sum of values per group over the rows where mask is set"""
+    return np.bincount(groups, weights=np.where(mask, values, 0.0), minlength=size)
+
+
+def compute_valuations(groups, size, quantity, cost_price, price, change_percent):
+    """
+    Aggregate position arrays (one entry per position) into per-group valuations
+
+    groups holds the group index of each position; quantity/cost_price are NaN
+    for watchlist items. Returns a dict of arrays with one entry per group.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        priced = ~np.isnan(price)
+        held = priced & ~np.isnan(quantity)
+        has_change = priced & ~np.isnan(change_percent)
+        previous_close = price / (1 + change_percent / 100)
+
+        market_value = group_sum(groups, quantity * price, held, size)
+        cost_basis = group_sum(groups, quantity * cost_price, held & ~np.isnan(cost_price), size)
+        day_change = group_sum(groups, quantity * (price - previous_close), held & has_change, size)
+        has_holdings = np.bincount(groups, weights=held, minlength=size) > 0
+
+        # Watchlists: plain average of the items' day change
+        change_count = np.bincount(groups, weights=has_change, minlength=size)
+        average_change = group_sum(groups, change_percent, has_change, size) / change_count
+
+        return {
+            'positions': np.bincount(groups, minlength=size),
+            'priced_positions': np.bincount(groups, weights=priced, minlength=size).astype(int),
+            'cost_basis': np.where(has_holdings, cost_basis, np.nan),
+            'market_value': np.where(has_holdings, market_value, np.nan),
+            'unrealized_pnl': np.where(has_holdings, market_value - cost_basis, np.nan),
+            'unrealized_pnl_percent': np.where(has_holdings, (market_value - cost_basis) / cost_basis * 100, np.nan),
+            'day_change': np.where(has_holdings, day_change, np.nan),
+            'day_change_percent': np.where(has_holdings, day_change / (market_value - day_change) * 100, average_change),
+            'advancers': np.bincount(groups, weights=has_change & (change_percent > 0), minlength=size).astype(int),
+            'decliners': np.bincount(groups, weights=has_change & (change_percent < 0), minlength=size).astype(int),
+        }
+
+
+def common_currency(groups, size, currencies, priced):
+    """Currency per group if all its priced positions share one, else None"""
+    codes, currency_idx = np.unique(currencies, return_inverse=True)
+    pairs = np.unique(groups[priced] * len(codes) + currency_idx[priced])
+    pair_groups = pairs // len(codes)
+
+    counts = np.bincount(pair_groups, minlength=size)
+    result = np.full(size, None, dtype=object)
+    result[pair_groups] = codes[pairs % len(codes)]
+    result[counts != 1] = None
+    return result
+
+
+class ValuationEngine:
+    def __init__(self, company_ids=None, profile=None):
+        self.conn = get_connection()
+        self.company_ids = list(company_ids) if company_ids is not None else None  # None = all portfolios
+        self.profiler = JobProfiler('compute_valuations', enabled=profile)
+
+        # Stats
+        self.stats = {
+            'start_time': None,
+            'end_time': None,
+            'positions': 0,
+            'portfolios': 0,
+            'watchlists': 0,
+            'valuations_written': 0,
+            'success': False,
+            'error_message': None
+        }
+
+    def load_positions(self):
+        """Positions of the affected portfolios/watchlists with current prices"""
+        print("\n📥 Loading positions...")
+
+        affected = ""
+        params = ()
+        if self.company_ids is not None:
+            affected = """
+                JOIN (SELECT DISTINCT kind, owner_id FROM members WHERE company_id = ANY(%s::uuid[])) affected
+                  USING (kind, owner_id)
+            """
+            params = (self.company_ids,)
+
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                WITH members AS ({MEMBERS_SQL})
+                SELECT m.kind, m.owner_id::text, m.quantity, m.cost_price,
+                       c.current_price::float8, c.extra_data->>'Price_Change_Percent',
+                       COALESCE(c.extra_data->>'Currency', ''), c.price_checked_at
+                FROM members m
+                {affected}
+                JOIN companies c ON c.id = m.company_id
+            """, params)
+            rows = cur.fetchall()
+
+        self.stats['positions'] = len(rows)
+        print(f"   ✅ Loaded {len(rows)} positions")
+        return rows
+
+    def load_transaction_totals(self, portfolio_ids):
+        """Dividends received and fees paid per portfolio"""
+        if not portfolio_ids:
+            return {}
+
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT portfolio_id::text,
+                       COALESCE(SUM(total) FILTER (WHERE type = 'dividend'), 0)::float8,
+                       COALESCE(SUM(fees), 0)::float8
+                FROM transactions
+                WHERE portfolio_id = ANY(%s::uuid[])
+                GROUP BY portfolio_id
+            """, (portfolio_ids,))
+            return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+    def build_records(self, rows):
+        """Aggregate position rows into one valuation record per portfolio/watchlist"""
+        kinds, owners, quantity, cost_price, price, change, currency, checked_at = zip(*rows)
+
+        keys, groups = np.unique([f"{kind}|{owner}" for kind, owner in zip(kinds, owners)], return_inverse=True)
+        size = len(keys)
+
+        price = np.array(price, dtype=np.float64)
+        values = compute_valuations(
+            groups, size,
+            np.array(quantity, dtype=np.float64),
+            np.array(cost_price, dtype=np.float64),
+            price,
+            np.array([to_float(c) for c in change]),
+        )
+        currencies = common_currency(groups, size, np.array(currency), ~np.isnan(price))
+
+        # Latest price check per group
+        checked = np.array([c.timestamp() if c else -np.inf for c in checked_at])
+        prices_as_of = np.full(size, -np.inf)
+        np.maximum.at(prices_as_of, groups, checked)
+
+        portfolio_ids = [key.split('|', 1)[1] for key in keys if key.startswith('portfolio|')]
+        totals = self.load_transaction_totals(portfolio_ids)
+
+        records = []
+        for i, key in enumerate(keys):
+            kind, owner_id = key.split('|', 1)
+            dividends, fees = totals.get(owner_id, (None, None)) if kind == 'portfolio' else (None, None)
+            records.append((
+                kind, owner_id, int(values['positions'][i]), int(values['priced_positions'][i]),
+                currencies[i] or None,
+                to_db(values['cost_basis'][i]), to_db(values['market_value'][i]),
+                to_db(values['unrealized_pnl'][i]), to_db(values['unrealized_pnl_percent'][i]),
+                to_db(values['day_change'][i]), to_db(values['day_change_percent'][i]),
+                dividends, fees,
+                int(values['advancers'][i]), int(values['decliners'][i]),
+                datetime.fromtimestamp(prices_as_of[i], timezone.utc) if np.isfinite(prices_as_of[i]) else None,
+            ))
+            self.stats['portfolios' if kind == 'portfolio' else 'watchlists'] += 1
+
+        return records
+
+    def write_valuations(self, records):
+        """Upsert all valuation rows in a single statement"""
+        print(f"\n💾 Writing {len(records)} valuation rows...")
+
+        updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in VALUATION_COLUMNS[2:])
+
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT NOW()")
+            started = cur.fetchone()[0]
+
+            if records:
+                psycopg2.extras.execute_values(
+                    cur,
+                    f"""
+                    INSERT INTO portfolio_valuations ({', '.join(VALUATION_COLUMNS)})
+                    VALUES %s
+                    ON CONFLICT (kind, owner_id) DO UPDATE SET {updates}, computed_at = NOW()
+                    """,
+                    records,
+                    page_size=len(records)
+                )
+
+            if self.company_ids is None:
+                # Full run: drop portfolios/watchlists that no longer have positions
+                cur.execute("DELETE FROM portfolio_valuations WHERE computed_at < %s", (started,))
+        self.conn.commit()
+
+        print(f"   ✅ Wrote {len(records)} rows")
+        return len(records)
+
+    def run(self):
+        """Run the valuation"""
+        self.stats['start_time'] = datetime.now()
+        print("=" * 60)
+        print("💼 VALUATION ENGINE")
+        print("=" * 60)
+        print(f"Started at: {self.stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Scope: {'all portfolios' if self.company_ids is None else f'{len(self.company_ids)} updated companies'}")
+
+        try:
+            # 1. Load positions of the affected portfolios/watchlists
+            with self.profiler.stage('load_positions'):
+                rows = self.load_positions()
+
+            # 2. Aggregate per portfolio/watchlist
+            print("\n🧮 Computing valuations...")
+            with self.profiler.stage('compute_valuations'):
+                records = self.build_records(rows) if rows else []
+            print(f"   ✅ {self.stats['portfolios']} portfolios, {self.stats['watchlists']} watchlists")
+
+            # 3. Bulk write
+            if records or self.company_ids is None:
+                with self.profiler.stage('write_valuations'):
+                    self.stats['valuations_written'] = self.write_valuations(records)
+
+            self.stats['success'] = True
+            print("\n" + "=" * 60)
+            print("✅ VALUATION COMPLETED")
+
+        except Exception as e:
+            print(f"\n❌ VALUATION FAILED: {e}")
+            self.conn.rollback()
+            self.stats['success'] = False
+            self.stats['error_message'] = str(e)
+
+        finally:
+            self.stats['end_time'] = datetime.now()
+            duration = (self.stats['end_time'] - self.stats['start_time']).total_seconds()
+            self.conn.close()
+
+            print("=" * 60)
+            print("📊 VALUATION STATISTICS")
+            print("=" * 60)
+            print(f"Duration: {duration:.1f}s")
+            print(f"Positions: {self.stats['positions']}")
+            print(f"Portfolios: {self.stats['portfolios']}")
+            print(f"Watchlists: {self.stats['watchlists']}")
+            print(f"Valuations Written: {self.stats['valuations_written']}")
+            print(f"Status: {'✅ SUCCESS' if self.stats['success'] else '❌ FAILED'}")
+            if self.stats['error_message']:
+                print(f"Error: {self.stats['error_message']}")
+            print("=" * 60)
+
+            self.profiler.write_reports()
+
+        return self.stats['success']
+
+
+def refresh_valuations(company_ids):
+    """Revalue the portfolios/watchlists holding company_ids; never raises (best effort)"""
+    try:
+        # Called from inside other jobs' profiled stages - never profile on its own
+        return ValuationEngine(company_ids=company_ids, profile=False).run()
+    except Exception as e:
+        print(f"   ⚠️  Valuation refresh skipped: {e}")
+        return False
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Precompute portfolio and watchlist valuations')
+    parser.add_argument('--company-ids', nargs='+', help='Only revalue portfolios/watchlists holding these companies')
+    parser.add_argument('--profile', action='store_true', help='Write per-stage CPU/memory profiles (see job_profiler.py)')
+    args = parser.parse_args()
+
+    engine = ValuationEngine(company_ids=args.company_ids, profile=args.profile or None)
+    success = engine.run()
+    sys.exit(0 if success else 1)
@@ -35,6 +35,25 @@ docker compose -f $COMPOSE_FILE build --no-cache
 echo -e "${YELLOW}⏹️  Stopping old containers...${NC}"
 docker compose -f $COMPOSE_FILE down
 
+# Start the database first - migrations run before the app and workers come up
+echo -e "${YELLOW}🗄️  Starting database...${NC}"
+docker compose -f $COMPOSE_FILE up -d --wait postgres
+
+if docker compose -f $COMPOSE_FILE exec -T postgres psql -U blackfire_user -d blackfire -c "SELECT 1" > /dev/null 2>&1; then
+    echo -e "${GREEN}✅ Database is accessible${NC}"
+else
+    echo -e "${RED}❌ Database is not accessible${NC}"
+    exit 1
+fi
+
+# Run database migrations
+# A fresh volume is set up by docker-entrypoint-initdb.d, so the first run records
+# the existing migrations as baseline instead of applying them again.
+# Self-hosted Postgres uses the TimescaleDB schema, not the Supabase one
+echo -e "${YELLOW}🗃️  Running database migrations...${NC}"
+docker compose -f $COMPOSE_FILE run --rm --no-deps cron \
+    python3 scripts/run-migration.py --baseline-existing --skip 20260128000002_supabase_schema
+
 # Start new containers
 echo -e "${YELLOW}🚀 Starting new containers...${NC}"
 docker compose -f $COMPOSE_FILE up -d
@@ -47,17 +66,6 @@ sleep 10
 echo -e "${YELLOW}🏥 Checking service health...${NC}"
 docker compose -f $COMPOSE_FILE ps
 
-# Run database migrations (if needed)
-echo -e "${YELLOW}🗃️  Running database migrations...${NC}"
-docker compose -f $COMPOSE_FILE exec -T postgres psql -U blackfire_user -d blackfire -c "SELECT 1" > /dev/null 2>&1
-
-if [ $? -eq 0 ]; then
-    echo -e "${GREEN}✅ Database is accessible${NC}"
-else
-    echo -e "${RED}❌ Database is not accessible${NC}"
-    exit 1
-fi
-
 # Clean up old images
 echo -e "${YELLOW}🧹 Cleaning up old Docker images...${NC}"
 docker image prune -f
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Exchange Calendar
+Offline trading sessions, holidays and time zones for the exchanges our
+tickers trade on - no API calls, holidays are computed from their rules
+
+Used by the StockPriceUpdater to only fetch instruments whose market has
+traded since their last Price_Update, and to derive Market_Status.
+
+Exchange resolution (resolve_exchange):
+1. Ticker suffix ('SAP.DE' -> XETR, 'VOD.L' -> XLON)
+2. Exchange name from companies.exchange / extra_data.Exchange ('NASDAQ' -> XNYS)
+3. Default XNYS (Alpha Vantage quotes plain tickers as US listings)
+
+Full holiday rules exist for XNYS, XETR/XFRA, XLON, XPAR, XSWX and XTSE.
+Asian/Pacific exchanges use weekday sessions only (lunar holidays are not
+modelled), so on their holidays a fetch may still happen. Early closes
+(e.g. NYSE on Christmas Eve) are treated as full sessions.
+"""
+
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+DEFAULT_EXCHANGE = 'XNYS'
+
+# Older Price_Update values than this are always refreshed
+MAX_LOOKBACK_DAYS = 10
+
+MARKET_OPEN = '🟢 Open'
+MARKET_CLOSED = '🔴 Closed'
+
+
+# ---------------------------------------------------------------------------
+# Holiday rules
+# ---------------------------------------------------------------------------
+
+def easter_sunday(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """n-th weekday (Mon=0) of a month; n=-1 for the last one"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def us_observed(day):
+    """NYSE: Saturday holidays move to Friday, Sunday holidays to Monday"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def next_weekday(day):
+    """UK/Canada: weekend holidays move to the following Monday"""
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def xnys_holidays(year):
+    easter = easter_sunday(year)
+    holidays = {
+        nth_weekday(year, 1, 0, 3),      # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),      # Presidents' Day
+        easter - timedelta(days=2),      # Good Friday
+        nth_weekday(year, 5, 0, -1),     # Memorial Day
+        us_observed(date(year, 7, 4)),   # Independence Day
+        nth_weekday(year, 9, 0, 1),      # Labor Day
+        nth_weekday(year, 11, 3, 4),     # Thanksgiving
+        us_observed(date(year, 12, 25)),  # Christmas
+    }
+    # New Year's Day on a Saturday is not observed on the Friday before
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(us_observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(us_observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def xetr_holidays(year):
+    easter = easter_sunday(year)
+    return {
+        date(year, 1, 1),
+        easter - timedelta(days=2),      # Karfreitag
+        easter + timedelta(days=1),      # Ostermontag
+        date(year, 5, 1),                # Tag der Arbeit
+        date(year, 12, 24),
+        date(year, 12, 25),
+        date(year, 12, 26),
+        date(year, 12, 31),
+    }
+
+
+def xlon_holidays(year):
+    easter = easter_sunday(year)
+    christmas = next_weekday(date(year, 12, 25))
+    return {
+        next_weekday(date(year, 1, 1)),
+        easter - timedelta(days=2),      # Good Friday
+        easter + timedelta(days=1),      # Easter Monday
+        nth_weekday(year, 5, 0, 1),      # Early May bank holiday
+        nth_weekday(year, 5, 0, -1),     # Spring bank holiday
+        nth_weekday(year, 8, 0, -1),     # Summer bank holiday
+        christmas,
+        next_weekday(christmas + timedelta(days=1)),  # Boxing Day
+    }
+
+
+def euronext_holidays(year):
+    easter = easter_sunday(year)
+    return {
+        date(year, 1, 1),
+        easter - timedelta(days=2),
+        easter + timedelta(days=1),
+        date(year, 5, 1),
+        date(year, 12, 25),
+        date(year, 12, 26),
+    }
+
+
+def xswx_holidays(year):
+    easter = easter_sunday(year)
+    return {
+        date(year, 1, 1),
+        date(year, 1, 2),                # Berchtoldstag
+        easter - timedelta(days=2),
+        easter + timedelta(days=1),
+        easter + timedelta(days=39),     # Auffahrt
+        easter + timedelta(days=50),     # Pfingstmontag
+        date(year, 5, 1),
+        date(year, 8, 1),                # Bundesfeier
+        date(year, 12, 24),
+        date(year, 12, 25),
+        date(year, 12, 26),
+        date(year, 12, 31),
+    }
+
+
+def xtse_holidays(year):
+    easter = easter_sunday(year)
+    christmas = next_weekday(date(year, 12, 25))
+    victoria_day = date(year, 5, 24) - timedelta(days=date(year, 5, 24).weekday())
+    return {
+        next_weekday(date(year, 1, 1)),
+        nth_weekday(year, 2, 0, 3),      # Family Day
+        easter - timedelta(days=2),
+        victoria_day,                    # Monday before May 25
+        next_weekday(date(year, 7, 1)),  # Canada Day
+        nth_weekday(year, 8, 0, 1),      # Civic Holiday
+        nth_weekday(year, 9, 0, 1),      # Labour Day
+        nth_weekday(year, 10, 0, 2),     # Thanksgiving
+        christmas,
+        next_weekday(christmas + timedelta(days=1)),  # Boxing Day
+    }
+
+
+def no_holidays(year):
+    return set()
+
+
+# ---------------------------------------------------------------------------
+# Exchanges
+# ---------------------------------------------------------------------------
+
+# code: (name, time zone, open, close, holiday rule)
+EXCHANGES = {
+    'XNYS': ('NYSE / Nasdaq', 'America/New_York', time(9, 30), time(16, 0), xnys_holidays),
+    'XETR': ('Xetra', 'Europe/Berlin', time(9, 0), time(17, 30), xetr_holidays),
+    'XFRA': ('Börse Frankfurt', 'Europe/Berlin', time(8, 0), time(22, 0), xetr_holidays),
+    'XLON': ('London Stock Exchange', 'Europe/London', time(8, 0), time(16, 30), xlon_holidays),
+    'XPAR': ('Euronext', 'Europe/Paris', time(9, 0), time(17, 30), euronext_holidays),
+    'XSWX': ('SIX Swiss Exchange', 'Europe/Zurich', time(9, 0), time(17, 30), xswx_holidays),
+    'XTSE': ('Toronto Stock Exchange', 'America/Toronto', time(9, 30), time(16, 0), xtse_holidays),
+    'XASX': ('ASX', 'Australia/Sydney', time(10, 0), time(16, 0), no_holidays),
+    'XTKS': ('Tokyo Stock Exchange', 'Asia/Tokyo', time(9, 0), time(15, 30), no_holidays),
+    'XHKG': ('Hong Kong Stock Exchange', 'Asia/Hong_Kong', time(9, 30), time(16, 0), no_holidays),
+}
+
+TICKER_SUFFIXES = {
+    'DE': 'XETR', 'F': 'XFRA', 'SG': 'XFRA', 'MU': 'XFRA', 'BE': 'XFRA', 'HM': 'XFRA', 'DU': 'XFRA',
+    'L': 'XLON', 'IL': 'XLON',
+    'PA': 'XPAR', 'AS': 'XPAR', 'BR': 'XPAR', 'LS': 'XPAR', 'MI': 'XPAR',
+    'SW': 'XSWX', 'VX': 'XSWX',
+    'TO': 'XTSE', 'V': 'XTSE', 'CN': 'XTSE',
+    'AX': 'XASX',
+    'T': 'XTKS',
+    'HK': 'XHKG',
+    'US': 'XNYS',
+}
+
+EXCHANGE_ALIASES = {
+    'NYSE': 'XNYS', 'NASDAQ': 'XNYS', 'AMEX': 'XNYS', 'NYSE ARCA': 'XNYS', 'NYSE AMERICAN': 'XNYS',
+    'BATS': 'XNYS', 'OTC': 'XNYS', 'US': 'XNYS', 'USA': 'XNYS',
+    'XETRA': 'XETR', 'GER': 'XETR', 'XETR': 'XETR',
+    'FRANKFURT': 'XFRA', 'FRA': 'XFRA', 'FSE': 'XFRA', 'STUTTGART': 'XFRA', 'TRADEGATE': 'XFRA',
+    'MUNICH': 'XFRA', 'MÜNCHEN': 'XFRA', 'BERLIN': 'XFRA', 'HAMBURG': 'XFRA', 'DÜSSELDORF': 'XFRA',
+    'LSE': 'XLON', 'LON': 'XLON', 'LONDON': 'XLON',
+    'EURONEXT': 'XPAR', 'PARIS': 'XPAR', 'AMSTERDAM': 'XPAR', 'BRUSSELS': 'XPAR', 'EPA': 'XPAR',
+    'SIX': 'XSWX', 'SWX': 'XSWX', 'ZURICH': 'XSWX',
+    'TSX': 'XTSE', 'TSXV': 'XTSE', 'TORONTO': 'XTSE',
+    'ASX': 'XASX', 'TSE': 'XTKS', 'TOKYO': 'XTKS', 'HKEX': 'XHKG', 'HKG': 'XHKG',
+}
+
+
+class ExchangeCalendar:
+    def __init__(self, code):
+        self.code = code
+        self.name, tz_name, self.open_time, self.close_time, self.holiday_rule = EXCHANGES[code]
+        self.tz = ZoneInfo(tz_name)
+
+    @lru_cache(maxsize=None)
+    def holidays(self, year):
+        return frozenset(self.holiday_rule(year))
+
+    def is_session(self, day):
+        """Whether the exchange trades on this local date"""
+        return day.weekday() < 5 and day not in self.holidays(day.year)
+
+    def session_bounds(self, day):
+        """(open, close) of a local trading date as aware UTC datetimes"""
+        open_at = datetime.combine(day, self.open_time, tzinfo=self.tz)
+        close_at = datetime.combine(day, self.close_time, tzinfo=self.tz)
+        return open_at.astimezone(timezone.utc), close_at.astimezone(timezone.utc)
+
+    def is_open(self, now):
+        day = now.astimezone(self.tz).date()
+        if not self.is_session(day):
+            return False
+        open_at, close_at = self.session_bounds(day)
+        return open_at <= now < close_at
+
+    def has_traded_since(self, since, now):
+        """Whether any part of a session lies between since and now"""
+        if since is None or now - since > timedelta(days=MAX_LOOKBACK_DAYS):
+            return True
+
+        day = since.astimezone(self.tz).date()
+        last_day = now.astimezone(self.tz).date()
+        while day <= last_day:
+            if self.is_session(day):
+                open_at, close_at = self.session_bounds(day)
+                if open_at < now and close_at > since:
+                    return True
+            day += timedelta(days=1)
+        return False
+
+    def next_open(self, now):
+        """Start of the next session after now (now itself if the market is open)"""
+        if self.is_open(now):
+            return now
+
+        day = now.astimezone(self.tz).date()
+        for _ in range(MAX_LOOKBACK_DAYS + 7):
+            if self.is_session(day):
+                open_at, _ = self.session_bounds(day)
+                if open_at > now:
+                    return open_at
+            day += timedelta(days=1)
+        return now + timedelta(days=1)
+
+    def market_status(self, now):
+        return MARKET_OPEN if self.is_open(now) else MARKET_CLOSED
+
+
+@lru_cache(maxsize=None)
+def get_calendar(code):
+    return ExchangeCalendar(code if code in EXCHANGES else DEFAULT_EXCHANGE)
+
+
+def resolve_exchange(ticker=None, exchange=None):
+    """Exchange code for a ticker (suffix wins) or an exchange name"""
+    if ticker and '.' in str(ticker):
+        suffix = str(ticker).strip().upper().rsplit('.', 1)[1]
+        if suffix in TICKER_SUFFIXES:
+            return TICKER_SUFFIXES[suffix]
+
+    if exchange:
+        name = str(exchange).strip().upper()
+        if name in EXCHANGES:
+            return name
+        if name in EXCHANGE_ALIASES:
+            return EXCHANGE_ALIASES[name]
+        # 'NASDAQ Global Select', 'XETRA (Frankfurt)'
+        for word in re.split(r'[^A-ZÄÖÜ]+', name):
+            if word in EXCHANGE_ALIASES:
+                return EXCHANGE_ALIASES[word]
+
+    return DEFAULT_EXCHANGE
+
+
+def calendar_for(ticker=None, exchange=None):
+    return get_calendar(resolve_exchange(ticker, exchange))
+
+
+def parse_timestamp(value):
+    """Parse a stored timestamp; naive values are UTC (container time)"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
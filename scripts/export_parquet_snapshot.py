@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Parquet Snapshot Exporter
+Writes companies and stock_prices to columnar Parquet files for local analytics
+
+Layout (SNAPSHOT_DIR, default ./data/snapshots):
+    companies/companies.parquet                       extra_data flattened into typed extra__* columns
+    stock_prices/year=2026/month=02/data.parquet      one file per month (hive partitioning)
+    _state.json                                       watermarks of the last export
+
+Incremental by default:
+- companies: only rows with updated_at after (watermark - overlap) are
+  re-read and merged into the existing file by id; deleted companies are dropped
+- stock_prices: month partitions from (watermark - overlap) onwards are
+  rewritten, so late upserts into recent months are picked up. Older
+  backfills need --full (weekly via cron)
+
+Read with e.g.:
+    pq.read_table('data/snapshots/companies/companies.parquet', memory_map=True)
+    pd.read_parquet('data/snapshots/stock_prices', filters=[('year', '=', 2026)])
+
+Runs after each Excel sync via cron
+"""
+
+import os
+import re
+import sys
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from pg_connection import get_connection
+from job_profiler import JobProfiler
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    print("❌ pyarrow not installed. Installing...")
+    os.system(f"{sys.executable} -m pip install pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), '../data/snapshots')
+
+# Recent months are rewritten from (watermark - overlap) to catch late upserts
+PRICE_OVERLAP = timedelta(days=7)
+
+# updated_at is set by a trigger at statement time, so a transaction that commits
+# after an export can carry an updated_at below that export's watermark. Rows
+# are merged by id, so re-reading this window again is harmless.
+COMPANY_OVERLAP = timedelta(minutes=15)
+
+COMPANY_COLUMNS = [
+    'id', 'name', 'satellog', 'symbol', 'wkn', 'isin', 'sector', 'industry', 'country',
+    'exchange', 'currency', 'current_price', 'price_change_percent', 'price_update',
+    'market_status', 'day_high', 'day_low', 'volume', 'market_cap', 'last_synced_at',
+    'created_at', 'updated_at',
+]
+
+NUMERIC_COLUMNS = ['current_price', 'price_change_percent', 'day_high', 'day_low']
+INTEGER_COLUMNS = ['volume', 'market_cap']
+
+EXTRA_PREFIX = 'extra__'
+
+INVALID_COLUMN_CHARS = re.compile(r'[^0-9a-zA-Z_]+')
+
+
+def extra_column_name(key):
+    """Column name for an extra_data key ('Purchase_$' -> 'extra__Purchase')"""
+    return EXTRA_PREFIX + INVALID_COLUMN_CHARS.sub('_', str(key)).strip('_')
+
+
+def flatten_companies(rows):
+    """Company rows (with extra_data dict) -> DataFrame with one column per extra_data key"""
+    base = pd.DataFrame([{col: row.get(col) for col in COMPANY_COLUMNS} for row in rows], columns=COMPANY_COLUMNS)
+
+    for col in NUMERIC_COLUMNS:
+        base[col] = pd.to_numeric(base[col], errors='coerce').astype('float64')
+    for col in INTEGER_COLUMNS:
+        base[col] = pd.to_numeric(base[col], errors='coerce').astype('Int64')
+
+    extra_rows = []
+    for row in rows:
+        flat = {}
+        for key, value in (row.get('extra_data') or {}).items():
+            # Keys that collapse to the same column name keep the first value
+            flat.setdefault(extra_column_name(key), value)
+        extra_rows.append(flat)
+
+    extra = pd.DataFrame(extra_rows, index=base.index)
+    return pd.concat([base, extra], axis=1)
+
+
+def type_extra_columns(df):
+    """Give extra_data columns real types: numeric where every value parses, otherwise string"""
+    for col in df.columns:
+        if not col.startswith(EXTRA_PREFIX):
+            continue
+
+        values = df[col]
+        non_null = values.dropna()
+        if non_null.empty:
+            df[col] = values.astype('string')
+            continue
+
+        numeric = pd.to_numeric(non_null.astype(str).str.replace(',', '', regex=False), errors='coerce')
+        if numeric.notna().all():
+            df[col] = pd.to_numeric(values.astype('string').str.replace(',', '', regex=False), errors='coerce')
+        else:
+            df[col] = values.astype('string')
+
+    return df
+
+
+def write_parquet_atomic(df, path):
+    """Write a DataFrame to Parquet via a temp file so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+
+
+class ParquetSnapshotExporter:
+    def __init__(self, snapshot_dir=None, full=False, profile=None):
+        self.snapshot_dir = os.path.abspath(snapshot_dir or os.getenv('SNAPSHOT_DIR') or DEFAULT_SNAPSHOT_DIR)
+        self.state_path = os.path.join(self.snapshot_dir, '_state.json')
+        self.companies_path = os.path.join(self.snapshot_dir, 'companies', 'companies.parquet')
+        self.prices_dir = os.path.join(self.snapshot_dir, 'stock_prices')
+        self.full = full
+        self.conn = get_connection()
+        # One snapshot for the whole export: watermark, rows and ids agree
+        self.conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        self.profiler = JobProfiler('export_parquet_snapshot', enabled=profile)
+
+        # Stats
+        self.stats = {
+            'start_time': None,
+            'end_time': None,
+            'companies_changed': 0,
+            'companies_total': 0,
+            'extra_columns': 0,
+            'price_rows': 0,
+            'price_partitions': 0,
+            'success': False,
+            'error_message': None
+        }
+
+    def load_state(self):
+        """Load watermarks of the previous export"""
+        if self.full or not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def save_state(self, state):
+        """Persist watermarks after a successful export"""
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def export_companies(self, watermark):
+        """Merge companies changed since watermark into the companies snapshot"""
+        print("\n🏢 Exporting companies...")
+
+        incremental = watermark and os.path.exists(self.companies_path)
+        columns = ', '.join(COMPANY_COLUMNS)
+
+        with self.conn.cursor() as cur:
+            # Same REPEATABLE READ snapshot as the rows below; rows still uncommitted
+            # here may get an older updated_at, which COMPANY_OVERLAP re-reads next time
+            cur.execute("SELECT MAX(updated_at) FROM companies")
+            max_updated_at = cur.fetchone()[0]
+            new_watermark = max_updated_at.isoformat() if max_updated_at else watermark
+
+            if incremental:
+                cur.execute(
+                    f"SELECT {columns}, extra_data FROM companies WHERE updated_at > %s::timestamptz - %s",
+                    (watermark, COMPANY_OVERLAP)
+                )
+            else:
+                cur.execute(f"SELECT {columns}, extra_data FROM companies")
+            names = [desc[0] for desc in cur.description]
+            rows = [dict(zip(names, row)) for row in cur.fetchall()]
+
+            cur.execute("SELECT id::text FROM companies")
+            all_ids = {row[0] for row in cur.fetchall()}
+
+        for row in rows:
+            row['id'] = str(row['id'])
+
+        self.stats['companies_changed'] = len(rows)
+        print(f"   ✅ Read {len(rows)} {'changed ' if incremental else ''}companies")
+
+        if incremental and not rows:
+            existing = pq.read_table(self.companies_path, columns=['id']).to_pandas()
+            if set(existing['id']) == all_ids:
+                self.stats['companies_total'] = len(existing)
+                print("   ⏭️  Companies snapshot already up to date")
+                return new_watermark
+
+        changed = flatten_companies(rows)
+
+        if incremental:
+            previous = pd.read_parquet(self.companies_path)
+            previous = previous[previous['id'].isin(all_ids) & ~previous['id'].isin(changed['id'])]
+            df = pd.concat([previous, changed], ignore_index=True, sort=False)
+        else:
+            df = changed
+
+        df = type_extra_columns(df)
+        write_parquet_atomic(df, self.companies_path)
+
+        self.stats['companies_total'] = len(df)
+        self.stats['extra_columns'] = sum(col.startswith(EXTRA_PREFIX) for col in df.columns)
+        print(f"   ✅ Wrote {len(df)} companies ({self.stats['extra_columns']} extra_data columns)")
+
+        return new_watermark
+
+    def export_stock_prices(self, watermark):
+        """Rewrite month partitions from the watermark (minus overlap) onwards"""
+        print("\n💹 Exporting stock prices...")
+
+        since = None
+        if watermark:
+            start = datetime.fromisoformat(watermark) - PRICE_OVERLAP
+            since = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        with self.conn.cursor() as cur:
+            query = """
+                SELECT company_id::text AS company_id, "timestamp", open, high, low, close, volume, adjusted_close
+                FROM stock_prices
+            """
+            if since:
+                cur.execute(query + ' WHERE "timestamp" >= %s ORDER BY "timestamp"', (since,))
+            else:
+                cur.execute(query + ' ORDER BY "timestamp"')
+            names = [desc[0] for desc in cur.description]
+            df = pd.DataFrame(cur.fetchall(), columns=names)
+
+        self.stats['price_rows'] = len(df)
+        if df.empty:
+            print("   ⏭️  No new price rows")
+            return watermark
+
+        df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
+        for col in ('open', 'high', 'low', 'close', 'adjusted_close'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        df['volume'] = pd.to_numeric(df['volume'], errors='coerce').astype('Int64')
+
+        for (year, month), part in df.groupby([df['timestamp'].dt.year, df['timestamp'].dt.month]):
+            path = os.path.join(self.prices_dir, f"year={year}", f"month={month:02d}", 'data.parquet')
+            write_parquet_atomic(part.reset_index(drop=True), path)
+            self.stats['price_partitions'] += 1
+
+        print(f"   ✅ Wrote {len(df)} rows into {self.stats['price_partitions']} month partitions")
+
+        return df['timestamp'].max().isoformat()
+
+    def run(self):
+        """Run the export"""
+        self.stats['start_time'] = datetime.now()
+        print("=" * 60)
+        print("🗄️  PARQUET SNAPSHOT EXPORT")
+        print("=" * 60)
+        print(f"Started at: {self.stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Target: {self.snapshot_dir}")
+        print(f"Mode: {'FULL' if self.full else 'INCREMENTAL'}")
+
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            state = self.load_state()
+
+            with self.profiler.stage('export_companies'):
+                state['companies_updated_at'] = self.export_companies(state.get('companies_updated_at'))
+            with self.profiler.stage('export_stock_prices'):
+                state['stock_prices_timestamp'] = self.export_stock_prices(state.get('stock_prices_timestamp'))
+            state['exported_at'] = datetime.now().isoformat()
+
+            self.save_state(state)
+
+            self.stats['success'] = True
+            print("\n" + "=" * 60)
+            print("✅ EXPORT COMPLETED")
+
+        except Exception as e:
+            print(f"\n❌ EXPORT FAILED: {e}")
+            self.stats['success'] = False
+            self.stats['error_message'] = str(e)
+
+        finally:
+            self.stats['end_time'] = datetime.now()
+            duration = (self.stats['end_time'] - self.stats['start_time']).total_seconds()
+            self.conn.close()
+
+            print("=" * 60)
+            print("📊 EXPORT STATISTICS")
+            print("=" * 60)
+            print(f"Duration: {duration:.1f}s")
+            print(f"Companies Changed: {self.stats['companies_changed']}")
+            print(f"Companies Total: {self.stats['companies_total']}")
+            print(f"Extra Data Columns: {self.stats['extra_columns']}")
+            print(f"Price Rows: {self.stats['price_rows']}")
+            print(f"Price Partitions: {self.stats['price_partitions']}")
+            print(f"Status: {'✅ SUCCESS' if self.stats['success'] else '❌ FAILED'}")
+            if self.stats['error_message']:
+                print(f"Error: {self.stats['error_message']}")
+            print("=" * 60)
+
+            self.profiler.write_reports()
+
+        return self.stats['success']
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export companies and stock prices to Parquet')
+    parser.add_argument('--full', action='store_true', help='Ignore watermarks and rewrite everything')
+    parser.add_argument('--output', help='Snapshot directory (default: $SNAPSHOT_DIR or data/snapshots)')
+    parser.add_argument('--profile', action='store_true', help='Write per-stage CPU/memory profiles (see job_profiler.py)')
+    args = parser.parse_args()
+
+    exporter = ParquetSnapshotExporter(snapshot_dir=args.output, full=args.full, profile=args.profile or None)
+    success = exporter.run()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP Client
+One requests layer for all Python jobs (Dropbox download, Alpha Vantage, ...)
+
+- Keep-alive: one pooled requests.Session per host, so repeated calls reuse
+  the TLS connection instead of paying a new handshake each time
+- Retries: connection errors, timeouts, 429 and 5xx are retried a bounded
+  number of times with full-jitter exponential backoff (Retry-After honored).
+  POST and PATCH are only retried when the caller passes idempotent=True
+- Retry budget: retries are paid from a process-wide token bucket that
+  refills with a fraction of the requests made, so a broken upstream can
+  never multiply the load by max_attempts
+- Circuit breaker (per host): after consecutive failures the host is skipped
+  for a cooldown; then one trial request decides whether to close it again
+- Metrics (per host): requests, errors, retries, latency p50/p95/max
+
+Usage:
+    from http_client import get_client, CircuitOpenError
+
+    response = get_client().get(url, params=params, timeout=10)
+    get_client().print_metrics()
+"""
+
+import time
+import random
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+RETRY_AFTER_MAX = 30.0
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Methods safe to send twice; anything else needs idempotent=True to be retried
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Retries allowed per request made (10%), plus a small reserve for cold starts
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_MIN = 10
+
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 60.0
+
+POOL_SIZE = 10
+LATENCY_SAMPLES = 1000
+
+USER_AGENT = 'blackfire-service/1.0'
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without touching the network while a host's circuit is open"""
+
+
+class RetryBudget:
+    """Process-wide token bucket: every request deposits RATIO tokens, every retry costs one"""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.maximum = minimum * 2
+        self.tokens = float(minimum)
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """Take one retry token; False if the budget is exhausted"""
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open after cooldown -> closed on success"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """Whether a request may go out now (only one trial while half-open)"""
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Give up a half-open trial that ended without a verdict (e.g. invalid request)"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """Returns True if this failure tripped (or re-tripped) the breaker"""
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class HostMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.short_circuited = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.max_latency = 0.0
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+        self.max_latency = max(self.max_latency, seconds)
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class HttpClient:
+    def __init__(self, max_attempts=MAX_ATTEMPTS, retry_budget=None):
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget or RetryBudget()
+        self.sessions = {}
+        self.breakers = {}
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _host_state(self, host):
+        """Session, breaker and metrics of a host (created on first use)"""
+        with self.lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['User-Agent'] = USER_AGENT
+                self.sessions[host] = session
+                self.breakers[host] = CircuitBreaker()
+                self.metrics[host] = HostMetrics()
+            return self.sessions[host], self.breakers[host], self.metrics[host]
+
+    def backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, or the server's Retry-After if given"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), RETRY_AFTER_MAX)
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        """
+        Send a request with pooling, retries, retry budget and circuit breaker
+
+        Args:
+            idempotent: whether the request may be sent more than once
+                        (default: by method, so POST/PATCH are never retried)
+
+        Returns the final response (which may still be a 4xx/5xx).
+        Raises CircuitOpenError while the host is tripped, and the last
+        requests exception if every attempt failed at the transport level.
+        """
+        host = urlsplit(url).netloc
+        session, breaker, metrics = self._host_state(host)
+
+        if not breaker.allow():
+            metrics.short_circuited += 1
+            raise CircuitOpenError(f"Circuit open for {host} (cooling down after repeated failures)")
+
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        max_attempts = self.max_attempts if idempotent else 1
+
+        kwargs.setdefault('timeout', 30)
+        self.retry_budget.deposit()
+
+        settled = False
+        try:
+            attempt = 0
+            while True:
+                response = None
+                error = None
+                started = time.monotonic()
+                try:
+                    response = session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                except requests.RequestException as e:
+                    # Broken response (bad encoding, redirect loop, ...): a host failure, but not worth a retry.
+                    # Invalid requests (bad URL/header, ValueError subclasses) say nothing about the host
+                    metrics.errors += 1
+                    if not isinstance(e, ValueError):
+                        settled = True
+                        breaker.record_failure()
+                    raise
+                finally:
+                    metrics.requests += 1
+                    metrics.record(time.monotonic() - started)
+
+                retryable = error is not None or response.status_code in RETRY_STATUS
+                if not retryable:
+                    settled = True
+                    breaker.record_success()
+                    return response
+
+                metrics.errors += 1
+                attempt += 1
+                if attempt >= max_attempts or not self.retry_budget.withdraw():
+                    settled = True
+                    if breaker.record_failure():
+                        print(f"   ⚡ Circuit opened for {host} ({breaker.failures} consecutive failures)")
+                    if error is not None:
+                        raise error
+                    return response
+
+                metrics.retries += 1
+                time.sleep(self.backoff(attempt, response))
+        finally:
+            # Anything else (invalid URL, bad arguments, interrupt) must not leave a half-open trial stuck
+            if not settled:
+                breaker.release_trial()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, idempotent=False, **kwargs):
+        return self.request('POST', url, idempotent=idempotent, **kwargs)
+
+    def print_metrics(self):
+        """Per-host request/latency summary for the job statistics block"""
+        if not self.metrics:
+            return
+
+        print("HTTP:")
+        for host, m in sorted(self.metrics.items()):
+            print(f"   {host}: {m.requests} requests, {m.retries} retries, {m.errors} errors, "
+                  f"{m.short_circuited} short-circuited, circuit {self.breakers[host].state}")
+            print(f"      latency p50 {m.percentile(0.5) * 1000:.0f}ms, "
+                  f"p95 {m.percentile(0.95) * 1000:.0f}ms, max {m.max_latency * 1000:.0f}ms")
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client (shared sessions, budget and breakers)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Job Profiler
+Opt-in per-stage CPU and memory profiling for the cron jobs
+
+Enabled with --profile on a job (or PROFILE_JOBS=1 in the environment, so a
+production container can be profiled without touching the crontab). Each
+stage wrapped in profiler.stage('name') gets:
+
+    NN-<stage>.collapsed   sampled call stacks in collapsed format
+                           (flamegraph.pl / speedscope / inferno)
+    NN-<stage>.pstats      cProfile data (snakeviz, python -m pstats)
+    NN-<stage>.txt         top functions by cumulative time and top
+                           allocations (tracemalloc diff) with peak memory
+
+plus summary.txt, in <PROFILE_DIR>/<job>-<timestamp>-<pid>/. PROFILE_DIR
+defaults to /var/log/blackfire/profiles next to the cron log.
+
+Stages that run repeatedly (e.g. per worker batch) accumulate into the same
+files. Nested stages are folded into the outer one.
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import contextlib
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+CRON_LOG_DIR = '/var/log/blackfire'
+
+SAMPLE_INTERVAL = 0.005  # 5ms
+TRACEMALLOC_FRAMES = 10
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 25
+
+# Keep the profiler's own bookkeeping out of the allocation reports
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+def default_profile_dir():
+    """PROFILE_DIR, else next to the cron log, else ./logs/profiles"""
+    if os.getenv('PROFILE_DIR'):
+        return os.getenv('PROFILE_DIR')
+    if os.path.isdir(CRON_LOG_DIR):
+        return os.path.join(CRON_LOG_DIR, 'profiles')
+    return os.path.join(os.path.dirname(__file__), '../logs/profiles')
+
+
+def profiling_requested():
+    """Whether PROFILE_JOBS turns profiling on for every job"""
+    return os.getenv('PROFILE_JOBS', '').lower() in ('1', 'true', 'yes')
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id, counts, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.counts = counts
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.counts[';'.join(reversed(stack))] += 1
+
+
+class StageProfile:
+    """Accumulated measurements of one stage"""
+
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.samples = Counter()
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.peak_memory = 0
+        self.first_snapshot = None
+        self.last_snapshot = None
+
+    @property
+    def file_prefix(self):
+        safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in self.name)
+        return f"{self.index:02d}-{safe_name}"
+
+
+class JobProfiler:
+    def __init__(self, job_name, enabled=None, output_dir=None):
+        self.job_name = job_name
+        self.enabled = profiling_requested() if enabled is None else enabled
+        self.stages = {}
+        self._active = False
+        self.run_dir = None
+
+        if self.enabled:
+            started = datetime.now().strftime('%Y%m%d-%H%M%S')
+            self.run_dir = os.path.join(
+                os.path.abspath(output_dir or default_profile_dir()),
+                f"{job_name}-{started}-{os.getpid()}"
+            )
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            print(f"🔬 Profiling enabled → {self.run_dir}")
+
+    def stage(self, name):
+        """Context manager profiling one stage (no-op when profiling is off)"""
+        if not self.enabled or self._active:
+            return contextlib.nullcontext()
+        return self._profile_stage(name)
+
+    @contextlib.contextmanager
+    def _profile_stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageProfile(len(self.stages) + 1, name)
+
+        self._active = True
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        if stage.first_snapshot is None:
+            stage.first_snapshot = snapshot
+        tracemalloc.reset_peak()
+
+        sampler = StackSampler(threading.get_ident(), stage.samples)
+        sampler.start()
+        started = time.perf_counter()
+        stage.profile.enable()
+        try:
+            yield
+        finally:
+            stage.profile.disable()
+            stage.wall_seconds += time.perf_counter() - started
+            sampler.stop()
+
+            stage.calls += 1
+            stage.peak_memory = max(stage.peak_memory, tracemalloc.get_traced_memory()[1])
+            stage.last_snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            self._active = False
+
+    def write_reports(self):
+        """Write collapsed stacks, pstats and text reports for all stages so far"""
+        if not self.enabled or not self.stages:
+            return
+
+        try:
+            os.makedirs(self.run_dir, exist_ok=True)
+            summary = [
+                f"Job: {self.job_name}",
+                f"Written: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                "",
+                f"{'STAGE':<32} {'CALLS':>6} {'WALL':>10} {'PEAK MEM':>12}",
+            ]
+
+            for stage in self.stages.values():
+                self.write_stage(stage)
+                summary.append(
+                    f"{stage.name:<32} {stage.calls:>6} {stage.wall_seconds:>9.2f}s {format_bytes(stage.peak_memory):>12}"
+                )
+
+            with open(os.path.join(self.run_dir, 'summary.txt'), 'w') as f:
+                f.write('\n'.join(summary) + '\n')
+
+            print(f"🔬 Profiles written to {self.run_dir}")
+
+        except Exception as e:
+            # Profiling must never fail the job
+            print(f"⚠️  Failed to write profiles: {e}")
+
+    def write_stage(self, stage):
+        """Write the three report files of one stage"""
+        prefix = os.path.join(self.run_dir, stage.file_prefix)
+
+        with open(f"{prefix}.collapsed", 'w') as f:
+            for stack, count in stage.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        stage.profile.dump_stats(f"{prefix}.pstats")
+
+        report = io.StringIO()
+        report.write(f"Stage: {stage.name}\n")
+        report.write(f"Calls: {stage.calls}\n")
+        report.write(f"Wall time: {stage.wall_seconds:.2f}s\n")
+        report.write(f"Peak traced memory: {format_bytes(stage.peak_memory)}\n")
+        report.write(f"Stack samples: {sum(stage.samples.values())} (every {SAMPLE_INTERVAL * 1000:.0f}ms)\n")
+
+        report.write(f"\n--- Top {TOP_FUNCTIONS} functions by cumulative time ---\n")
+        stats = pstats.Stats(stage.profile, stream=report)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+        report.write(f"\n--- Top {TOP_ALLOCATIONS} allocation sites (net growth during stage) ---\n")
+        if stage.first_snapshot and stage.last_snapshot:
+            diff = stage.last_snapshot.compare_to(stage.first_snapshot, 'lineno')
+            for entry in diff[:TOP_ALLOCATIONS]:
+                report.write(f"{entry}\n")
+
+            report.write(f"\n--- Top {TOP_ALLOCATIONS} live allocations at end of stage (with traceback) ---\n")
+            for entry in stage.last_snapshot.statistics('traceback')[:TOP_ALLOCATIONS]:
+                report.write(f"{format_bytes(entry.size)} in {entry.count} blocks\n")
+                for line in entry.traceback.format(limit=5):
+                    report.write(f"    {line}\n")
+
+        with open(f"{prefix}.txt", 'w') as f:
+            f.write(report.getvalue())
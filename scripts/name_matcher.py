@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Company Name Matcher
+Fallback matching for Excel rows that don't hit an existing satellog/name
+
+1. Normalized key: case, punctuation, whitespace and umlauts folded
+   ("Müller AG." == "MUELLER  AG")
+2. Trigram inverted index (pg_trgm style) over the names without their
+   legal form, with bounded candidate sets: very common trigrams are
+   ignored and only the top candidates by shared trigrams are scored, so a
+   lookup never walks all companies
+
+A fuzzy match is only accepted if both names have the same tokens once the
+legal form is removed ("Siemens AG" == "Siemens"). Share classes and series
+are separate instruments, so "Berkshire Hathaway B" never matches
+"Berkshire Hathaway A" and "Samsung Electronics Pref" never matches
+"Samsung Electronics".
+
+Built once per sync run from the existing companies.
+"""
+
+import re
+import unicodedata
+
+DEFAULT_THRESHOLD = 0.8
+
+# Trigrams shared by more companies than this carry no signal ("ag ", " in")
+MAX_POSTING_SIZE = 200
+
+# Candidates scored per lookup
+MAX_CANDIDATES = 20
+
+# Best match must beat the runner-up by this much, otherwise it's ambiguous
+MIN_MARGIN = 0.05
+
+UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+# Legal-form tokens dropped before fuzzy comparison (normalized, lower case)
+LEGAL_FORMS = {
+    'ag', 'se', 'kgaa', 'gmbh', 'inc', 'incorporated', 'corp', 'corporation', 'co', 'company',
+    'ltd', 'limited', 'plc', 'llc', 'lp', 'nv', 'bv', 'sa', 'spa', 'sas', 'ab', 'asa', 'oyj',
+    'aktiengesellschaft',
+}
+
+# Tokens that distinguish share classes/series - never dropped, a difference here is a different instrument
+SHARE_CLASS_TOKEN = re.compile(r'^([a-z]|\d+|class|series|pref|prefs|preferred|vz|vzo|st|stamm|adr|ads)$')
+
+
+def normalize_name(name):
+    """Fold a company name to a comparison key"""
+    if not name:
+        return ''
+
+    name = str(name).casefold().translate(UMLAUTS)
+
+    # Strip remaining accents (é -> e)
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+
+    return NON_ALNUM.sub(' ', name).strip()
+
+
+def core_tokens(key):
+    """Tokens of a normalized key without legal-form suffixes"""
+    return frozenset(token for token in key.split() if token not in LEGAL_FORMS)
+
+
+def same_instrument(key_a, key_b):
+    """Whether two normalized names only differ in legal form (and never in share class)"""
+    tokens_a, tokens_b = core_tokens(key_a), core_tokens(key_b)
+    if not tokens_a or tokens_a != tokens_b:
+        return False
+    # Equal sets already exclude share-class differences; stay explicit for dropped tokens
+    return not any(SHARE_CLASS_TOKEN.match(token) for token in set(key_a.split()) ^ set(key_b.split()))
+
+
+def trigrams(key):
+    """pg_trgm-style trigrams of a normalized key (each word padded)"""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """Jaccard similarity of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class NameMatcher:
+    def __init__(self, companies, threshold=DEFAULT_THRESHOLD):
+        """
+        Args:
+            companies: iterable of company dicts with at least 'name'
+            threshold: minimum trigram similarity for a fuzzy match
+        """
+        self.threshold = threshold
+        self.companies = []
+        self.keys = []
+        self.trigram_sets = []
+        self.by_key = {}
+        self.ambiguous_keys = set()
+        self.postings = {}
+
+        for company in companies:
+            key = normalize_name(company.get('name'))
+            if not key:
+                continue
+
+            idx = len(self.companies)
+            self.companies.append(company)
+            self.keys.append(key)
+
+            if key in self.by_key:
+                # Two companies normalize to the same key - never guess between them
+                self.ambiguous_keys.add(key)
+            else:
+                self.by_key[key] = idx
+
+            grams = trigrams(' '.join(sorted(core_tokens(key))))
+            self.trigram_sets.append(grams)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(idx)
+
+    def candidates(self, grams):
+        """Company indices sharing the most informative trigrams with the query"""
+        counts = {}
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if not posting or len(posting) > MAX_POSTING_SIZE:
+                continue
+            for idx in posting:
+                counts[idx] = counts.get(idx, 0) + 1
+
+        return sorted(counts, key=counts.get, reverse=True)[:MAX_CANDIDATES]
+
+    def match(self, name):
+        """
+        Find the existing company for a name
+
+        Returns: (company, score, method) or (None, 0.0, None)
+        """
+        key = normalize_name(name)
+        if not key or key in self.ambiguous_keys:
+            return (None, 0.0, None)
+
+        if key in self.by_key:
+            return (self.companies[self.by_key[key]], 1.0, 'normalized')
+
+        grams = trigrams(' '.join(sorted(core_tokens(key))))
+        scored = sorted(
+            ((similarity(grams, self.trigram_sets[idx]), idx) for idx in self.candidates(grams)),
+            reverse=True
+        )
+
+        if not scored or scored[0][0] < self.threshold:
+            return (None, 0.0, None)
+
+        best_score, best_idx = scored[0]
+        if len(scored) > 1 and best_score - scored[1][0] < MIN_MARGIN:
+            return (None, 0.0, None)
+
+        # Similar spelling is not enough: a different share class/series is another company row
+        if not same_instrument(key, self.keys[best_idx]):
+            return (None, 0.0, None)
+
+        return (self.companies[best_idx], best_score, 'trigram')
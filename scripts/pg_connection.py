@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+PostgreSQL Connection Helper
+
+Direct psycopg2 access for the jobs that need more than PostgREST offers
+(continuous aggregate refreshes, bulk writes, row locking).
+
+Uses DATABASE_URL (set for the cron container in docker-compose.prod.yml)
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env.production'))
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env.local'))
+
+try:
+    import psycopg2
+    import psycopg2.extras
+except ImportError:
+    print("❌ psycopg2 not installed. Installing...")
+    os.system(f"{sys.executable} -m pip install psycopg2-binary")
+    import psycopg2
+    import psycopg2.extras
+
+
+def has_database_url():
+    """Whether a direct PostgreSQL connection is configured"""
+    return bool(os.getenv('DATABASE_URL'))
+
+
+def get_connection(autocommit=False):
+    """Open a psycopg2 connection to DATABASE_URL"""
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        raise ValueError("Missing environment variable: DATABASE_URL")
+
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = autocommit
+    return conn
@@ -11,6 +11,13 @@ Priority order:
 5. WKN (from companies.wkn)
 6. ISIN (from companies.isin)
 
+Only companies with change events since the last run are checked
+(see change_events.py); the first run and --full scan every company.
+Companies whose update failed are retried on the next runs (capped, see
+change_event_retries). Companies without any symbol candidate are not
+looked at again until a symbol-relevant field changes (symbol_fields_changed
+event) or --full runs.
+
 Runs multiple times daily via cron
 """
 
@@ -30,8 +37,14 @@ except ImportError:
     os.system(f"{sys.executable} -m pip install supabase")
     from supabase import create_client, Client
 
+from change_events import ChangeEventConsumer, ChangeEventOutbox
+from company_registry import CompanyRegistry
+from job_profiler import JobProfiler
+
+CONSUMER_NAME = 'populate_symbols'
+
 class SymbolPopulationService:
-    def __init__(self):
+    def __init__(self, profile=None):
         self.supabase_url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 
@@ -39,14 +52,17 @@ class SymbolPopulationService:
             raise ValueError("Missing environment variables: NEXT_PUBLIC_SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
 
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        self.profiler = JobProfiler('populate_symbols', enabled=profile)
 
         # Statistics
         self.stats = {
             'start_time': datetime.now(),
+            'events': 0,
             'total_companies': 0,
             'missing_symbols': 0,
             'symbols_populated': 0,
             'skipped': 0,
+            'retries': 0,
             'errors': 0
         }
 
@@ -141,13 +157,25 @@ class SymbolPopulationService:
 
         return (None, None)
 
-    def populate_symbols(self, dry_run=False, limit=None):
+    def fetch_companies_without_symbol(self, limit=None, company_ids=None):
+        """Get companies without symbol, optionally restricted to company_ids"""
+        registry = CompanyRegistry.load(
+            self.supabase,
+            company_ids=company_ids,
+            symbol_missing=True,
+            with_extra_data=True,
+            limit=limit
+        )
+        return registry.records
+
+    def populate_symbols(self, dry_run=False, limit=None, full=False):
         """
         Populate symbols for companies missing them
 
         Args:
             dry_run: If True, only print what would be done
             limit: Maximum number of companies to process
+            full: If True, ignore change events and scan all companies
         """
         print("=" * 70)
         print("🔄 SYMBOL POPULATION SERVICE")
@@ -159,18 +187,35 @@ class SymbolPopulationService:
         print()
 
         try:
-            # Get companies without symbols
-            print("📊 Fetching companies without symbols...")
-
-            query = self.supabase.table('companies').select(
-                'id, name, symbol, wkn, isin, extra_data'
-            ).is_('symbol', None)
-
-            if limit:
-                query = query.limit(limit)
-
-            response = query.execute()
-            companies = response.data
+            consumer = ChangeEventConsumer(self.supabase, CONSUMER_NAME)
+            cursor = None if full else consumer.get_cursor()
+            retries = consumer.get_retries()
+
+            if cursor is None:
+                # First run or --full: remember the outbox position before scanning
+                last_event_id = ChangeEventOutbox(self.supabase).latest_event_id()
+
+                print("📊 Fetching companies without symbols (full scan)...")
+                with self.profiler.stage('fetch_companies'):
+                    companies = self.fetch_companies_without_symbol(limit)
+            else:
+                print(f"📨 Reading change events after #{cursor}...")
+                with self.profiler.stage('poll_events'):
+                    events = consumer.poll(cursor)
+                self.stats['events'] = len(events)
+
+                if not events and not retries:
+                    print("   ✅ No changes since last run")
+                    return
+
+                last_event_id = events[-1]['id'] if events else cursor
+                company_ids = list(dict.fromkeys([event['company_id'] for event in events] + list(retries)))
+                self.stats['retries'] = len(retries)
+                print(f"   ✅ {len(events)} events + {len(retries)} retries for {len(company_ids)} companies")
+
+                print("📊 Fetching changed companies without symbols...")
+                with self.profiler.stage('fetch_companies'):
+                    companies = self.fetch_companies_without_symbol(limit, company_ids)
 
             self.stats['total_companies'] = len(companies)
             self.stats['missing_symbols'] = len(companies)
@@ -180,39 +225,60 @@ class SymbolPopulationService:
 
             if len(companies) == 0:
                 print("✅ All companies already have symbols!")
+                if not dry_run:
+                    consumer.clear_retries(retries)
+                    consumer.ack(last_event_id)
                 return
 
             # Process each company
             print("🔍 Processing companies...")
             print()
 
-            for idx, company in enumerate(companies, 1):
-                company_id = company.get('id')
-                name = company.get('name', 'Unknown')
+            failed = {}
+            with self.profiler.stage('process_companies'):
+                for idx, company in enumerate(companies, 1):
+                    company_id = company.get('id')
+                    name = company.get('name', 'Unknown')
 
-                # Get symbol candidate
-                symbol, source = self.get_symbol_candidate(company)
+                    # Get symbol candidate
+                    symbol, source = self.get_symbol_candidate(company)
 
-                if symbol:
-                    if dry_run:
-                        print(f"   [{idx}/{len(companies)}] Would set '{name}' → {symbol} (from {source})")
-                        self.stats['symbols_populated'] += 1
+                    if symbol:
+                        if dry_run:
+                            print(f"   [{idx}/{len(companies)}] Would set '{name}' → {symbol} (from {source})")
+                            self.stats['symbols_populated'] += 1
+                        else:
+                            try:
+                                # Update database
+                                self.supabase.table('companies').update({
+                                    'symbol': symbol
+                                }).eq('id', company_id).execute()
+
+                                print(f"   ✅ [{idx}/{len(companies)}] {name} → {symbol} (from {source})")
+                                self.stats['symbols_populated'] += 1
+
+                            except Exception as e:
+                                print(f"   ❌ [{idx}/{len(companies)}] Error updating {name}: {e}")
+                                self.stats['errors'] += 1
+                                failed[company_id] = e
                     else:
-                        try:
-                            # Update database
-                            self.supabase.table('companies').update({
-                                'symbol': symbol
-                            }).eq('id', company_id).execute()
+                        print(f"   ⏭️  [{idx}/{len(companies)}] Skipped '{name}' (no symbol found)")
+                        self.stats['skipped'] += 1
 
-                            print(f"   ✅ [{idx}/{len(companies)}] {name} → {symbol} (from {source})")
-                            self.stats['symbols_populated'] += 1
+            # Move the cursor only if every changed company was handled
+            complete = not limit or len(companies) < limit
+
+            # Failed updates go to the retry table, so one bad row (e.g. a UNIQUE
+            # conflict on symbol) does not hold the cursor back
+            if not dry_run:
+                for company_id in consumer.record_failures(failed, retries):
+                    print(f"   ⚠️  Giving up on {company_id} until it changes again")
+                # Retries not returned by a complete fetch have a symbol by now
+                handled = set(retries) if complete else {company['id'] for company in companies}
+                consumer.clear_retries((handled & set(retries)) - set(failed))
 
-                        except Exception as e:
-                            print(f"   ❌ [{idx}/{len(companies)}] Error updating {name}: {e}")
-                            self.stats['errors'] += 1
-                else:
-                    print(f"   ⏭️  [{idx}/{len(companies)}] Skipped '{name}' (no symbol found)")
-                    self.stats['skipped'] += 1
+                if complete:
+                    consumer.ack(last_event_id)
 
             print()
             print("=" * 70)
@@ -227,6 +293,7 @@ class SymbolPopulationService:
 
         finally:
             self.print_stats()
+            self.profiler.write_reports()
 
     def print_stats(self):
         """Print statistics"""
@@ -237,6 +304,8 @@ class SymbolPopulationService:
         print("📊 STATISTICS")
         print("=" * 70)
         print(f"Duration: {duration:.1f}s")
+        print(f"Change Events: {self.stats['events']}")
+        print(f"Retried Companies: {self.stats['retries']}")
         print(f"Total Companies Checked: {self.stats['total_companies']}")
         print(f"Missing Symbols: {self.stats['missing_symbols']}")
         print(f"Symbols Populated: {self.stats['symbols_populated']}")
@@ -256,11 +325,13 @@ def main():
     parser = argparse.ArgumentParser(description='Populate symbol field from existing data')
     parser.add_argument('--dry-run', action='store_true', help='Dry run - do not update database')
     parser.add_argument('--limit', type=int, help='Maximum number of companies to process')
+    parser.add_argument('--full', action='store_true', help='Ignore change events and scan all companies')
+    parser.add_argument('--profile', action='store_true', help='Write per-stage CPU/memory profiles (see job_profiler.py)')
 
     args = parser.parse_args()
 
-    service = SymbolPopulationService()
-    service.populate_symbols(dry_run=args.dry_run, limit=args.limit)
+    service = SymbolPopulationService(profile=args.profile or None)
+    service.populate_symbols(dry_run=args.dry_run, limit=args.limit, full=args.full)
 
 if __name__ == '__main__':
     main()
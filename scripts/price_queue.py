@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Price Fetch Queue
+Postgres-backed work queue shared by several StockPriceUpdater workers
+
+- claim(): FOR UPDATE SKIP LOCKED, so concurrent workers never get the same row
+- leases: a claimed row is invisible until lease_expires_at (visibility timeout);
+  if a worker crashes, the row is picked up again after the lease expires
+- lease_token: complete()/fail()/extend_lease() only apply while the caller still owns
+  the lease; workers renew it with extend_lease() before each job of a batch
+
+Usage as a stress test against a local Postgres (see scripts/test-price-queue.sh):
+    python3 scripts/price_queue.py --stress --workers 4 --jobs 500
+"""
+
+import os
+import sys
+import time
+import random
+from datetime import datetime
+
+from pg_connection import get_connection
+
+QUEUE_TABLE = 'price_fetch_queue'
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_REFRESH_SECONDS = 55 * 60  # Picked up again by the next hourly run
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 6 * 60 * 60
+
+
+class PriceFetchQueue:
+    def __init__(self, conn=None, table=QUEUE_TABLE):
+        # Autocommit: every claim/complete is its own short transaction
+        self.conn = conn or get_connection(autocommit=True)
+        self.table = table
+
+    def enqueue_from_schedule(self):
+        """Add newly scheduled tickers and pick up ticker changes (removals cascade)"""
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO {self.table} (company_id, ticker)
+                SELECT company_id, ticker FROM price_update_schedule
+                ON CONFLICT (company_id) DO UPDATE
+                    SET ticker = EXCLUDED.ticker, run_after = NOW(), attempts = 0
+                    WHERE {self.table}.ticker IS DISTINCT FROM EXCLUDED.ticker
+            """)
+            return cur.rowcount
+
+    def claim(self, worker_id, batch_size, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Lease up to batch_size due jobs
+
+        Returns: list of dicts with company_id, ticker, attempts, lease_token
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                WITH due AS (
+                    SELECT company_id
+                    FROM {self.table}
+                    WHERE run_after <= NOW()
+                      AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                    ORDER BY run_after
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE {self.table} q
+                SET lease_token = gen_random_uuid(),
+                    leased_by = %s,
+                    lease_expires_at = NOW() + %s * INTERVAL '1 second',
+                    attempts = q.attempts + 1
+                FROM due
+                WHERE q.company_id = due.company_id
+                RETURNING q.company_id::text, q.ticker, q.attempts, q.lease_token::text
+            """, (batch_size, worker_id, lease_seconds))
+
+            return [
+                {'company_id': row[0], 'ticker': row[1], 'attempts': row[2], 'lease_token': row[3]}
+                for row in cur.fetchall()
+            ]
+
+    def complete(self, job, refresh_seconds=DEFAULT_REFRESH_SECONDS):
+        """Release a finished job and schedule its next refresh; False if the lease was lost"""
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {self.table}
+                SET lease_token = NULL, leased_by = NULL, lease_expires_at = NULL,
+                    attempts = 0, last_error = NULL, last_completed_at = NOW(),
+                    run_after = NOW() + %s * INTERVAL '1 second'
+                WHERE company_id = %s AND lease_token = %s
+            """, (refresh_seconds, job['company_id'], job['lease_token']))
+            return cur.rowcount == 1
+
+    def fail(self, job, error):
+        """Release a failed job with exponential backoff; False if the lease was lost"""
+        delay = min(RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1), RETRY_MAX_SECONDS)
+        return self.release(job, delay, error)
+
+    def release(self, job, delay_seconds=0, error=None):
+        """Give a job back without completing it (e.g. rate limit hit before fetching)"""
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {self.table}
+                SET lease_token = NULL, leased_by = NULL, lease_expires_at = NULL,
+                    last_error = COALESCE(%s, last_error),
+                    run_after = NOW() + %s * INTERVAL '1 second'
+                WHERE company_id = %s AND lease_token = %s
+            """, (error, delay_seconds, job['company_id'], job['lease_token']))
+            return cur.rowcount == 1
+
+    def extend_lease(self, job, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Keep a long-running job leased; False if the lease was lost"""
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {self.table}
+                SET lease_expires_at = NOW() + %s * INTERVAL '1 second'
+                WHERE company_id = %s AND lease_token = %s
+            """, (lease_seconds, job['company_id'], job['lease_token']))
+            return cur.rowcount == 1
+
+    def pending_count(self):
+        """Number of jobs that are due and not leased"""
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT COUNT(*) FROM {self.table}
+                WHERE run_after <= NOW()
+                  AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+            """)
+            return cur.fetchone()[0]
+
+
+def make_worker_id():
+    """Unique id per worker process (container hostname + pid)"""
+    return f"{os.getenv('HOSTNAME', 'local')}-{os.getpid()}"
+
+
+# ---------------------------------------------------------------------------
+# Stress test: several processes draining one queue against a local Postgres
+# ---------------------------------------------------------------------------
+
+STRESS_TABLE = 'price_fetch_queue_stress'
+STRESS_LOG_TABLE = 'price_fetch_queue_stress_log'
+
+
+def stress_setup(jobs):
+    """Create a scratch copy of the queue (without the schedule FK) and fill it"""
+    conn = get_connection(autocommit=True)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {STRESS_TABLE}, {STRESS_LOG_TABLE}")
+        cur.execute(f"CREATE TABLE {STRESS_TABLE} (LIKE {QUEUE_TABLE} INCLUDING DEFAULTS INCLUDING INDEXES)")
+        cur.execute(f"CREATE TABLE {STRESS_LOG_TABLE} (company_id UUID, worker TEXT, completed BOOLEAN)")
+        cur.execute(f"""
+            INSERT INTO {STRESS_TABLE} (company_id, ticker)
+            SELECT gen_random_uuid(), 'T' || n FROM generate_series(1, %s) AS n
+        """, (jobs,))
+    conn.close()
+
+
+def stress_worker(worker_index, lease_seconds, crash):
+    """Drain the scratch queue; a crashing worker abandons its first batch"""
+    queue = PriceFetchQueue(table=STRESS_TABLE)
+    worker_id = f"stress-{worker_index}-{os.getpid()}"
+
+    while True:
+        jobs = queue.claim(worker_id, batch_size=5, lease_seconds=lease_seconds)
+        if not jobs:
+            if queue.pending_count() == 0:
+                # Leased rows of a crashed worker become due again after their lease
+                with queue.conn.cursor() as cur:
+                    cur.execute(f"SELECT COUNT(*) FROM {STRESS_TABLE} WHERE run_after <= NOW()")
+                    if cur.fetchone()[0] == 0:
+                        break
+            time.sleep(0.2)
+            continue
+
+        if crash:
+            # Simulate a crash: leases are never released
+            with queue.conn.cursor() as cur:
+                for job in jobs:
+                    cur.execute(f"INSERT INTO {STRESS_LOG_TABLE} VALUES (%s, %s, false)",
+                                (job['company_id'], worker_id))
+            os._exit(1)
+
+        for job in jobs:
+            time.sleep(random.uniform(0.001, 0.01))  # "fetch"
+            if queue.complete(job, refresh_seconds=3600):
+                with queue.conn.cursor() as cur:
+                    cur.execute(f"INSERT INTO {STRESS_LOG_TABLE} VALUES (%s, %s, true)",
+                                (job['company_id'], worker_id))
+
+
+def run_stress_test(workers, jobs, lease_seconds):
+    """Run workers as separate processes and check every job completed exactly once"""
+    import multiprocessing
+
+    print("=" * 60)
+    print("🧪 PRICE QUEUE STRESS TEST")
+    print("=" * 60)
+    print(f"Workers: {workers} (+1 crashing), Jobs: {jobs}, Lease: {lease_seconds}s")
+
+    stress_setup(jobs)
+    started = datetime.now()
+
+    processes = [multiprocessing.Process(target=stress_worker, args=(0, lease_seconds, True))]
+    processes += [
+        multiprocessing.Process(target=stress_worker, args=(i, lease_seconds, False))
+        for i in range(1, workers + 1)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    duration = (datetime.now() - started).total_seconds()
+
+    conn = get_connection(autocommit=True)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*), COUNT(DISTINCT company_id) FROM {STRESS_LOG_TABLE} WHERE completed")
+        completed, distinct = cur.fetchone()
+        cur.execute(f"SELECT COUNT(*) FROM {STRESS_LOG_TABLE} WHERE NOT completed")
+        abandoned = cur.fetchone()[0]
+        cur.execute(f"SELECT worker, COUNT(*) FROM {STRESS_LOG_TABLE} WHERE completed GROUP BY worker ORDER BY worker")
+        per_worker = cur.fetchall()
+        cur.execute(f"DROP TABLE IF EXISTS {STRESS_TABLE}, {STRESS_LOG_TABLE}")
+    conn.close()
+
+    print(f"\nDuration: {duration:.1f}s")
+    print(f"Completed: {completed} ({distinct} distinct)")
+    print(f"Abandoned by crashed worker (recovered via lease expiry): {abandoned}")
+    for worker, count in per_worker:
+        print(f"   {worker}: {count}")
+
+    ok = completed == jobs and distinct == jobs
+    print(f"Status: {'✅ SUCCESS' if ok else '❌ FAILED'}")
+    print("=" * 60)
+    return ok
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Price fetch queue utilities')
+    parser.add_argument('--stress', action='store_true', help='Run a multi-process stress test on a scratch table')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent worker processes (default: 4)')
+    parser.add_argument('--jobs', type=int, default=500, help='Jobs to enqueue (default: 500)')
+    parser.add_argument('--lease-seconds', type=int, default=3, help='Lease for the stress test (default: 3)')
+    args = parser.parse_args()
+
+    if not args.stress:
+        parser.print_help()
+        sys.exit(0)
+
+    success = run_stress_test(args.workers, args.jobs, args.lease_seconds)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Price Refresh Server
+On-demand quote refresh for the app (e.g. when a stock page is opened)
+
+    POST /refresh   {"company_ids": ["<uuid>", ...], "max_age": 300}   (max_age >= 60)
+    GET  /health
+
+For every company the response holds its quote and how it was answered:
+    cached         last fetch is younger than max_age (memory or database)
+    market_closed  market hasn't traded since the last fetch, stored quote is current
+    updated        fetched now and written
+    unchanged      fetched now, didn't move (only price_checked_at written)
+    rate_limited   no provider has quota left (retry_after seconds), stored quote returned
+    no_data / no_ticker / not_found / failed
+
+Handler threads share one StockPriceUpdater; its Supabase client keeps one
+underlying client per thread (ThreadLocalClient in update_stock_prices.py).
+
+Concurrent requests for the same ticker share one in-flight provider call
+(and for the same company one write), so ten viewers of a page cost one
+call. Fetches go through the same QuoteRouter and quota ledger as the price
+workers (see quote_providers.py), so on-demand refreshes never push a
+provider over its limit.
+
+Usage:
+    python3 scripts/price_refresh_server.py --port 8081
+    curl -X POST localhost:8081/refresh -H 'X-Refresh-Token: ...' -d '{"company_ids": ["..."]}'
+
+Set PRICE_REFRESH_TOKEN to require the X-Refresh-Token header.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from update_stock_prices import StockPriceUpdater, is_valid_ticker
+from quote_providers import QuotaExhausted
+
+DEFAULT_PORT = 8081
+QUOTE_MAX_AGE = 300  # Matches the app's 5 minute price cache
+MIN_QUOTE_MAX_AGE = 60  # Requested max_age is clamped to this, so callers can't force provider calls
+MAX_COMPANIES = 50   # Company ids per request
+MAX_BODY_BYTES = 64 * 1024
+VALUATION_DELAY = 5  # Seconds to collect price updates before one valuation refresh
+
+QUOTE_FIELDS = ('Current_Price', 'Day_High', 'Day_Low', 'Volume', 'Price_Change_Percent',
+                'Currency', 'Market_Status', 'Price_Update', 'Price_Source')
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers with the same key get its result"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> [done event, result, error]
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = [threading.Event(), None, None]
+            else:
+                self.shared += 1
+
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+
+        try:
+            call[1] = fn()
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call[0].set()
+
+
+class DebouncedTask:
+    """Run fn on a background thread, at most once per delay, after it was triggered"""
+
+    def __init__(self, fn, delay):
+        self.fn = fn
+        self.delay = delay
+        self.pending = threading.Event()
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def trigger(self):
+        self.pending.set()
+
+    def loop(self):
+        while True:
+            self.pending.wait()
+            time.sleep(self.delay)
+            self.pending.clear()
+            self.flush()
+
+    def flush(self):
+        try:
+            self.fn()
+        except Exception as e:
+            print(f"   ⚠️  Background task failed: {e}")
+
+
+class PriceRefreshServer:
+    def __init__(self, max_age=QUOTE_MAX_AGE):
+        self.updater = StockPriceUpdater(limit=MAX_COMPANIES)
+        self.max_age = max_age
+        self.tickers = SingleFlight()    # one provider call per ticker
+        self.companies = SingleFlight()  # one fetch + write per company
+        self.cache = {}                  # company_id -> (checked_at, quote)
+        self.cache_lock = threading.Lock()
+        # Revalue portfolios/watchlists off the request path, batching concurrent updates
+        self.valuations = DebouncedTask(self.updater.refresh_valuations, VALUATION_DELAY)
+
+        # Stats
+        self.stats = {
+            'start_time': datetime.now(),
+            'requests': 0,
+            'companies': 0,
+            'cache_hits': 0,
+            'market_closed': 0,
+            'fetches': 0,
+            'rate_limited': 0,
+        }
+
+    def cached_quote(self, company_id, max_age):
+        with self.cache_lock:
+            entry = self.cache.get(company_id)
+        if entry and (datetime.now(timezone.utc) - entry[0]).total_seconds() <= max_age:
+            return entry[1]
+        return None
+
+    def remember(self, company_id, checked_at, quote):
+        with self.cache_lock:
+            self.cache[company_id] = (checked_at, quote)
+
+    def fetch_quote(self, ticker, exchange):
+        """Provider call shared by all concurrent requests for the ticker"""
+        self.stats['fetches'] += 1
+        try:
+            price_data, provider = self.updater.router.fetch(ticker, exchange)
+        except QuotaExhausted as e:
+            return {'retry_after': e.retry_after}
+
+        if price_data:
+            price_data['Price_Source'] = provider
+        return {'price_data': price_data}
+
+    def refresh_company(self, company, max_age):
+        """Answer for one loaded company: stored quote if fresh enough, otherwise fetch and store"""
+        extra_data = company.get('extra_data', {})
+        ticker = extra_data.get('Ticker')
+        stored = {field: extra_data[field] for field in QUOTE_FIELDS if field in extra_data}
+
+        if not is_valid_ticker(ticker):
+            return {'status': 'no_ticker'}
+
+        now = datetime.now(timezone.utc)
+        last_checked = self.updater.last_checked(company)
+        if last_checked and (now - last_checked).total_seconds() <= max_age:
+            self.remember(company['id'], last_checked, stored)
+            return {'status': 'cached', 'quote': stored}
+
+        calendar = self.updater.calendar_for_company(company)
+        if last_checked and not calendar.has_traded_since(last_checked, now):
+            self.stats['market_closed'] += 1
+            self.remember(company['id'], now, stored)
+            return {'status': 'market_closed', 'quote': stored}
+
+        result = self.tickers.do((str(ticker).strip().upper(), calendar.code),
+                                 lambda: self.fetch_quote(ticker, calendar.code))
+
+        if 'retry_after' in result:
+            self.stats['rate_limited'] += 1
+            return {'status': 'rate_limited', 'retry_after': round(result['retry_after']), 'quote': stored}
+
+        if not result['price_data']:
+            return {'status': 'no_data', 'quote': stored}
+
+        price_data = dict(result['price_data'])
+        status = self.updater.store_price(company, price_data, calendar)
+        if status == 'failed':
+            return {'status': 'failed', 'quote': stored}
+
+        quote = {field: price_data[field] for field in QUOTE_FIELDS if field in price_data}
+        self.remember(company['id'], now, quote)
+        return {'status': status, 'quote': quote}
+
+    def refresh(self, company_ids, max_age=None):
+        """Quotes for company ids, refreshing the stale ones"""
+        max_age = max(self.max_age if max_age is None else max_age, MIN_QUOTE_MAX_AGE)
+        self.stats['requests'] += 1
+        self.stats['companies'] += len(company_ids)
+
+        results = {}
+        stale = []
+        for company_id in dict.fromkeys(company_ids):
+            quote = self.cached_quote(company_id, max_age)
+            if quote is not None:
+                self.stats['cache_hits'] += 1
+                results[company_id] = {'status': 'cached', 'quote': quote}
+            else:
+                stale.append(company_id)
+
+        if stale:
+            companies = {c['id']: c for c in self.updater.fetch_companies(stale)}
+            for company_id in stale:
+                company = companies.get(company_id)
+                if company is None:
+                    results[company_id] = {'status': 'not_found'}
+                    continue
+                results[company_id] = self.companies.do(company_id, lambda: self.refresh_company(company, max_age))
+
+            # Revalue portfolios/watchlists holding the companies that got a new price (background)
+            self.valuations.trigger()
+
+        return results
+
+    def print_stats(self):
+        """Print statistics"""
+        duration = (datetime.now() - self.stats['start_time']).total_seconds()
+
+        print("=" * 60)
+        print("📊 REFRESH STATISTICS")
+        print("=" * 60)
+        print(f"Uptime: {duration:.1f}s")
+        print(f"Requests: {self.stats['requests']}")
+        print(f"Companies Requested: {self.stats['companies']}")
+        print(f"Memory Cache Hits: {self.stats['cache_hits']}")
+        print(f"Market Closed (not fetched): {self.stats['market_closed']}")
+        print(f"Provider Fetches: {self.stats['fetches']}")
+        print(f"Coalesced Requests: {self.tickers.shared + self.companies.shared}")
+        print(f"Rate Limited: {self.stats['rate_limited']}")
+        print(f"Valuation Refreshes: {self.updater.stats['valuation_refreshes']}")
+        self.updater.router.print_stats()
+        print("=" * 60)
+
+
+def parse_company_id(value):
+    """Normalized company UUID; ValueError for anything else (it ends up in a PostgREST filter)"""
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError(f'Invalid company id: {value!r}')
+
+
+def make_handler(server, token):
+    class RefreshHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, payload):
+            body = json.dumps(payload, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok', 'providers': [p.name for p in server.updater.router.providers]})
+            else:
+                self.send_json(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            if self.path != '/refresh':
+                self.send_json(404, {'error': 'Not found'})
+                return
+            if token and self.headers.get('X-Refresh-Token') != token:
+                self.send_json(401, {'error': 'Invalid refresh token'})
+                return
+
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                if length > MAX_BODY_BYTES:
+                    raise ValueError('Request body too large')
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                company_ids = payload.get('company_ids')
+                max_age = payload.get('max_age')
+                if not isinstance(company_ids, list) or not company_ids:
+                    raise ValueError('company_ids must be a non-empty list')
+                if len(company_ids) > MAX_COMPANIES:
+                    raise ValueError(f'At most {MAX_COMPANIES} company_ids per request')
+                if max_age is not None and (not isinstance(max_age, (int, float)) or max_age < 0):
+                    raise ValueError('max_age must be a non-negative number of seconds')
+                company_ids = [parse_company_id(company_id) for company_id in company_ids]
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+
+            try:
+                started = time.monotonic()
+                quotes = server.refresh(company_ids, max_age)
+                self.send_json(200, {'quotes': quotes, 'duration_ms': round((time.monotonic() - started) * 1000)})
+            except Exception as e:
+                print(f"   ❌ Refresh failed: {e}")
+                self.send_json(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            print(f"   {self.address_string()} {format % args}")
+
+    return RefreshHandler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='On-demand price refresh endpoint for the app')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--max-age', type=int, default=QUOTE_MAX_AGE,
+                        help=f'Seconds a stored quote counts as fresh (default: {QUOTE_MAX_AGE})')
+    args = parser.parse_args()
+
+    refresh_server = PriceRefreshServer(max_age=args.max_age)
+    token = os.getenv('PRICE_REFRESH_TOKEN')
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(refresh_server, token))
+    httpd.daemon_threads = True
+
+    print("=" * 60)
+    print("⚡ PRICE REFRESH SERVER")
+    print("=" * 60)
+    print(f"Listening on http://{args.host}:{args.port} (POST /refresh, GET /health)")
+    print(f"Providers: {', '.join(p.name for p in refresh_server.updater.router.providers)}")
+    print(f"Token: {'required' if token else 'not set (only bind to internal interfaces)'}")
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping...")
+    finally:
+        httpd.server_close()
+        refresh_server.valuations.flush()
+        refresh_server.print_stats()
+    sys.exit(0)
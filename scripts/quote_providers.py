@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Quote Providers
+Provider abstraction for the StockPriceUpdater with a shared quota ledger
+
+Providers (enabled when their API key is set):
+    Alpha Vantage   ALPHA_VANTAGE_API_KEY   US, Xetra (.DEX), LSE (.LON), TSX (.TRT)
+    Finnhub         FINNHUB_API_KEY         US (real-time, free tier)
+    Twelve Data     TWELVE_DATA_API_KEY     US and most European/Asian exchanges (by MIC)
+    Polygon         POLYGON_API_KEY         US (previous day bar)
+
+Quota ledger: before each call a slot is reserved in quote_provider_usage
+via reserve_quote_call() (see 20260201000006_quote_provider_quota.sql), so
+minute/day/month limits hold across restarts and parallel price workers.
+Limits can be overridden per provider, e.g. ALPHA_VANTAGE_QUOTA=75,0,0
+(per minute, per day, per month; 0 = unlimited) for a paid key.
+
+Routing: for each ticker the providers covering its exchange are tried in
+order of coverage (then daily budget). A provider without budget, rate
+limited, failing or without data for the symbol is skipped and the next one
+is asked, so throughput is the sum of all configured providers.
+"""
+
+import os
+import abc
+import time
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from http_client import get_client, CircuitOpenError
+
+WINDOWS = ('minute', 'day', 'month')
+
+# After a failed ledger RPC, count per process for this long, then try the shared ledger again
+LEDGER_RETRY_AFTER = 60
+
+# Exchange -> quote currency (Alpha Vantage/Finnhub/Polygon don't return one)
+EXCHANGE_CURRENCY = {
+    'XNYS': 'USD', 'XETR': 'EUR', 'XFRA': 'EUR', 'XLON': 'GBX', 'XPAR': 'EUR',
+    'XSWX': 'CHF', 'XTSE': 'CAD', 'XASX': 'AUD', 'XTKS': 'JPY', 'XHKG': 'HKD',
+}
+
+
+class ProviderRateLimited(Exception):
+    """The provider itself reported its limit for a window as reached"""
+
+    def __init__(self, window, message=''):
+        super().__init__(message or f"rate limited ({window})")
+        self.window = window
+
+
+class QuotaExhausted(Exception):
+    """No provider covering the ticker has budget left right now"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"all quote providers exhausted (retry in {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+def seconds_until_window_end(window, now=None):
+    """Seconds until the current UTC minute/day/month window ends"""
+    now = now or datetime.now(timezone.utc)
+    if window == 'minute':
+        end = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    elif window == 'day':
+        end = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    else:
+        first = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        end = (first + timedelta(days=32)).replace(day=1)
+    return max(1.0, (end - now).total_seconds())
+
+
+def split_ticker(ticker):
+    """'SAP.DE' -> ('SAP', 'DE'); None for unusable tickers"""
+    if not ticker:
+        return None, None
+    ticker = str(ticker).strip().upper()
+    base, _, suffix = ticker.partition('.')
+    if not base or len(base) > 10 or ' ' in base:
+        return None, None
+    return base, suffix or None
+
+
+def to_float(value):
+    try:
+        return float(str(value).rstrip('%'))
+    except (TypeError, ValueError):
+        return None
+
+
+def quote(current_price, exchange, day_high=None, day_low=None, volume=None, change_percent=None, currency=None):
+    """price_data dict in the extra_data shape the UI reads"""
+    data = {
+        'Current_Price': current_price,
+        'Price_Update': datetime.now(timezone.utc).isoformat(),
+        'Currency': currency or EXCHANGE_CURRENCY.get(exchange, 'USD'),
+    }
+    if day_high is not None:
+        data['Day_High'] = day_high
+    if day_low is not None:
+        data['Day_Low'] = day_low
+    if volume is not None:
+        data['Volume'] = int(volume)
+    if change_percent is not None:
+        data['Price_Change_Percent'] = change_percent
+    return data
+
+
+class QuoteProvider(abc.ABC):
+    name = None
+    env_key = None
+    # Default free-tier limits: (per minute, per day, per month), 0 = unlimited
+    limits = (0, 0, 0)
+    # exchange code -> coverage score (3 = primary listing in real time, 1 = fallback)
+    coverage = {}
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        # Ledger rows are per key: processes sharing a key share its budget,
+        # a second key (e.g. per price-worker replica) adds its own
+        self.ledger_key = f"{self.name}:{hashlib.sha1(api_key.encode()).hexdigest()[:8]}"
+        override = os.getenv(f"{self.env_key.replace('_API_KEY', '')}_QUOTA")
+        if override:
+            self.limits = tuple(int(part) for part in override.split(','))
+
+    @classmethod
+    def from_env(cls):
+        api_key = os.getenv(cls.env_key)
+        return cls(api_key) if api_key else None
+
+    def covers(self, exchange):
+        return self.coverage.get(exchange, 0)
+
+    @abc.abstractmethod
+    def fetch(self, ticker, exchange):
+        """price_data dict, None if the provider has no data for the symbol"""
+
+
+class AlphaVantageProvider(QuoteProvider):
+    name = 'alpha_vantage'
+    env_key = 'ALPHA_VANTAGE_API_KEY'
+    limits = (5, 25, 0)
+    coverage = {'XNYS': 2, 'XETR': 2, 'XFRA': 1, 'XLON': 2, 'XTSE': 2}
+    suffixes = {'XETR': '.DEX', 'XFRA': '.DEX', 'XLON': '.LON', 'XTSE': '.TRT'}
+
+    def fetch(self, ticker, exchange):
+        base, _ = split_ticker(ticker)
+        if not base:
+            return None
+
+        response = get_client().get('https://www.alphavantage.co/query', params={
+            'function': 'GLOBAL_QUOTE',
+            'symbol': base + self.suffixes.get(exchange, ''),
+            'apikey': self.api_key,
+        }, timeout=10)
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        # Rate limit notices come back as HTTP 200
+        notice = data.get('Note') or data.get('Information')
+        if notice:
+            raise ProviderRateLimited('day' if 'day' in notice.lower() else 'minute', notice)
+
+        result = data.get('Global Quote') or {}
+        price = to_float(result.get('05. price'))
+        if not price:
+            return None
+
+        return quote(
+            price, exchange,
+            day_high=to_float(result.get('03. high')),
+            day_low=to_float(result.get('04. low')),
+            volume=to_float(result.get('06. volume')),
+            change_percent=to_float(result.get('10. change percent')),
+        )
+
+
+class FinnhubProvider(QuoteProvider):
+    name = 'finnhub'
+    env_key = 'FINNHUB_API_KEY'
+    limits = (60, 0, 0)
+    coverage = {'XNYS': 3}
+
+    def fetch(self, ticker, exchange):
+        base, _ = split_ticker(ticker)
+        if not base:
+            return None
+
+        response = get_client().get('https://finnhub.io/api/v1/quote', params={
+            'symbol': base,
+            'token': self.api_key,
+        }, timeout=10)
+        if response.status_code == 429:
+            raise ProviderRateLimited('minute')
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        price = to_float(data.get('c'))
+        if not price:
+            return None
+
+        return quote(
+            price, exchange,
+            day_high=to_float(data.get('h')),
+            day_low=to_float(data.get('l')),
+            change_percent=to_float(data.get('dp')),
+        )
+
+
+class TwelveDataProvider(QuoteProvider):
+    name = 'twelve_data'
+    env_key = 'TWELVE_DATA_API_KEY'
+    limits = (8, 800, 0)
+    coverage = {
+        'XNYS': 2, 'XETR': 3, 'XFRA': 2, 'XLON': 3, 'XPAR': 3, 'XSWX': 3,
+        'XTSE': 3, 'XASX': 2, 'XTKS': 2, 'XHKG': 2,
+    }
+    # Euronext is one calendar here but separate MICs at Twelve Data
+    suffix_mic = {'AS': 'XAMS', 'BR': 'XBRU', 'LS': 'XLIS', 'MI': 'XMIL', 'V': 'XTSX'}
+
+    def fetch(self, ticker, exchange):
+        base, suffix = split_ticker(ticker)
+        if not base:
+            return None
+
+        params = {'symbol': base, 'apikey': self.api_key}
+        if exchange != 'XNYS':
+            params['mic_code'] = self.suffix_mic.get(suffix, exchange)
+
+        response = get_client().get('https://api.twelvedata.com/quote', params=params, timeout=10)
+        if response.status_code == 429:
+            raise ProviderRateLimited('minute')
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        if data.get('status') == 'error':
+            if data.get('code') == 429:
+                raise ProviderRateLimited('day' if 'day' in str(data.get('message', '')).lower() else 'minute')
+            return None
+
+        price = to_float(data.get('close'))
+        if not price:
+            return None
+
+        return quote(
+            price, exchange,
+            day_high=to_float(data.get('high')),
+            day_low=to_float(data.get('low')),
+            volume=to_float(data.get('volume')),
+            change_percent=to_float(data.get('percent_change')),
+            currency=data.get('currency'),
+        )
+
+
+class PolygonProvider(QuoteProvider):
+    name = 'polygon'
+    env_key = 'POLYGON_API_KEY'
+    limits = (5, 0, 0)
+    coverage = {'XNYS': 1}  # Free tier: previous day bar only
+
+    def fetch(self, ticker, exchange):
+        base, _ = split_ticker(ticker)
+        if not base:
+            return None
+
+        response = get_client().get(
+            f"https://api.polygon.io/v2/aggs/ticker/{base}/prev",
+            params={'adjusted': 'true', 'apiKey': self.api_key},
+            timeout=10
+        )
+        if response.status_code == 429:
+            raise ProviderRateLimited('minute')
+        if response.status_code != 200:
+            return None
+
+        results = response.json().get('results') or []
+        if not results or not results[0].get('c'):
+            return None
+
+        bar = results[0]
+        return quote(bar['c'], exchange, day_high=bar.get('h'), day_low=bar.get('l'), volume=bar.get('v'))
+
+
+PROVIDER_CLASSES = [FinnhubProvider, TwelveDataProvider, AlphaVantageProvider, PolygonProvider]
+
+
+class QuotaLedger:
+    """Shared per-provider call counters (quote_provider_usage), with a local fallback"""
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.local = {}
+        self.unavailable_until = None  # monotonic time until which the shared ledger is skipped
+
+    @property
+    def shared(self):
+        """Whether to use the shared ledger (again, once the cooldown after a failure is over)"""
+        return self.unavailable_until is None or time.monotonic() >= self.unavailable_until
+
+    def shared_failed(self, e):
+        if self.unavailable_until is None:
+            print(f"\n   ⚠️  Quota ledger unavailable ({e}) - counting per process for {LEDGER_RETRY_AFTER}s")
+        self.unavailable_until = time.monotonic() + LEDGER_RETRY_AFTER
+
+    def shared_succeeded(self):
+        if self.unavailable_until is not None:
+            print("\n   ✅ Quota ledger available again")
+            self.unavailable_until = None
+
+    def reserve(self, provider):
+        """Reserve one call; returns None if reserved, otherwise the exhausted window"""
+        minute, day, month = provider.limits
+        if self.shared:
+            try:
+                window = self.supabase.rpc('reserve_quote_call', {
+                    'p_provider': provider.ledger_key,
+                    'p_minute_limit': minute,
+                    'p_day_limit': day,
+                    'p_month_limit': month,
+                }).execute().data
+                self.shared_succeeded()
+                return window
+            except Exception as e:
+                self.shared_failed(e)
+
+        return self.reserve_local(provider)
+
+    def reserve_local(self, provider):
+        now = datetime.now(timezone.utc)
+        keys = (now.strftime('%Y%m%d%H%M'), now.strftime('%Y%m%d'), now.strftime('%Y%m'))
+
+        for window, key, limit in zip(WINDOWS, keys, provider.limits):
+            if limit > 0 and self.local.get((provider.ledger_key, window, key), 0) >= limit:
+                return window
+
+        for window, key in zip(WINDOWS, keys):
+            self.local[(provider.ledger_key, window, key)] = self.local.get((provider.ledger_key, window, key), 0) + 1
+        return None
+
+    def exhaust(self, provider, window):
+        """Record that the provider refused calls for the rest of the window"""
+        if self.shared:
+            try:
+                self.supabase.rpc('exhaust_quote_provider', {
+                    'p_provider': provider.ledger_key,
+                    'p_window_kind': window,
+                }).execute()
+                self.shared_succeeded()
+                return
+            except Exception as e:
+                self.shared_failed(e)
+
+        now = datetime.now(timezone.utc)
+        key = {'minute': '%Y%m%d%H%M', 'day': '%Y%m%d', 'month': '%Y%m'}[window]
+        self.local[(provider.ledger_key, window, now.strftime(key))] = float('inf')
+
+
+class QuoteRouter:
+    def __init__(self, supabase, providers=None):
+        self.providers = providers if providers is not None else [
+            provider for provider in (cls.from_env() for cls in PROVIDER_CLASSES) if provider
+        ]
+        self.ledger = QuotaLedger(supabase)
+        self.blocked_until = {}  # provider name -> monotonic time
+        self.stats = {p.name: {'calls': 0, 'quotes': 0, 'no_data': 0, 'errors': 0, 'rate_limited': 0}
+                      for p in self.providers}
+
+    def candidates(self, exchange):
+        """Providers covering the exchange, best coverage first, then biggest daily budget"""
+        covering = [p for p in self.providers if p.covers(exchange)]
+        return sorted(covering, key=lambda p: (-p.covers(exchange), -(p.limits[1] or float('inf'))))
+
+    def block(self, provider, window):
+        self.blocked_until[provider.name] = time.monotonic() + seconds_until_window_end(window)
+
+    def fetch(self, ticker, exchange):
+        """
+        Quote for a ticker from the best provider with budget left
+
+        Returns: (price_data, provider name), or (None, None) if no provider had data
+        Raises: QuotaExhausted if providers were skipped for budget and none had data
+        """
+        retry_after = None
+
+        for provider in self.candidates(exchange):
+            blocked = self.blocked_until.get(provider.name, 0) - time.monotonic()
+            if blocked > 0:
+                retry_after = min(retry_after or blocked, blocked)
+                continue
+
+            window = self.ledger.reserve(provider)
+            if window:
+                self.block(provider, window)
+                wait = seconds_until_window_end(window)
+                retry_after = min(retry_after or wait, wait)
+                continue
+
+            stats = self.stats[provider.name]
+            stats['calls'] += 1
+            try:
+                price_data = provider.fetch(ticker, exchange)
+            except ProviderRateLimited as e:
+                stats['rate_limited'] += 1
+                self.ledger.exhaust(provider, e.window)
+                self.block(provider, e.window)
+                wait = seconds_until_window_end(e.window)
+                retry_after = min(retry_after or wait, wait)
+                continue
+            except CircuitOpenError:
+                stats['errors'] += 1
+                self.blocked_until[provider.name] = time.monotonic() + 60
+                continue
+            except Exception as e:
+                print(f"\n   ⚠️  {provider.name}: {e}")
+                stats['errors'] += 1
+                continue
+
+            if price_data:
+                stats['quotes'] += 1
+                return price_data, provider.name
+
+            stats['no_data'] += 1
+
+        if retry_after is not None:
+            raise QuotaExhausted(retry_after)
+        return None, None
+
+    @property
+    def total_calls(self):
+        return sum(s['calls'] for s in self.stats.values())
+
+    def print_stats(self):
+        print("Quote Providers:")
+        if not self.providers:
+            print("   (none configured)")
+        for name, s in self.stats.items():
+            print(f"   {name}: {s['calls']} calls, {s['quotes']} quotes, {s['no_data']} no data, "
+                  f"{s['errors']} errors, {s['rate_limited']} rate limited")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Stock Price Rollup Refresher
+Materializes the hourly/daily/weekly OHLCV continuous aggregates
+(see supabase/migrations/20260201000001_stock_price_rollups.sql)
+
+Incremental by default: only the trailing window of each rollup is refreshed.
+TimescaleDB's invalidation log makes a --full refresh cheap too, since only
+buckets touched by new or changed stock_prices rows are recomputed.
+
+TimescaleDB refresh policies keep the trailing windows current
+(20260201000010_stock_price_rollup_policies.sql); this runs nightly via cron
+and by hand after backfills
+"""
+
+import sys
+from datetime import datetime, timedelta, timezone
+
+from pg_connection import get_connection
+from job_profiler import JobProfiler
+
+# (continuous aggregate, incremental refresh window)
+# Each window spans several buckets so late rows for the previous bucket are picked up
+ROLLUPS = [
+    ('stock_prices_1h', timedelta(days=3)),
+    ('stock_prices_1d', timedelta(days=14)),
+    ('stock_prices_1w', timedelta(weeks=8)),
+]
+
+
+class PriceRollupRefresher:
+    def __init__(self, profile=None):
+        # refresh_continuous_aggregate() cannot run inside a transaction block
+        self.conn = get_connection(autocommit=True)
+        self.profiler = JobProfiler('refresh_price_rollups', enabled=profile)
+
+        # Stats
+        self.stats = {
+            'start_time': None,
+            'end_time': None,
+            'refreshed': 0,
+            'skipped': 0,
+            'errors': 0,
+            'success': False,
+            'error_message': None
+        }
+
+    def get_existing_rollups(self):
+        """Get the continuous aggregates that exist in this database"""
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+            if cur.fetchone() is None:
+                return set()
+
+            cur.execute("SELECT view_name FROM timescaledb_information.continuous_aggregates")
+            return {row[0] for row in cur.fetchall()}
+
+    def refresh_rollup(self, view_name, window_start):
+        """Refresh one continuous aggregate from window_start (None = all history) to now"""
+        started = datetime.now()
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "CALL refresh_continuous_aggregate(%s::regclass, %s, NULL)",
+                (view_name, window_start)
+            )
+        return (datetime.now() - started).total_seconds()
+
+    def run(self, full=False):
+        """Run the refresh"""
+        self.stats['start_time'] = datetime.now()
+        print("\n📈 Refreshing stock price rollups...")
+        print(f"   Mode: {'FULL' if full else 'INCREMENTAL'}")
+
+        try:
+            existing = self.get_existing_rollups()
+            if not existing:
+                print("   ⏭️  No continuous aggregates found (TimescaleDB not installed?)")
+                self.stats['success'] = True
+                return True
+
+            now = datetime.now(timezone.utc)
+
+            for view_name, window in ROLLUPS:
+                if view_name not in existing:
+                    print(f"   ⏭️  {view_name}: not created yet")
+                    self.stats['skipped'] += 1
+                    continue
+
+                window_start = None if full else now - window
+
+                try:
+                    with self.profiler.stage(view_name):
+                        duration = self.refresh_rollup(view_name, window_start)
+                    since = 'all history' if window_start is None else window_start.strftime('%Y-%m-%d %H:%M')
+                    print(f"   ✅ {view_name}: refreshed since {since} ({duration:.2f}s)")
+                    self.stats['refreshed'] += 1
+                except Exception as e:
+                    print(f"   ❌ {view_name}: {e}")
+                    self.stats['errors'] += 1
+
+            self.stats['success'] = self.stats['errors'] == 0
+
+        except Exception as e:
+            print(f"   ❌ Error: {e}")
+            self.stats['success'] = False
+            self.stats['error_message'] = str(e)
+
+        finally:
+            self.stats['end_time'] = datetime.now()
+            self.conn.close()
+            self.profiler.write_reports()
+
+        return self.stats['success']
+
+
+def refresh_rollups(full=False):
+    """Refresh all rollups; never raises so callers can treat it as best effort"""
+    try:
+        # Called from inside other jobs' profiled stages - never profile on its own
+        return PriceRollupRefresher(profile=False).run(full=full)
+    except Exception as e:
+        print(f"   ⚠️  Rollup refresh skipped: {e}")
+        return False
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Refresh stock price OHLCV rollups')
+    parser.add_argument('--full', action='store_true', help='Refresh the whole history instead of the trailing window')
+    parser.add_argument('--profile', action='store_true', help='Write per-stage CPU/memory profiles (see job_profiler.py)')
+    args = parser.parse_args()
+
+    refresher = PriceRollupRefresher(profile=args.profile or None)
+    success = refresher.run(full=args.full)
+    sys.exit(0 if success else 1)
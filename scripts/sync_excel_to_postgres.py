@@ -4,12 +4,27 @@ Excel to PostgreSQL Sync
 Adapted from Blackfire_automation/sync_final.py
 
 Syncs companies from Dropbox Excel to PostgreSQL/Supabase
+
+Sources: by default the first sheet of the DROPBOX_URL workbook. Several
+trackers (workbooks and/or sheets) can be synced together by pointing
+SYNC_SOURCES (or --sources) at a JSON file:
+
+    [
+      {"name": "main", "url_env": "DROPBOX_URL", "sheets": [0], "priority": 10},
+      {"name": "biotech", "url": "https://www.dropbox.com/...&dl=1", "sheets": "*", "priority": 0}
+    ]
+
+Workbooks are downloaded concurrently and every sheet is parsed and mapped
+in a process pool. Rows with the same satellog are merged before the single
+diff/upsert pass: fields of the higher priority source win, then the source
+listed first, then the sheet listed first; within a sheet later rows win.
 """
 
 import os
-import requests
+import json
 import pandas as pd
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
 import sys
@@ -27,6 +42,12 @@ except ImportError:
     os.system(f"{sys.executable} -m pip install supabase")
     from supabase import create_client, Client
 
+from change_events import ChangeEventOutbox, detect_company_changes, EVENT_CREATED
+from name_matcher import NameMatcher
+from company_registry import CompanyRegistry, fingerprint
+from job_profiler import JobProfiler
+from http_client import get_client
+
 # Column Mapping (Excel → PostgreSQL)
 COLUMN_MAPPING = {
     'Company_Name': 'name',
@@ -54,102 +75,302 @@ PROTECTED_FIELDS = {
 # Core PostgreSQL Fields (not in extra_data)
 CORE_FIELDS = {'name', 'symbol', 'wkn', 'isin', 'satellog', 'current_price'}
 
+# Concurrent workbook downloads
+DOWNLOAD_WORKERS = 4
+
+
+def load_sources(path=None):
+    """Source definitions from a JSON file (SYNC_SOURCES), or the first sheet of DROPBOX_URL"""
+    path = path or os.getenv('SYNC_SOURCES')
+    if not path:
+        return [{'name': 'dropbox', 'url': os.getenv('DROPBOX_URL'), 'sheets': [0], 'priority': 0}]
+
+    with open(path) as f:
+        sources = json.load(f)
+
+    for i, source in enumerate(sources):
+        source.setdefault('name', f"source{i + 1}")
+        if 'url_env' in source:
+            # Keeps share links (secrets) in .env.production instead of the sources file
+            source['url'] = os.getenv(source['url_env'])
+        source.setdefault('sheets', [0])
+        source.setdefault('priority', 0)
+    return sources
+
+
+def map_column_name(excel_col):
+    """Map Excel column to PostgreSQL field"""
+    return COLUMN_MAPPING.get(excel_col, excel_col)
+
+
+def detect_columns(df):
+    """(identifier, satellog, name) columns of a sheet; satellog/name may be None"""
+    identifier_col = df.columns[0]  # First column = satellog (used as identifier)
+    satellog_col = None
+
+    # Check if there's an explicit 'satellog' column
+    for col in df.columns:
+        if str(col).lower() == 'satellog':
+            satellog_col = col
+            break
+
+    # If first column IS satellog, use Name/Company_Name as display name
+    name_col = None
+    if satellog_col and satellog_col == identifier_col:
+        for col in df.columns:
+            if col in ('Name', 'Company_Name', 'name'):
+                name_col = col
+                break
+
+    return identifier_col, satellog_col, name_col
+
+
+def build_company_data(excel_row, identifier, satellog_value):
+    """Build company data for PostgreSQL"""
+
+    # Start with core fields
+    # Use raw satellog value from Excel (matches Notion import format)
+    company_data = {
+        'name': identifier,
+        'satellog': str(satellog_value).strip() if satellog_value and str(satellog_value) != 'nan' else identifier
+    }
+
+    # Extra data for JSONB field
+    extra_data = {}
+
+    for excel_col, value in excel_row.items():
+        # Skip NaN values
+        if pd.isna(value) or value == '':
+            continue
+
+        # Convert date/time objects to ISO strings for JSON serialization
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+
+        # Map column name
+        mapped_col = map_column_name(excel_col)
+
+        # Skip protected fields
+        if mapped_col in PROTECTED_FIELDS:
+            continue
+
+        # Handle core fields
+        if mapped_col in CORE_FIELDS:
+            if mapped_col == 'symbol':
+                company_data['symbol'] = str(value).strip() if value else None
+            elif mapped_col == 'wkn':
+                company_data['wkn'] = str(value).strip() if value else None
+            elif mapped_col == 'isin':
+                company_data['isin'] = str(value).strip() if value else None
+        else:
+            # Everything else goes to extra_data
+            extra_data[excel_col] = value
+
+    if extra_data:
+        company_data['extra_data'] = extra_data
+
+    return company_data
+
+
+def map_sheet(df):
+    """Mapped rows of a sheet as (satellog, display name, company_data), plus the skipped count"""
+    identifier_col, satellog_col, name_col = detect_columns(df)
+
+    rows = []
+    skipped = 0
+    for _, row in df.iterrows():
+        # Get the raw satellog value
+        satellog_value = str(row[satellog_col or identifier_col]).strip()
+
+        # Get display name
+        identifier = satellog_value
+        if name_col:
+            identifier = str(row[name_col]).strip()
+            if not identifier or identifier == 'nan':
+                identifier = satellog_value
+
+        if not satellog_value or satellog_value == 'nan':
+            skipped += 1
+            continue
+
+        rows.append((satellog_value, identifier, build_company_data(row.to_dict(), identifier, satellog_value)))
+
+    return rows, skipped, (identifier_col, satellog_col, name_col)
+
+
+def parse_sheet(task):
+    """Parse and map one sheet of a downloaded workbook (runs in a worker process)"""
+    source, sheet, order, content = task
+    df = pd.read_excel(BytesIO(content), sheet_name=sheet)
+    rows, skipped, columns = map_sheet(df)
+    return {
+        'source': source['name'],
+        'sheet': sheet,
+        'priority': source['priority'],
+        'order': order,
+        'rows': rows,
+        'row_count': len(df),
+        'column_count': len(df.columns),
+        'columns': [str(col) for col in df.columns],
+        'skipped': skipped,
+        'detected': tuple(None if col is None else str(col) for col in columns),
+    }
+
+
+def combine_parts(parts):
+    """
+    Merge (rank, display name, company_data) parts of one company into
+    (display name, company_data)
+
+    Parts are applied from lowest to highest rank, so the winning value of
+    every field is written last. A single part is passed through unchanged,
+    so its fingerprint doesn't change.
+    """
+    parts = sorted(parts, key=lambda part: part[0])
+    _, identifier, combined = parts[0]
+    for _, identifier, company_data in parts[1:]:
+        merged = {**combined, **company_data}
+        if 'extra_data' in combined and 'extra_data' in company_data:
+            merged['extra_data'] = {**combined['extra_data'], **company_data['extra_data']}
+        combined = merged
+    return identifier, combined
+
+
+def merge_records(sheets):
+    """
+    One (satellog, display name, company_data, parts) record per satellog across all sheets
+
+    Precedence (rank) is priority, then source/sheet position in the config.
+    parts keeps the ranked source rows so records that turn out to be the
+    same company (e.g. one source keyed by satellog, one by name) can be
+    merged again after matching with the same precedence.
+    """
+    ordered = sorted(sheets, key=lambda sheet: (sheet['priority'], tuple(-i for i in sheet['order'])))
+
+    parts_by_satellog = {}
+    for rank, sheet in enumerate(ordered):
+        for satellog_value, identifier, company_data in sheet['rows']:
+            parts_by_satellog.setdefault(satellog_value, []).append((rank, identifier, company_data))
+
+    return [
+        (satellog_value, *combine_parts(parts), parts)
+        for satellog_value, parts in parts_by_satellog.items()
+    ]
+
+
 class ExcelToPostgresSync:
-    def __init__(self):
-        self.dropbox_url = os.getenv('DROPBOX_URL')
+    def __init__(self, profile=None, sources=None, workers=None):
         self.supabase_url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+        self.sources = load_sources(sources)
+        self.workers = workers or os.cpu_count() or 1  # Parse processes
 
-        if not all([self.dropbox_url, self.supabase_url, self.supabase_key]):
+        if not all([self.supabase_url, self.supabase_key]) or not all(source.get('url') for source in self.sources):
             raise ValueError("Missing environment variables")
 
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        self.outbox = ChangeEventOutbox(self.supabase)
+        self.profiler = JobProfiler('sync_excel_to_postgres', enabled=profile)
 
         # Stats
         self.stats = {
             'start_time': None,
             'end_time': None,
+            'sources': 0,
+            'sheets': 0,
             'excel_rows': 0,
             'excel_columns': 0,
+            'merged_rows': 0,
             'db_companies': 0,
             'updates': 0,
             'creates': 0,
             'skipped': 0,
+            'unchanged': 0,
+            'fuzzy_matches': 0,
             'errors': 0,
+            'events': 0,
             'success': False,
             'error_message': None
         }
 
-    def download_and_parse(self):
-        """Download and parse Excel from Dropbox"""
-        print("\n📥 Downloading Excel from Dropbox...")
-
-        try:
-            response = requests.get(self.dropbox_url, timeout=60)
-            if response.status_code != 200:
-                self.stats['error_message'] = f"Dropbox download failed: {response.status_code}"
-                return None
-
-            print(f"   ✅ Downloaded {len(response.content)} bytes")
-
-            print("\n📊 Parsing Excel...")
-            df = pd.read_excel(BytesIO(response.content))
-
-            self.stats['excel_rows'] = len(df)
-            self.stats['excel_columns'] = len(df.columns)
-
-            print(f"   ✅ Parsed {len(df)} rows, {len(df.columns)} columns")
-            print(f"   Columns: {', '.join(df.columns.tolist()[:10])}{'...' if len(df.columns) > 10 else ''}")
-
-            return df
+    def download_source(self, source):
+        """Download one workbook; returns its bytes"""
+        response = get_client().get(source['url'], timeout=60)
+        if response.status_code != 200:
+            raise Exception(f"Download of '{source['name']}' failed: {response.status_code}")
+        return response.content
+
+    def download_sources(self):
+        """Download all workbooks concurrently"""
+        print(f"\n📥 Downloading {len(self.sources)} workbook(s)...")
+
+        with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(self.sources))) as pool:
+            contents = list(pool.map(self.download_source, self.sources))
+
+        for source, content in zip(self.sources, contents):
+            print(f"   ✅ {source['name']}: {len(content)} bytes")
+        self.stats['sources'] = len(self.sources)
+
+        return contents
+
+    def parse_sources(self, contents):
+        """Parse and map every configured sheet (process pool when there are several)"""
+        tasks = []
+        for source_index, (source, content) in enumerate(zip(self.sources, contents)):
+            sheets = source['sheets']
+            if sheets == '*':
+                sheets = pd.ExcelFile(BytesIO(content)).sheet_names
+            tasks.extend((source, sheet, (source_index, sheet_index), content)
+                         for sheet_index, sheet in enumerate(sheets))
+
+        workers = min(self.workers, len(tasks))
+        print(f"\n📊 Parsing {len(tasks)} sheet(s){f' in {workers} processes' if workers > 1 else ''}...")
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                sheets = list(pool.map(parse_sheet, tasks))
+        else:
+            sheets = [parse_sheet(task) for task in tasks]
+
+        for sheet in sheets:
+            self.stats['sheets'] += 1
+            self.stats['excel_rows'] += sheet['row_count']
+            self.stats['excel_columns'] = max(self.stats['excel_columns'], sheet['column_count'])
+            self.stats['skipped'] += sheet['skipped']
+
+            columns = sheet['columns']
+            print(f"   ✅ {sheet['source']}[{sheet['sheet']}]: {sheet['row_count']} rows, {sheet['column_count']} columns")
+            print(f"   Columns: {', '.join(columns[:10])}{'...' if len(columns) > 10 else ''}")
+
+            identifier_col, satellog_col, name_col = sheet['detected']
+            if satellog_col and satellog_col == identifier_col:
+                print(f"   Satellog column: '{satellog_col}'")
+                print(f"   Name column: '{name_col or identifier_col}'")
+            else:
+                print(f"   Using '{identifier_col}' as identifier (no separate satellog column)")
 
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
-            self.stats['error_message'] = str(e)
-            return None
+        return sheets
 
     def get_existing_companies(self):
         """Get all existing companies from PostgreSQL"""
         print("\n🐘 Getting existing companies from PostgreSQL...")
 
         try:
-            # Fetch all companies (paginate past Supabase 1000-row default limit)
-            all_companies = []
-            page_size = 1000
-            offset = 0
-
-            while True:
-                response = self.supabase.table('companies') \
-                    .select('id, name, satellog, symbol, wkn, isin, extra_data') \
-                    .range(offset, offset + page_size - 1) \
-                    .execute()
-
-                batch = response.data
-                all_companies.extend(batch)
-
-                if len(batch) < page_size:
-                    break
-                offset += page_size
-
-            companies = all_companies
-            self.stats['db_companies'] = len(companies)
+            # Compact registry: keys and fingerprints only, extra_data is loaded lazily
+            registry = CompanyRegistry.load(self.supabase)
+            self.stats['db_companies'] = len(registry)
 
-            print(f"   ✅ Found {len(companies)} companies in database")
+            print(f"   ✅ Found {len(registry)} companies in database")
 
-            # Build maps
-            by_name = {}
-            by_satellog = {}
+            # Fallback index for near-identical names (built once per run)
+            matcher = NameMatcher(registry)
 
-            for company in companies:
-                name = (company.get('name') or '').strip()
-                satellog = (company.get('satellog') or '').strip()
-
-                if name:
-                    by_name[name] = company
-                if satellog:
-                    by_satellog[satellog] = company
-
-            return {'by_name': by_name, 'by_satellog': by_satellog}
+            return {
+                'by_name': registry.by_name,
+                'by_satellog': registry.by_satellog,
+                'matcher': matcher,
+                'registry': registry
+            }
 
         except Exception as e:
             print(f"   ❌ Error: {e}")
@@ -158,126 +379,108 @@ class ExcelToPostgresSync:
 
     def map_column_name(self, excel_col):
         """Map Excel column to PostgreSQL field"""
-        return COLUMN_MAPPING.get(excel_col, excel_col)
+        return map_column_name(excel_col)
 
     def build_company_data(self, excel_row, identifier, satellog_value):
         """Build company data for PostgreSQL"""
+        return build_company_data(excel_row, identifier, satellog_value)
 
-        # Start with core fields
-        # Use raw satellog value from Excel (matches Notion import format)
-        company_data = {
-            'name': identifier,
-            'satellog': str(satellog_value).strip() if satellog_value and str(satellog_value) != 'nan' else identifier
-        }
-
-        # Extra data for JSONB field
-        extra_data = {}
-
-        for excel_col, value in excel_row.items():
-            # Skip NaN values
-            if pd.isna(value) or value == '':
-                continue
-
-            # Convert date/time objects to ISO strings for JSON serialization
-            if hasattr(value, 'isoformat'):
-                value = value.isoformat()
-
-            # Map column name
-            mapped_col = self.map_column_name(excel_col)
-
-            # Skip protected fields
-            if mapped_col in PROTECTED_FIELDS:
-                continue
-
-            # Handle core fields
-            if mapped_col in CORE_FIELDS:
-                if mapped_col == 'symbol':
-                    company_data['symbol'] = str(value).strip() if value else None
-                elif mapped_col == 'wkn':
-                    company_data['wkn'] = str(value).strip() if value else None
-                elif mapped_col == 'isin':
-                    company_data['isin'] = str(value).strip() if value else None
-            else:
-                # Everything else goes to extra_data
-                extra_data[excel_col] = value
-
-        if extra_data:
-            company_data['extra_data'] = extra_data
-
-        return company_data
-
-    def compare_and_sync(self, df, existing):
-        """Compare Excel with PostgreSQL and sync"""
+    def compare_and_sync(self, records, existing):
+        """Compare the merged Excel records with PostgreSQL and sync"""
         print("\n🔍 Comparing Excel with PostgreSQL...")
 
-        # Detect columns
-        identifier_col = df.columns[0]  # First column = satellog (used as identifier)
-        satellog_col = None
-
-        # Check if there's an explicit 'satellog' column
-        for col in df.columns:
-            if col.lower() == 'satellog':
-                satellog_col = col
-                break
-
-        # If first column IS satellog, use Name/Company_Name as display name
-        if satellog_col and satellog_col == identifier_col:
-            # satellog is first column - look for a Name column
-            name_col = None
-            for col in df.columns:
-                if col in ('Name', 'Company_Name', 'name'):
-                    name_col = col
-                    break
-            print(f"   Satellog column: '{satellog_col}'")
-            print(f"   Name column: '{name_col or identifier_col}'")
-        else:
-            name_col = None
-            print(f"   Using '{identifier_col}' as identifier (no separate satellog column)")
-
         to_update = []
         to_create = []
+        records = list(records)
+
+        # Exact satellog (raw value) or name hits claim their companies first
+        resolved = [
+            existing['by_satellog'].get(satellog_value) or existing['by_name'].get(identifier)
+            for satellog_value, identifier, company_data, parts in records
+        ]
+        claimed_ids = {company['id'] for company in resolved if company}
+
+        # Fall back to normalized/trigram name match instead of creating a duplicate,
+        # only for companies no row claimed
+        fuzzy = set()
+        for i, (satellog_value, identifier, company_data, parts) in enumerate(records):
+            if resolved[i]:
+                continue
+            candidate, score, method = existing['matcher'].match(identifier)
+            if candidate and candidate['id'] not in claimed_ids:
+                resolved[i] = candidate
+                claimed_ids.add(candidate['id'])
+                fuzzy.add(i)
+                self.stats['fuzzy_matches'] += 1
+                if self.stats['fuzzy_matches'] <= 20:
+                    print(f"   🔗 '{identifier}' → '{candidate.get('name')}' ({method}, {score:.2f})")
+
+        # Records of different sources resolved to one company (satellog in one, name in
+        # the other) are merged into one write with the same precedence as merge_records
+        by_company = {}
+        for i, existing_company in enumerate(resolved):
+            if existing_company:
+                by_company.setdefault(existing_company['id'], []).append(i)
 
-        for idx, row in df.iterrows():
-            # Get the raw satellog value
-            if satellog_col:
-                satellog_value = str(row[satellog_col]).strip()
-            else:
-                satellog_value = str(row[identifier_col]).strip()
-
-            # Get display name
-            if name_col:
-                identifier = str(row[name_col]).strip()
-                if not identifier or identifier == 'nan':
-                    identifier = satellog_value
-            else:
-                identifier = satellog_value
-
-            if not satellog_value or satellog_value == 'nan':
-                self.stats['skipped'] += 1
+        collapsed = set()
+        for indices in by_company.values():
+            if len(indices) < 2:
+                continue
+            existing_company = resolved[indices[0]]
+            satellogs = {records[i][0] for i in indices}
+            identifier, company_data = combine_parts([part for i in indices for part in records[i][3]])
+            if existing_company.get('satellog') in satellogs:
+                # Keep the satellog the company is already matched on
+                company_data['satellog'] = existing_company['satellog']
+            records[indices[0]] = (company_data['satellog'], identifier, company_data, None)
+            collapsed.update(indices[1:])
+            self.stats['merged_rows'] += len(indices) - 1
+
+        for i, (satellog_value, identifier, company_data, parts) in enumerate(records):
+            if i in collapsed:
                 continue
+            existing_company = resolved[i]
 
-            # Check if company exists - match by satellog (raw value) or name
-            existing_company = existing['by_satellog'].get(satellog_value) or existing['by_name'].get(identifier)
+            # A fuzzy match must not rewrite the satellog another row may still match on
+            if i in fuzzy and existing_company.get('satellog') and existing_company['satellog'] != satellog_value:
+                company_data.pop('satellog', None)
 
-            company_data = self.build_company_data(row.to_dict(), identifier, satellog_value)
+            company_data['sync_fingerprint'] = fingerprint(company_data)
 
             if existing_company:
-                # Update existing
+                # Same Excel data as last sync - nothing to write
+                if existing_company.fingerprint == company_data['sync_fingerprint']:
+                    self.stats['unchanged'] += 1
+                    continue
+
+                # Update existing (extra_data is attached below in one batch)
                 to_update.append({
                     'id': existing_company['id'],
                     'data': company_data,
-                    'existing_extra_data': existing_company.get('extra_data', {})
+                    'record': existing_company
                 })
             else:
                 # Create new
                 to_create.append(company_data)
 
+        # Only changed companies need their extra_data blob
+        if to_update:
+            existing['registry'].load_extra_data([update['record'] for update in to_update])
+            for update in to_update:
+                record = update.pop('record')
+                update['existing_extra_data'] = record.extra_data
+                update['events'] = detect_company_changes(record, update['data'])
+                record.release_extra_data()
+
         self.stats['updates'] = len(to_update)
         self.stats['creates'] = len(to_create)
 
         print(f"   📊 To Update: {len(to_update)}")
         print(f"   📊 To Create: {len(to_create)}")
+        print(f"   📊 Unchanged: {self.stats['unchanged']}")
         print(f"   📊 Skipped: {self.stats['skipped']}")
+        print(f"   📊 Merged Duplicates: {self.stats['merged_rows']}")
+        print(f"   📊 Fuzzy Name Matches: {self.stats['fuzzy_matches']}")
 
         return {'updates': to_update, 'creates': to_create}
 
@@ -298,6 +501,7 @@ class ExcelToPostgresSync:
 
         success = 0
         failed = 0
+        events = []
 
         for update in updates:
             company_id = update['id']
@@ -312,6 +516,7 @@ class ExcelToPostgresSync:
                 data['last_synced_at'] = datetime.now().isoformat()
                 self.supabase.table('companies').update(data).eq('id', company_id).execute()
                 success += 1
+                events.extend((company_id, event_type, payload) for event_type, payload in update.get('events', []))
 
                 if success % 100 == 0:
                     print(f"   ✅ Updated {success}/{len(updates)} companies...")
@@ -325,6 +530,8 @@ class ExcelToPostgresSync:
         if failed > 0:
             print(f"   ❌ Failed: {failed}")
 
+        self.emit_events(events)
+
         return success
 
     def create_companies(self, creates):
@@ -337,8 +544,14 @@ class ExcelToPostgresSync:
 
         try:
             # Batch insert
-            self.supabase.table('companies').insert(creates).execute()
+            response = self.supabase.table('companies').insert(creates).execute()
             print(f"   ✅ Created {len(creates)} companies")
+
+            self.emit_events([
+                (company['id'], EVENT_CREATED, {'ticker': (company.get('extra_data') or {}).get('Ticker')})
+                for company in response.data
+            ])
+
             return len(creates)
 
         except Exception as e:
@@ -346,6 +559,18 @@ class ExcelToPostgresSync:
             self.stats['errors'] += len(creates)
             return 0
 
+    def emit_events(self, events):
+        """Write change events to the outbox for downstream jobs"""
+        if not events:
+            return
+
+        try:
+            self.stats['events'] += self.outbox.emit(events)
+            print(f"   📨 Emitted {len(events)} change events")
+        except Exception as e:
+            print(f"   ⚠️  Failed to emit change events: {e}")
+            self.stats['errors'] += 1
+
     def run(self):
         """Run the sync"""
         self.stats['start_time'] = datetime.now()
@@ -355,27 +580,37 @@ class ExcelToPostgresSync:
         print(f"Started at: {self.stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}")
 
         try:
-            # 1. Download and parse Excel
-            df = self.download_and_parse()
-            if df is None:
-                raise Exception("Failed to download/parse Excel")
-
-            # 2. Get existing companies
-            existing = self.get_existing_companies()
+            # 1. Download all workbooks, parse/map their sheets in parallel
+            with self.profiler.stage('download_sources'):
+                contents = self.download_sources()
+            with self.profiler.stage('parse_sources'):
+                sheets = self.parse_sources(contents)
+
+            # 2. One record per satellog (source precedence)
+            with self.profiler.stage('merge_records'):
+                records = merge_records(sheets)
+            self.stats['merged_rows'] = sum(len(sheet['rows']) for sheet in sheets) - len(records)
+
+            # 3. Get existing companies
+            with self.profiler.stage('get_existing_companies'):
+                existing = self.get_existing_companies()
             if existing is None:
                 raise Exception("Failed to get existing companies")
 
-            # 3. Compare and prepare sync
-            sync_data = self.compare_and_sync(df, existing)
+            # 4. Compare and prepare sync
+            with self.profiler.stage('compare_and_sync'):
+                sync_data = self.compare_and_sync(records, existing)
 
-            # 4. Update existing companies
+            # 5. Update existing companies
             if sync_data['updates']:
-                updated = self.update_companies(sync_data['updates'])
+                with self.profiler.stage('update_companies'):
+                    updated = self.update_companies(sync_data['updates'])
                 self.stats['updates'] = updated
 
-            # 5. Create new companies
+            # 6. Create new companies
             if sync_data['creates']:
-                created = self.create_companies(sync_data['creates'])
+                with self.profiler.stage('create_companies'):
+                    created = self.create_companies(sync_data['creates'])
                 self.stats['creates'] = created
 
             self.stats['success'] = True
@@ -395,21 +630,37 @@ class ExcelToPostgresSync:
             print("📊 SYNC STATISTICS")
             print("=" * 60)
             print(f"Duration: {duration:.1f}s")
+            print(f"Sources: {self.stats['sources']} ({self.stats['sheets']} sheets)")
             print(f"Excel Rows: {self.stats['excel_rows']}")
             print(f"Excel Columns: {self.stats['excel_columns']}")
+            print(f"Merged Duplicates: {self.stats['merged_rows']}")
             print(f"DB Companies (before): {self.stats['db_companies']}")
             print(f"Updates: {self.stats['updates']}")
             print(f"Creates: {self.stats['creates']}")
+            print(f"Unchanged: {self.stats['unchanged']}")
             print(f"Skipped: {self.stats['skipped']}")
+            print(f"Fuzzy Name Matches: {self.stats['fuzzy_matches']}")
+            print(f"Change Events: {self.stats['events']}")
             print(f"Errors: {self.stats['errors']}")
+            get_client().print_metrics()
             print(f"Status: {'✅ SUCCESS' if self.stats['success'] else '❌ FAILED'}")
             if self.stats['error_message']:
                 print(f"Error: {self.stats['error_message']}")
             print("=" * 60)
 
+            self.profiler.write_reports()
+
             return self.stats['success']
 
 if __name__ == '__main__':
-    sync = ExcelToPostgresSync()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Sync companies from the Dropbox Excel to PostgreSQL')
+    parser.add_argument('--profile', action='store_true', help='Write per-stage CPU/memory profiles (see job_profiler.py)')
+    parser.add_argument('--sources', help='JSON file with the workbooks/sheets to sync (default: SYNC_SOURCES, else DROPBOX_URL)')
+    parser.add_argument('--workers', type=int, help='Processes for parsing sheets (default: CPU count)')
+    args = parser.parse_args()
+
+    sync = ExcelToPostgresSync(profile=args.profile or None, sources=args.sources, workers=args.workers)
     success = sync.run()
     sys.exit(0 if success else 1)
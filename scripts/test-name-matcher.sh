@@ -0,0 +1,69 @@
+#!/bin/bash
+# Test the company name matcher used by the Excel sync (no database needed)
+#
+# Usage: ./scripts/test-name-matcher.sh
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+# Colors
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+BLUE='\033[0;34m'
+NC='\033[0m' # No Color
+
+echo -e "${BLUE}╔════════════════════════════════════════╗${NC}"
+echo -e "${BLUE}║  Name Matcher - Match Pairs Test      ║${NC}"
+echo -e "${BLUE}╚════════════════════════════════════════╝${NC}"
+echo ""
+
+cd "$SCRIPT_DIR"
+
+if python3 - <<'EOF'
+from name_matcher import NameMatcher
+
+# (existing company, Excel name, should match)
+PAIRS = [
+    # Different share class/series - never the same company row
+    ('Berkshire Hathaway A', 'Berkshire Hathaway B', False),
+    ('Samsung Electronics', 'Samsung Electronics Pref', False),
+    ('Volkswagen AG', 'Volkswagen AG Vz', False),
+    ('Alphabet Inc Class A', 'Alphabet Inc Class C', False),
+    ('Porsche Automobil Holding SE', 'Porsche Automobil Holding SE 2', False),
+    # Different companies with similar spelling
+    ('Deutsche Bank AG', 'Deutsche Bahn AG', False),
+    # Same company, only legal form/punctuation/umlauts differ
+    ('Siemens AG', 'Siemens', True),
+    ('Apple Inc.', 'Apple', True),
+    ('Müller AG', 'MUELLER', True),
+    ('Rheinmetall AG', 'Rheinmetall Aktiengesellschaft', True),
+    ('Microsoft Corporation', 'Microsoft Corp', True),
+]
+
+failed = 0
+for existing, name, expected in PAIRS:
+    company, score, method = NameMatcher([{'id': 1, 'name': existing}]).match(name)
+    ok = (company is not None) == expected
+    failed += not ok
+    print(f"   {'✅' if ok else '❌'} {name!r} -> {existing!r}: "
+          f"{'match' if company else 'no match'} ({method or '-'}, {score:.2f})")
+
+# Both classes listed: each name must resolve to its own row
+both = NameMatcher([{'id': 'A', 'name': 'Berkshire Hathaway A'}, {'id': 'B', 'name': 'Berkshire Hathaway B'}])
+for name, expected_id in (('Berkshire Hathaway A', 'A'), ('BERKSHIRE HATHAWAY B', 'B'), ('Berkshire Hathaway', None)):
+    company, _, _ = both.match(name)
+    ok = (company or {}).get('id') == expected_id
+    failed += not ok
+    print(f"   {'✅' if ok else '❌'} {name!r} -> {expected_id or 'no match'}")
+
+raise SystemExit(1 if failed else 0)
+EOF
+then
+    echo ""
+    echo -e "${GREEN}✅ All name matcher pairs passed${NC}"
+else
+    echo ""
+    echo -e "${RED}❌ Name matcher pairs failed${NC}"
+    exit 1
+fi
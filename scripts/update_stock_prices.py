@@ -1,17 +1,31 @@
 #!/usr/bin/env python3
 """
 Stock Price Updater for PostgreSQL
-Uses Alpha Vantage API (free tier: 5 calls/min, 500 calls/day)
+Quotes come from every configured provider (Alpha Vantage, Finnhub, Twelve
+Data, Polygon), routed per exchange and metered by a shared quota ledger
+(see quote_providers.py)
 
 Simplified version - updates companies with ticker symbols
+
+Tickers come from price_update_schedule, which is kept in sync with the
+change events emitted by the Excel sync (see change_events.py)
+
+Only tickers whose market has traded since their last Price_Update are
+fetched (see exchange_calendar.py), so runs outside a market's session or on
+its holidays don't use quota
+
+Quotes that haven't moved (within --price-tolerance/--volume-tolerance) are
+not written back to extra_data; only companies.price_checked_at is set, so
+weekends and illiquid names don't rewrite the JSONB blob on every run
 """
 
 import os
-import requests
+import contextlib
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import time
 import sys
+import threading
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -25,53 +39,297 @@ except ImportError:
     os.system(f"{sys.executable} -m pip install supabase")
     from supabase import create_client, Client
 
+from change_events import ChangeEventConsumer, ChangeEventOutbox, EVENT_CREATED, EVENT_TICKER_CHANGED
+from company_registry import CompanyRegistry, CompanyRecord
+from job_profiler import JobProfiler
+from http_client import get_client
+from exchange_calendar import calendar_for, parse_timestamp
+from quote_providers import QuoteRouter, QuotaExhausted
+
+CONSUMER_NAME = 'update_stock_prices'
+
+# Rows per PostgREST request (in() filters / upserts)
+CHUNK_SIZE = 200
+
+# pg_advisory_lock key serializing price_update_schedule writers (workers rebuild/apply concurrently)
+SCHEDULE_LOCK_KEY = 724_310_129
+
+# Longest quota wait to sit out in-process; beyond that the run stops
+MAX_QUOTA_WAIT = 60
+
+# Relative change below which a quote counts as unchanged (0.05% price/range, 2% volume)
+PRICE_TOLERANCE = 0.0005
+VOLUME_TOLERANCE = 0.02
+
+# Unchanged quotes still rewrite extra_data once Price_Update is this old (UI "Last updated")
+PRICE_REWRITE_MAX_AGE = timedelta(hours=24)
+
+
+def is_valid_ticker(ticker):
+    """Whether an extra_data Ticker value is usable"""
+    return bool(ticker and str(ticker).strip() and ticker != '-')
+
+
+class ThreadLocalClient:
+    """
+    Supabase client with one underlying client per thread
+
+    supabase-py keeps auth headers and the httpx connection pool on the
+    client, which is not documented as safe to share between threads, and
+    price_refresh_server.py calls the updater from its handler threads.
+    """
+
+    def __init__(self, url, key):
+        self.url = url
+        self.key = key
+        self.local = threading.local()
+
+    def client(self):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = create_client(self.url, self.key)
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.client(), name)
+
+
 class StockPriceUpdater:
-    def __init__(self, limit=100):
+    def __init__(self, limit=100, full=False, profile=None, ignore_calendar=False,
+                 price_tolerance=PRICE_TOLERANCE, volume_tolerance=VOLUME_TOLERANCE):
         self.supabase_url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
-        self.alpha_vantage_key = os.getenv('ALPHA_VANTAGE_API_KEY')
 
-        if not all([self.supabase_url, self.supabase_key, self.alpha_vantage_key]):
+        if not all([self.supabase_url, self.supabase_key]):
             raise ValueError("Missing environment variables")
 
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        self.supabase = ThreadLocalClient(self.supabase_url, self.supabase_key)
+        self.router = QuoteRouter(self.supabase)
+        if not self.router.providers:
+            raise ValueError("No quote provider configured (set ALPHA_VANTAGE_API_KEY, FINNHUB_API_KEY, "
+                             "TWELVE_DATA_API_KEY or POLYGON_API_KEY)")
+        self.retry_after = None  # Seconds until a provider has budget again (after 'RATE_LIMIT')
+        self.updated_ids = []  # Companies with a new price since the last valuation refresh
+        self.updated_lock = threading.Lock()  # store_price runs on several threads in price_refresh_server.py
         self.limit = limit  # Limit number of companies to update (free tier limit)
+        self.full = full  # Rebuild the schedule instead of applying change events
+        self.ignore_calendar = ignore_calendar  # Fetch even if the market hasn't traded since the last update
+        self.price_tolerance = price_tolerance  # Relative change of price/day range that counts as a move
+        self.volume_tolerance = volume_tolerance  # Relative change of volume that counts as a move
+        self.profiler = JobProfiler('update_stock_prices', enabled=profile)
 
         # Stats
         self.stats = {
             'start_time': None,
             'end_time': None,
+            'schedule_changes': 0,
             'companies_found': 0,
+            'market_closed': 0,
             'companies_processed': 0,
             'companies_updated': 0,
+            'companies_unchanged': 0,
             'companies_skipped': 0,
             'companies_failed': 0,
+            'valuation_refreshes': 0,
+            'leases_lost': 0,
             'api_calls': 0,
             'success': False,
             'error_message': None
         }
 
+    def scan_tickers(self, company_ids=None):
+        """Get (id, name, ticker) for all companies with a Ticker, or only for company_ids"""
+        columns = 'id, name, ticker:extra_data->>Ticker'
+
+        if company_ids is not None:
+            rows = []
+            for i in range(0, len(company_ids), CHUNK_SIZE):
+                response = self.supabase.table('companies')\
+                    .select(columns)\
+                    .in_('id', company_ids[i:i + CHUNK_SIZE])\
+                    .execute()
+                rows.extend(response.data)
+            return rows
+
+        # Full scan (paginate past Supabase 1000-row default limit)
+        rows = []
+        page_size = 1000
+        offset = 0
+        while True:
+            batch = self.supabase.table('companies')\
+                .select(columns)\
+                .neq('extra_data->>Ticker', 'null')\
+                .order('id')\
+                .range(offset, offset + page_size - 1)\
+                .execute().data
+            rows.extend(batch)
+            if len(batch) < page_size:
+                return rows
+            offset += page_size
+
+    @contextlib.contextmanager
+    def schedule_lock(self):
+        """
+        Hold the schedule advisory lock (needs DATABASE_URL)
+
+        The rebuild drops every row it didn't touch, so no other worker may
+        write the schedule between its upserts and its delete.
+        """
+        if not os.getenv('DATABASE_URL'):
+            yield
+            return
+
+        from pg_connection import get_connection
+        conn = get_connection(autocommit=True)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(%s)", (SCHEDULE_LOCK_KEY,))
+            yield
+        finally:
+            # Closing the session releases the lock as well
+            conn.close()
+
+    def apply_schedule(self, rows, rebuild=False):
+        """Upsert valid tickers into price_update_schedule and drop the rest (call under schedule_lock)"""
+        now = datetime.now(timezone.utc).isoformat()
+        scheduled = [
+            {'company_id': row['id'], 'name': row.get('name') or 'Unknown', 'ticker': str(row['ticker']).strip(), 'updated_at': now}
+            for row in rows if is_valid_ticker(row.get('ticker'))
+        ]
+        scheduled_ids = {row['company_id'] for row in scheduled}
+
+        for i in range(0, len(scheduled), CHUNK_SIZE):
+            self.supabase.table('price_update_schedule').upsert(scheduled[i:i + CHUNK_SIZE]).execute()
+
+        if rebuild:
+            # Anything scheduled but not in this full scan lost its ticker (no other writer runs under the lock)
+            unscheduled = [row['company_id'] for row in self.load_schedule() if row['company_id'] not in scheduled_ids]
+        else:
+            unscheduled = [row['id'] for row in rows if row['id'] not in scheduled_ids]
+
+        for i in range(0, len(unscheduled), CHUNK_SIZE):
+            self.supabase.table('price_update_schedule')\
+                .delete()\
+                .in_('company_id', unscheduled[i:i + CHUNK_SIZE])\
+                .execute()
+
+        return len(scheduled) + len(unscheduled)
+
+    def sync_schedule(self):
+        """Bring price_update_schedule up to date with the change events since the last run (call under schedule_lock)"""
+        consumer = ChangeEventConsumer(self.supabase, CONSUMER_NAME)
+        cursor = None if self.full else consumer.get_cursor()
+
+        if cursor is None:
+            print("\n🗓️  Rebuilding price schedule (full scan)...")
+            last_event_id = ChangeEventOutbox(self.supabase).latest_event_id()
+            changes = self.apply_schedule(self.scan_tickers(), rebuild=True)
+        else:
+            print(f"\n🗓️  Applying change events after #{cursor} to price schedule...")
+            events = consumer.poll(cursor)
+            if not events:
+                print("   ✅ No changes since last run")
+                return
+
+            last_event_id = events[-1]['id']
+            company_ids = list(dict.fromkeys(
+                event['company_id'] for event in events
+                if event['event_type'] in (EVENT_CREATED, EVENT_TICKER_CHANGED)
+            ))
+            changes = self.apply_schedule(self.scan_tickers(company_ids)) if company_ids else 0
+
+        consumer.ack(last_event_id)
+        self.stats['schedule_changes'] = changes
+        print(f"   ✅ {changes} schedule entries updated")
+
+    def fetch_companies(self, company_ids):
+        """Get company records (with extra_data, needed for the merge on write) by id"""
+        registry = CompanyRegistry.load(self.supabase, company_ids=company_ids, with_extra_data=True)
+        return registry.records
+
+    def calendar_for_company(self, company):
+        """Exchange calendar of a company (ticker suffix, then exchange name)"""
+        if isinstance(company, CompanyRecord):
+            extra_data = company.extra_data or {}
+            return calendar_for(extra_data.get('Ticker'), extra_data.get('Exchange'))
+        return calendar_for(company.get('ticker'), company.get('exchange') or company.get('listing'))
+
+    def last_checked(self, company):
+        """Latest of Price_Update and price_checked_at (None if never fetched)"""
+        if isinstance(company, CompanyRecord):
+            timestamps = [(company.extra_data or {}).get('Price_Update'), company.price_checked_at]
+        else:
+            timestamps = [company.get('price_update'), company.get('price_checked_at')]
+        timestamps = [ts for ts in map(parse_timestamp, timestamps) if ts]
+        return max(timestamps) if timestamps else None
+
+    def is_due(self, company, now):
+        """Whether the company's market has traded since its last quote fetch"""
+        if self.ignore_calendar:
+            return True
+        return self.calendar_for_company(company).has_traded_since(self.last_checked(company), now)
+
+    def load_schedule(self):
+        """All price_update_schedule rows (company_id, ticker)"""
+        schedule = []
+        page_size = 1000
+        offset = 0
+        while True:
+            batch = self.supabase.table('price_update_schedule')\
+                .select('company_id, ticker')\
+                .order('company_id')\
+                .range(offset, offset + page_size - 1)\
+                .execute().data
+            schedule.extend(batch)
+            if len(batch) < page_size:
+                break
+            offset += page_size
+        return schedule
+
+    def select_due_companies(self):
+        """Scheduled company ids whose market traded since their last update, stalest first"""
+        tickers = {row['company_id']: row['ticker'] for row in self.load_schedule()}
+        company_ids = list(tickers)
+        columns = 'id, exchange, price_checked_at, listing:extra_data->>Exchange, price_update:extra_data->>Price_Update'
+
+        now = datetime.now(timezone.utc)
+        due = []
+        for i in range(0, len(company_ids), CHUNK_SIZE):
+            rows = self.supabase.table('companies')\
+                .select(columns)\
+                .in_('id', company_ids[i:i + CHUNK_SIZE])\
+                .execute().data
+            for row in rows:
+                row['ticker'] = tickers.get(row['id'])
+                if self.is_due(row, now):
+                    due.append(row)
+                else:
+                    self.stats['market_closed'] += 1
+
+        epoch = datetime.min.replace(tzinfo=timezone.utc)
+        due.sort(key=lambda row: self.last_checked(row) or epoch)
+
+        print(f"   ✅ {len(due)} due, {self.stats['market_closed']} skipped (market not traded since last update)")
+        return [row['id'] for row in due[:self.limit]]
+
     def get_companies_with_tickers(self):
-        """Get companies that have ticker symbols in extra_data"""
+        """Get due scheduled companies with their current extra_data"""
         print("\n📊 Getting companies with ticker symbols...")
 
         try:
-            # Get companies with Ticker in extra_data
-            response = self.supabase.table('companies')\
-                .select('id, name, symbol, extra_data')\
-                .neq('extra_data->>Ticker', 'null')\
-                .limit(self.limit)\
-                .execute()
+            with self.schedule_lock():
+                self.sync_schedule()
 
-            companies = response.data
+            company_ids = self.select_due_companies()
+
+            companies = self.fetch_companies(company_ids)
             self.stats['companies_found'] = len(companies)
 
             # Filter for companies that actually have a non-empty ticker
-            companies_with_tickers = []
-            for company in companies:
-                ticker = company.get('extra_data', {}).get('Ticker')
-                if ticker and str(ticker).strip() and ticker != '-':
-                    companies_with_tickers.append(company)
+            companies_with_tickers = [
+                company for company in companies
+                if is_valid_ticker((company.get('extra_data') or {}).get('Ticker'))
+            ]
 
             print(f"   ✅ Found {len(companies_with_tickers)} companies with valid tickers (out of {len(companies)} total)")
 
@@ -82,78 +340,54 @@ class StockPriceUpdater:
             self.stats['error_message'] = str(e)
             return []
 
-    def normalize_ticker(self, ticker):
-        """Normalize ticker symbol for Alpha Vantage"""
-        if not ticker:
-            return None
-
-        ticker = str(ticker).strip().upper()
-
-        # Remove common suffixes for international markets (Alpha Vantage uses US symbols)
-        if ticker.endswith('.DE'):
-            ticker = ticker[:-3]
-        elif ticker.endswith('.F'):
-            ticker = ticker[:-2]
-
-        # Skip if too long or contains spaces
-        if len(ticker) > 10 or ' ' in ticker:
-            return None
-
-        return ticker
-
-    def fetch_stock_price(self, ticker):
-        """Fetch stock price from Alpha Vantage API"""
-        ticker = self.normalize_ticker(ticker)
-        if not ticker:
-            return None
-
+    def fetch_stock_price(self, ticker, exchange):
+        """Fetch a quote from the best provider with budget left for the exchange"""
         try:
-            url = f"https://www.alphavantage.co/query"
-            params = {
-                'function': 'GLOBAL_QUOTE',
-                'symbol': ticker,
-                'apikey': self.alpha_vantage_key
-            }
-
-            response = requests.get(url, params=params, timeout=10)
-            self.stats['api_calls'] += 1
-
-            if response.status_code != 200:
-                return None
-
-            data = response.json()
-
-            # Check for rate limit message
-            if 'Note' in data:
-                print(f"   ⚠️  Rate limit reached: {data['Note']}")
-                return 'RATE_LIMIT'
+            price_data, provider = self.router.fetch(ticker, exchange)
+        except QuotaExhausted as e:
+            self.retry_after = e.retry_after
+            return 'RATE_LIMIT'
+        finally:
+            self.stats['api_calls'] = self.router.total_calls
 
-            # Check for error message
-            if 'Error Message' in data:
-                return None
+        if price_data:
+            price_data['Price_Source'] = provider
+        return price_data
 
-            quote = data.get('Global Quote', {})
+    def moved(self, new, old, tolerance):
+        """Whether a numeric field changed by more than the relative tolerance"""
+        try:
+            new, old = float(new), float(old)
+        except (TypeError, ValueError):
+            return new != old
+        return abs(new - old) > tolerance * max(abs(old), 1e-9)
+
+    def is_unchanged(self, price_data, existing_extra_data):
+        """Whether the quote matches the stored one within tolerance (and isn't due for a rewrite)"""
+        last_update = parse_timestamp(existing_extra_data.get('Price_Update'))
+        if not last_update or datetime.now(timezone.utc) - last_update > PRICE_REWRITE_MAX_AGE:
+            return False
 
-            if not quote:
-                return None
+        for field in ('Current_Price', 'Day_High', 'Day_Low'):
+            if field in price_data and self.moved(price_data[field], existing_extra_data.get(field), self.price_tolerance):
+                return False
+        if 'Volume' in price_data and self.moved(price_data['Volume'], existing_extra_data.get('Volume'), self.volume_tolerance):
+            return False
 
-            # Extract price data
-            price_data = {
-                'Current_Price': float(quote.get('05. price', 0)),
-                'Day_High': float(quote.get('03. high', 0)),
-                'Day_Low': float(quote.get('04. low', 0)),
-                'Volume': int(float(quote.get('06. volume', 0))),
-                'Price_Change_Percent': float(quote.get('10. change percent', '0%').rstrip('%')),
-                'Price_Update': datetime.now().isoformat(),
-                'Currency': 'USD',  # Alpha Vantage returns USD prices
-                'Market_Status': '🟢 Open' if quote.get('05. price') else '🔴 Closed'
-            }
+        return all(price_data.get(field) == existing_extra_data.get(field) for field in ('Currency', 'Market_Status'))
 
-            return price_data
+    def touch_price_checked(self, company_id):
+        """Record the fetch without rewriting extra_data"""
+        try:
+            self.supabase.table('companies')\
+                .update({'price_checked_at': datetime.now(timezone.utc).isoformat()})\
+                .eq('id', company_id)\
+                .execute()
+            return True
 
         except Exception as e:
-            print(f"   ❌ Error fetching {ticker}: {e}")
-            return None
+            print(f"   ❌ Error updating company: {e}")
+            return False
 
     def update_company_price(self, company_id, price_data, existing_extra_data):
         """Update company price in PostgreSQL"""
@@ -165,7 +399,8 @@ class StockPriceUpdater:
             # Also update current_price column
             update_data = {
                 'extra_data': updated_extra_data,
-                'current_price': price_data.get('Current_Price')
+                'current_price': price_data.get('Current_Price'),
+                'price_checked_at': price_data['Price_Update'],
             }
 
             self.supabase.table('companies')\
@@ -187,58 +422,156 @@ class StockPriceUpdater:
         print("=" * 60)
         print(f"Started at: {self.stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"Update limit: {self.limit} companies")
-        print(f"API: Alpha Vantage (Free tier: 5 calls/min, 500/day)")
+        print(f"Providers: {', '.join(p.name for p in self.router.providers)}")
 
         try:
             # 1. Get companies with tickers
-            companies = self.get_companies_with_tickers()
+            with self.profiler.stage('get_companies_with_tickers'):
+                companies = self.get_companies_with_tickers()
 
             if not companies:
                 print("\n⚠️  No companies with tickers found")
                 self.stats['success'] = True
                 return True
 
-            print(f"\n🔄 Processing {len(companies)} companies...")
-            print("   (Rate limited to 5 calls/minute)\n")
+            print(f"\n🔄 Processing {len(companies)} companies...\n")
 
-            # 2. Update prices
-            for i, company in enumerate(companies):
-                self.stats['companies_processed'] += 1
+            # 2. Update prices (the quota ledger decides when to wait)
+            i = 0
+            while i < len(companies):
+                with self.profiler.stage('process_company'):
+                    status = self.process_company(companies[i], f"[{i+1}/{len(companies)}]")
 
-                company_name = company.get('name', 'Unknown')
-                ticker = company.get('extra_data', {}).get('Ticker')
+                if status == 'RATE_LIMIT':
+                    if self.retry_after > MAX_QUOTA_WAIT:
+                        print(f"⚠️  RATE LIMIT - all providers exhausted for {self.retry_after / 3600:.1f}h, stopping")
+                        break
+                    print(f"   ⏳ Waiting {self.retry_after:.0f}s for provider quota...")
+                    time.sleep(self.retry_after)
+                    continue
 
-                print(f"   [{i+1}/{len(companies)}] {company_name} ({ticker})... ", end='', flush=True)
+                i += 1
 
-                # Fetch price
-                price_data = self.fetch_stock_price(ticker)
+            # 3. Revalue portfolios/watchlists holding the updated companies
+            with self.profiler.stage('refresh_valuations'):
+                self.refresh_valuations()
 
-                if price_data == 'RATE_LIMIT':
-                    print("⚠️  RATE LIMIT - Stopping")
-                    break
+            self.stats['success'] = True
+            print("\n" + "=" * 60)
+            print("✅ PRICE UPDATE COMPLETED")
 
-                if price_data:
-                    # Update in database
-                    success = self.update_company_price(
-                        company['id'],
-                        price_data,
-                        company.get('extra_data', {})
-                    )
-
-                    if success:
-                        print(f"✅ ${price_data.get('Current_Price', 0):.2f}")
-                        self.stats['companies_updated'] += 1
-                    else:
-                        print("❌ Failed to update")
-                        self.stats['companies_failed'] += 1
-                else:
-                    print("⏭️  Skipped (no data)")
-                    self.stats['companies_skipped'] += 1
+        except Exception as e:
+            print(f"\n❌ PRICE UPDATE FAILED: {e}")
+            self.stats['success'] = False
+            self.stats['error_message'] = str(e)
+
+        finally:
+            self.print_stats()
+            self.profiler.write_reports()
+
+        return self.stats['success']
+
+    def run_worker(self, forever=False, batch_size=5, poll_interval=60):
+        """
+        Consume the shared price_fetch_queue instead of a fixed list
+
+        Several workers (containers) can run this at once: each claims its own
+        batch with SKIP LOCKED, and jobs of a crashed worker are picked up
+        again once their lease expires (see price_queue.py).
+
+        Args:
+            forever: Keep polling for due jobs instead of exiting when drained
+            batch_size: Jobs claimed per round trip (= calls per rate-limit minute)
+            poll_interval: Seconds to wait between polls when idle
+        """
+        from price_queue import PriceFetchQueue, make_worker_id
+
+        self.stats['start_time'] = datetime.now()
+        worker_id = make_worker_id()
+        print("=" * 60)
+        print("💰 STOCK PRICE UPDATER (QUEUE WORKER)")
+        print("=" * 60)
+        print(f"Started at: {self.stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Worker: {worker_id}")
+        print(f"Mode: {'FOREVER' if forever else 'DRAIN'}")
 
-                # Rate limiting: 5 calls per minute = 12 seconds between calls
-                if self.stats['api_calls'] % 5 == 0 and i < len(companies) - 1:
-                    print("   ⏳ Waiting 60s for rate limit...")
-                    time.sleep(60)
+        try:
+            queue = PriceFetchQueue()
+
+            while True:
+                # 1. Pick up schedule changes (workers take turns; the next one finds the cursor acked)
+                with self.profiler.stage('sync_schedule'), self.schedule_lock():
+                    self.sync_schedule()
+                    queue.enqueue_from_schedule()
+
+                # 2. Claim and process due jobs
+                while True:
+                    jobs = queue.claim(worker_id, batch_size)
+                    if not jobs:
+                        break
+
+                    self.stats['companies_found'] += len(jobs)
+                    with self.profiler.stage('fetch_companies'):
+                        companies = {c['id']: c for c in self.fetch_companies([job['company_id'] for job in jobs])}
+                    rate_limited = False
+
+                    for job in jobs:
+                        company = companies.get(job['company_id'])
+
+                        if rate_limited or company is None:
+                            # Hand back untouched jobs right away instead of waiting for the lease
+                            queue.release(job, int(self.retry_after) if rate_limited else 0)
+                            continue
+
+                        now = datetime.now(timezone.utc)
+                        if not self.is_due(company, now):
+                            # Nothing new to fetch before the market opens again
+                            next_open = self.calendar_for_company(company).next_open(now)
+                            queue.release(job, max(60, int((next_open - now).total_seconds())))
+                            self.stats['market_closed'] += 1
+                            continue
+
+                        # Earlier jobs of the batch may have used up the claim lease:
+                        # renew it before fetching, skip jobs another worker re-claimed
+                        if not queue.extend_lease(job):
+                            print(f"   ⚠️  Lease lost for {company['name']} - skipping")
+                            self.stats['leases_lost'] += 1
+                            continue
+
+                        with self.profiler.stage('process_company'):
+                            status = self.process_company(company, f"[{job['attempts']}x]")
+
+                        if status == 'RATE_LIMIT':
+                            print(f"⚠️  RATE LIMIT - Releasing batch for {self.retry_after:.0f}s")
+                            acked = queue.release(job, int(self.retry_after), 'rate limit')
+                            rate_limited = True
+                        elif status == 'failed':
+                            acked = queue.fail(job, 'update failed')
+                        else:
+                            acked = queue.complete(job)
+
+                        if not acked:
+                            # Lease token is stale: the job belongs to another worker now
+                            print(f"   ⚠️  Lease lost for {company['name']} - not acknowledged")
+                            self.stats['leases_lost'] += 1
+
+                    # Revalue portfolios/watchlists holding this batch's companies
+                    with self.profiler.stage('refresh_valuations'):
+                        self.refresh_valuations()
+
+                    # Providers exhausted: sit out short windows, otherwise stop claiming
+                    if rate_limited:
+                        if self.retry_after > MAX_QUOTA_WAIT and not forever:
+                            break
+                        wait = min(self.retry_after, poll_interval if forever else MAX_QUOTA_WAIT)
+                        print(f"   ⏳ Waiting {wait:.0f}s for provider quota...")
+                        time.sleep(wait)
+
+                if not forever:
+                    break
+                # Long-running workers: keep the profiles on disk current
+                self.profiler.write_reports()
+                time.sleep(poll_interval)
 
             self.stats['success'] = True
             print("\n" + "=" * 60)
@@ -250,33 +583,134 @@ class StockPriceUpdater:
             self.stats['error_message'] = str(e)
 
         finally:
-            self.stats['end_time'] = datetime.now()
-            duration = (self.stats['end_time'] - self.stats['start_time']).total_seconds()
-
-            print("=" * 60)
-            print("📊 UPDATE STATISTICS")
-            print("=" * 60)
-            print(f"Duration: {duration:.1f}s")
-            print(f"Companies Found: {self.stats['companies_found']}")
-            print(f"Companies Processed: {self.stats['companies_processed']}")
-            print(f"Companies Updated: {self.stats['companies_updated']}")
-            print(f"Companies Skipped: {self.stats['companies_skipped']}")
-            print(f"Companies Failed: {self.stats['companies_failed']}")
-            print(f"API Calls: {self.stats['api_calls']}")
-            print(f"Status: {'✅ SUCCESS' if self.stats['success'] else '❌ FAILED'}")
-            if self.stats['error_message']:
-                print(f"Error: {self.stats['error_message']}")
-            print("=" * 60)
-
-            return self.stats['success']
+            self.print_stats()
+            self.profiler.write_reports()
+
+        return self.stats['success']
+
+    def process_company(self, company, label):
+        """
+        Fetch and store the price for one company
+
+        Returns: 'updated', 'unchanged', 'skipped', 'failed' or 'RATE_LIMIT'
+        """
+        self.stats['companies_processed'] += 1
+
+        company_name = company.get('name', 'Unknown')
+        ticker = company.get('extra_data', {}).get('Ticker')
+        calendar = self.calendar_for_company(company)
+
+        print(f"   {label} {company_name} ({ticker})... ", end='', flush=True)
+
+        # Fetch price
+        price_data = self.fetch_stock_price(ticker, calendar.code)
+
+        if price_data == 'RATE_LIMIT':
+            # Not processed: the company is retried once a provider has budget again
+            print("⏳ Quota exhausted")
+            self.stats['companies_processed'] -= 1
+            return 'RATE_LIMIT'
+
+        if not price_data:
+            print("⏭️  Skipped (no data)")
+            self.stats['companies_skipped'] += 1
+            return 'skipped'
+
+        status = self.store_price(company, price_data, calendar)
+
+        if status == 'updated':
+            print(f"✅ ${price_data.get('Current_Price', 0):.2f}")
+        elif status == 'unchanged':
+            print(f"➖ ${price_data.get('Current_Price', 0):.2f} (unchanged)")
+        else:
+            print("❌ Failed to update")
+        return status
+
+    def store_price(self, company, price_data, calendar=None):
+        """
+        Write a fetched quote for a company (only price_checked_at if it hasn't moved)
+
+        Returns: 'updated', 'unchanged' or 'failed'
+        """
+        calendar = calendar or self.calendar_for_company(company)
+        price_data['Market_Status'] = calendar.market_status(datetime.now(timezone.utc))
+        existing_extra_data = company.get('extra_data', {})
+
+        if self.is_unchanged(price_data, existing_extra_data):
+            success = self.touch_price_checked(company['id'])
+            status = 'unchanged'
+        else:
+            success = self.update_company_price(company['id'], price_data, existing_extra_data)
+            status = 'updated'
+
+        if not success:
+            self.stats['companies_failed'] += 1
+            return 'failed'
+
+        if status == 'updated':
+            with self.updated_lock:
+                self.updated_ids.append(company['id'])
+        self.stats[f'companies_{status}'] += 1
+        return status
+
+    def refresh_valuations(self):
+        """Revalue portfolios/watchlists holding the companies updated since the last call"""
+        if self.updated_ids and os.getenv('DATABASE_URL'):
+            from compute_valuations import refresh_valuations
+            with self.updated_lock:
+                company_ids, self.updated_ids = self.updated_ids, []
+            if company_ids and refresh_valuations(company_ids):
+                self.stats['valuation_refreshes'] += 1
+
+    def print_stats(self):
+        """Print statistics"""
+        self.stats['end_time'] = datetime.now()
+        duration = (self.stats['end_time'] - self.stats['start_time']).total_seconds()
+
+        print("=" * 60)
+        print("📊 UPDATE STATISTICS")
+        print("=" * 60)
+        print(f"Duration: {duration:.1f}s")
+        print(f"Schedule Changes: {self.stats['schedule_changes']}")
+        print(f"Companies Found: {self.stats['companies_found']}")
+        print(f"Market Closed (skipped): {self.stats['market_closed']}")
+        print(f"Queue Leases Lost: {self.stats['leases_lost']}")
+        print(f"Companies Processed: {self.stats['companies_processed']}")
+        print(f"Companies Updated: {self.stats['companies_updated']}")
+        print(f"Companies Unchanged (write skipped): {self.stats['companies_unchanged']}")
+        print(f"Companies Skipped: {self.stats['companies_skipped']}")
+        print(f"Companies Failed: {self.stats['companies_failed']}")
+        print(f"Valuation Refreshes: {self.stats['valuation_refreshes']}")
+        print(f"API Calls: {self.stats['api_calls']}")
+        self.router.print_stats()
+        get_client().print_metrics()
+        print(f"Status: {'✅ SUCCESS' if self.stats['success'] else '❌ FAILED'}")
+        if self.stats['error_message']:
+            print(f"Error: {self.stats['error_message']}")
+        print("=" * 60)
 
 if __name__ == '__main__':
     import argparse
 
-    parser = argparse.ArgumentParser(description='Update stock prices from Alpha Vantage')
+    parser = argparse.ArgumentParser(description='Update stock prices from the configured quote providers')
     parser.add_argument('--limit', type=int, default=100, help='Maximum number of companies to update (default: 100)')
+    parser.add_argument('--full', action='store_true', help='Rebuild the ticker schedule instead of applying change events')
+    parser.add_argument('--worker', action='store_true', help='Consume the shared price_fetch_queue (run several workers in parallel)')
+    parser.add_argument('--forever', action='store_true', help='With --worker: keep polling instead of exiting when the queue is drained')
+    parser.add_argument('--batch-size', type=int, default=5, help='With --worker: jobs claimed per batch (default: 5)')
+    parser.add_argument('--profile', action='store_true', help='Write per-stage CPU/memory profiles (see job_profiler.py)')
+    parser.add_argument('--ignore-calendar', action='store_true', help='Fetch every scheduled ticker, even if its market is closed')
+    parser.add_argument('--price-tolerance', type=float, default=PRICE_TOLERANCE,
+                        help=f'Relative price/day range change treated as unchanged (default: {PRICE_TOLERANCE})')
+    parser.add_argument('--volume-tolerance', type=float, default=VOLUME_TOLERANCE,
+                        help=f'Relative volume change treated as unchanged (default: {VOLUME_TOLERANCE})')
     args = parser.parse_args()
 
-    updater = StockPriceUpdater(limit=args.limit)
-    success = updater.run()
+    updater = StockPriceUpdater(limit=args.limit, full=args.full, profile=args.profile or None,
+                                ignore_calendar=args.ignore_calendar, price_tolerance=args.price_tolerance,
+                                volume_tolerance=args.volume_tolerance)
+    if args.worker:
+        success = updater.run_worker(forever=args.forever, batch_size=args.batch_size)
+    else:
+        success = updater.run()
     sys.exit(0 if success else 1)
@@ -4,7 +4,9 @@
  * Orchestrates data fetching with multi-layer caching:
  * 1. Redis cache (5 minutes)
  * 2. PostgreSQL database (persistent)
- * 3. Alpha Vantage API (fallback)
+ * 3. Price refresh service (PRICE_REFRESH_URL, scripts/price_refresh_server.py):
+ *    latest quote through the shared provider quota, coalesced across viewers
+ * 4. Alpha Vantage API (fallback when the refresh service is not configured or down)
  */
 
 import { createClient } from '@/lib/supabase/client'
@@ -35,14 +37,76 @@ export interface StockPriceResponse {
 
 export type Timeframe = '1D' | '1W' | '1M' | '3M' | '6M' | '1Y' | 'ALL'
 
+/**
+ * Table or continuous aggregate holding candles for a timeframe.
+ * Rollups are created by supabase/migrations/20260201000001_stock_price_rollups.sql
+ */
+type PriceSource = 'stock_prices' | 'stock_prices_1h' | 'stock_prices_1d' | 'stock_prices_1w'
+
 interface TimeframeRange {
   days: number
+  source: PriceSource
   intervalMinutes?: number
 }
 
+/**
+ * Candle width per source, used to merge a live quote into the latest candle
+ * (raw stock_prices rows are daily on the free tier)
+ */
+const SOURCE_BUCKET_MS: Record<PriceSource, number> = {
+  stock_prices: 24 * 60 * 60 * 1000,
+  stock_prices_1h: 60 * 60 * 1000,
+  stock_prices_1d: 24 * 60 * 60 * 1000,
+  stock_prices_1w: 7 * 24 * 60 * 60 * 1000,
+}
+
+const PRICE_REFRESH_TIMEOUT_MS = 10000
+
+/**
+ * PostgREST/Postgres error codes for a table or view that doesn't exist
+ */
+const MISSING_RELATION_CODES = ['42P01', 'PGRST205']
+
+/**
+ * Quote fields returned by POST /refresh (extra_data shape)
+ */
+interface RefreshQuote {
+  Current_Price?: number
+  Day_High?: number
+  Day_Low?: number
+  Volume?: number
+  Price_Update?: string
+  Currency?: string
+}
+
+interface RefreshResult {
+  status: 'cached' | 'market_closed' | 'updated' | 'unchanged' | 'rate_limited' | 'no_data' | 'no_ticker' | 'not_found' | 'failed'
+  quote?: RefreshQuote
+  retry_after?: number
+}
+
+/**
+ * Statuses where the returned quote is current
+ */
+const FRESH_REFRESH_STATUSES: RefreshResult['status'][] = ['cached', 'market_closed', 'updated', 'unchanged']
+
+/**
+ * Raised when the refresh service can't be reached (network error, timeout, 5xx)
+ */
+export class PriceRefreshUnavailableError extends Error {
+  constructor(message: string) {
+    super(message)
+    this.name = 'PriceRefreshUnavailableError'
+  }
+}
+
 export class StockPriceService {
   private supabase = createClient()
   private alphaVantage = getAlphaVantageClient()
+  private refreshUrl = process.env.PRICE_REFRESH_URL || ''
+  private refreshToken = process.env.PRICE_REFRESH_TOKEN || ''
+  // Rollups found missing (no TimescaleDB) - read stock_prices directly from then on
+  private missingRollups = new Set<PriceSource>()
 
   /**
    * Get stock prices for a given company and timeframe
@@ -68,7 +132,19 @@ export class StockPriceService {
         }
       }
 
-      // 2. If database data is stale/missing, fetch from API
+      // 2. If database data is stale/missing, ask the refresh service for the latest quote
+      if (this.refreshUrl) {
+        try {
+          return await this.refreshLatestQuote(companyId, symbol, timeframe, dbData)
+        } catch (refreshError) {
+          if (!(refreshError instanceof PriceRefreshUnavailableError)) {
+            throw refreshError
+          }
+          console.warn('Price refresh service unavailable, fetching from API directly:', refreshError.message)
+        }
+      }
+
+      // 3. Refresh service not configured or down: fetch from API
       try {
         const apiData = await this.fetchFromAPI(symbol, timeframe)
 
@@ -113,6 +189,127 @@ export class StockPriceService {
     }
   }
 
+  /**
+   * Latest quote from the refresh service, merged into the stored candles
+   */
+  private async refreshLatestQuote(
+    companyId: string,
+    symbol: string,
+    timeframe: Timeframe,
+    dbData: { data: StockPriceData[]; lastUpdate: string } | null
+  ): Promise<StockPriceResponse> {
+    const result = await this.requestRefresh(companyId)
+    const quote = result.quote
+    const isFresh = FRESH_REFRESH_STATUSES.includes(result.status)
+    const data = quote?.Current_Price != null
+      ? this.applyQuote(dbData?.data || [], quote, this.getTimeframeRange(timeframe).source)
+      : dbData?.data || []
+
+    if (data.length === 0) {
+      throw new Error(
+        result.status === 'rate_limited'
+          ? 'API rate limit reached. Please try again later.'
+          : 'No price data available'
+      )
+    }
+
+    let warning: string | undefined
+    if (result.status === 'rate_limited') {
+      warning = 'API rate limit reached. Showing cached data.'
+    } else if (!isFresh) {
+      warning = 'Unable to fetch latest data. Showing cached data.'
+    }
+
+    return {
+      data,
+      metadata: {
+        symbol,
+        currency: quote?.Currency,
+        lastUpdate: quote?.Price_Update || dbData?.lastUpdate || new Date().toISOString(),
+        dataSource: isFresh ? 'api' : 'database',
+        isFresh,
+        warning,
+      },
+    }
+  }
+
+  /**
+   * POST /refresh for one company (the service shares one provider call across concurrent viewers)
+   */
+  private async requestRefresh(companyId: string): Promise<RefreshResult> {
+    const headers: Record<string, string> = {
+      'Content-Type': 'application/json',
+    }
+
+    if (this.refreshToken) {
+      headers['X-Refresh-Token'] = this.refreshToken
+    }
+
+    let response: Response
+    try {
+      response = await fetch(`${this.refreshUrl.replace(/\/$/, '')}/refresh`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({ company_ids: [companyId] }),
+        cache: 'no-store',
+        signal: AbortSignal.timeout(PRICE_REFRESH_TIMEOUT_MS),
+      })
+    } catch (error) {
+      throw new PriceRefreshUnavailableError(error instanceof Error ? error.message : String(error))
+    }
+
+    if (!response.ok) {
+      // 4xx is a problem with the request (token, payload) - falling back would hide it
+      if (response.status < 500) {
+        throw new Error(`Price refresh rejected: HTTP ${response.status}`)
+      }
+      throw new PriceRefreshUnavailableError(`HTTP ${response.status}: ${response.statusText}`)
+    }
+
+    const json = (await response.json()) as { quotes?: Record<string, RefreshResult> }
+    const result = json.quotes?.[companyId]
+    if (!result) {
+      throw new PriceRefreshUnavailableError('Refresh response without a quote for the company')
+    }
+    return result
+  }
+
+  /**
+   * Merge a quote into the latest candle, or append it as a new candle once its bucket has passed
+   */
+  private applyQuote(data: StockPriceData[], quote: RefreshQuote, source: PriceSource): StockPriceData[] {
+    const price = Number(quote.Current_Price)
+    const timestamp = quote.Price_Update || new Date().toISOString()
+    const last = data[data.length - 1]
+    const high = quote.Day_High != null ? Number(quote.Day_High) : price
+    const low = quote.Day_Low != null ? Number(quote.Day_Low) : price
+
+    if (last && new Date(timestamp).getTime() - new Date(last.timestamp).getTime() < SOURCE_BUCKET_MS[source]) {
+      return [
+        ...data.slice(0, -1),
+        {
+          ...last,
+          high: Math.max(last.high, high),
+          low: Math.min(last.low, low),
+          close: price,
+          volume: quote.Volume != null ? Number(quote.Volume) : last.volume,
+        },
+      ]
+    }
+
+    return [
+      ...data,
+      {
+        timestamp,
+        open: last ? last.close : price,
+        high,
+        low,
+        close: price,
+        volume: quote.Volume != null ? Number(quote.Volume) : 0,
+      },
+    ]
+  }
+
   /**
    * Fetch stock prices from PostgreSQL database
    */
@@ -125,12 +322,16 @@ export class StockPriceService {
       const startDate = new Date()
       startDate.setDate(startDate.getDate() - range.days)
 
-      const { data, error } = await this.supabase
-        .from('stock_prices')
-        .select('timestamp, open, high, low, close, volume')
-        .eq('company_id', companyId)
-        .gte('timestamp', startDate.toISOString())
-        .order('timestamp', { ascending: true })
+      // Rollups only exist on TimescaleDB - fall back to raw rows elsewhere
+      const source = this.missingRollups.has(range.source) ? 'stock_prices' : range.source
+      let { data, error } = await this.queryPrices(source, companyId, startDate)
+
+      if (error && source !== 'stock_prices') {
+        if (MISSING_RELATION_CODES.includes(error.code)) {
+          this.missingRollups.add(source)
+        }
+        ;({ data, error } = await this.queryPrices('stock_prices', companyId, startDate))
+      }
 
       if (error) {
         console.error('Database query error:', error)
@@ -166,6 +367,18 @@ export class StockPriceService {
     }
   }
 
+  /**
+   * Query candles for a company from a raw table or rollup
+   */
+  private queryPrices(source: PriceSource, companyId: string, startDate: Date) {
+    return this.supabase
+      .from(source)
+      .select('timestamp, open, high, low, close, volume')
+      .eq('company_id', companyId)
+      .gte('timestamp', startDate.toISOString())
+      .order('timestamp', { ascending: true })
+  }
+
   /**
    * Fetch stock prices from Alpha Vantage API
    */
@@ -263,27 +476,28 @@ export class StockPriceService {
   }
 
   /**
-   * Get timeframe range in days
+   * Get timeframe range in days and the rollup to read it from
    * NOTE: Free tier only has daily data, so short timeframes show last N days
+   * Row counts per timeframe stay bounded by the bucket size, not by history length
    */
   private getTimeframeRange(timeframe: Timeframe): TimeframeRange {
     switch (timeframe) {
       case '1D':
-        return { days: 5 } // Show last 5 days (1 week of trading)
+        return { days: 5, source: 'stock_prices' } // Show last 5 days (1 week of trading)
       case '1W':
-        return { days: 7 }
+        return { days: 7, source: 'stock_prices_1h' }
       case '1M':
-        return { days: 30 }
+        return { days: 30, source: 'stock_prices_1h' }
       case '3M':
-        return { days: 90 }
+        return { days: 90, source: 'stock_prices_1d' }
       case '6M':
-        return { days: 180 }
+        return { days: 180, source: 'stock_prices_1d' }
       case '1Y':
-        return { days: 365 }
+        return { days: 365, source: 'stock_prices_1d' }
       case 'ALL':
-        return { days: 3650 } // 10 years
+        return { days: 3650, source: 'stock_prices_1w' } // 10 years
       default:
-        return { days: 30 }
+        return { days: 30, source: 'stock_prices_1h' }
     }
   }
 
@@ -303,8 +517,7 @@ export class StockPriceService {
    * For example, aggregate hourly data into daily candles
    */
   private aggregateData(data: StockPriceData[], timeframe: Timeframe): StockPriceData[] {
-    // For now, return data as-is
-    // In future, implement time-bucket aggregation for better performance
+    // Time-bucket aggregation happens in the database rollups (see getTimeframeRange)
     return data
   }
 }
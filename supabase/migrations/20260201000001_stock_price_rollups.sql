@@ -0,0 +1,72 @@
+-- OHLCV rollups for chart timeframes (TimescaleDB continuous aggregates)
+--
+-- Long timeframes (1Y, ALL) read pre-bucketed candles instead of scanning raw
+-- stock_prices rows. The views are created WITH NO DATA and materialized
+-- incrementally by scripts/refresh_price_rollups.py after each price update.
+-- materialized_only = false keeps the newest, not-yet-refreshed bucket visible.
+--
+-- Skipped on plain Supabase (no TimescaleDB); the app falls back to stock_prices.
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'timescaledb') THEN
+    RAISE NOTICE 'timescaledb not installed - skipping stock price rollups';
+    RETURN;
+  END IF;
+
+  -- Hourly candles (1W, 1M)
+  EXECUTE $view$
+    CREATE MATERIALIZED VIEW IF NOT EXISTS stock_prices_1h
+    WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+    SELECT
+      company_id,
+      time_bucket(INTERVAL '1 hour', "timestamp") AS "timestamp",
+      first(open, "timestamp") AS open,
+      max(high) AS high,
+      min(low) AS low,
+      last(close, "timestamp") AS close,
+      sum(volume) AS volume
+    FROM stock_prices
+    GROUP BY company_id, time_bucket(INTERVAL '1 hour', "timestamp")
+    WITH NO DATA
+  $view$;
+
+  -- Daily candles (3M, 6M, 1Y)
+  EXECUTE $view$
+    CREATE MATERIALIZED VIEW IF NOT EXISTS stock_prices_1d
+    WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+    SELECT
+      company_id,
+      time_bucket(INTERVAL '1 day', "timestamp") AS "timestamp",
+      first(open, "timestamp") AS open,
+      max(high) AS high,
+      min(low) AS low,
+      last(close, "timestamp") AS close,
+      sum(volume) AS volume
+    FROM stock_prices
+    GROUP BY company_id, time_bucket(INTERVAL '1 day', "timestamp")
+    WITH NO DATA
+  $view$;
+
+  -- Weekly candles (ALL)
+  EXECUTE $view$
+    CREATE MATERIALIZED VIEW IF NOT EXISTS stock_prices_1w
+    WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+    SELECT
+      company_id,
+      time_bucket(INTERVAL '1 week', "timestamp") AS "timestamp",
+      first(open, "timestamp") AS open,
+      max(high) AS high,
+      min(low) AS low,
+      last(close, "timestamp") AS close,
+      sum(volume) AS volume
+    FROM stock_prices
+    GROUP BY company_id, time_bucket(INTERVAL '1 week', "timestamp")
+    WITH NO DATA
+  $view$;
+
+  CREATE INDEX IF NOT EXISTS idx_stock_prices_1h_company_time ON stock_prices_1h (company_id, "timestamp" DESC);
+  CREATE INDEX IF NOT EXISTS idx_stock_prices_1d_company_time ON stock_prices_1d (company_id, "timestamp" DESC);
+  CREATE INDEX IF NOT EXISTS idx_stock_prices_1w_company_time ON stock_prices_1w (company_id, "timestamp" DESC);
+END
+$$;
@@ -0,0 +1,37 @@
+-- Precomputed price metrics per company (written by scripts/compute_price_metrics.py)
+-- One row per company, replaced in bulk after each batch run so screening
+-- queries (Buy Radar, filters) read numbers instead of scanning stock_prices.
+
+CREATE TABLE IF NOT EXISTS company_price_metrics (
+  company_id UUID PRIMARY KEY REFERENCES companies(id) ON DELETE CASCADE,
+  as_of DATE NOT NULL,
+  last_close DECIMAL(20, 4),
+  return_1d DECIMAL(12, 6),
+  return_1w DECIMAL(12, 6),
+  return_1m DECIMAL(12, 6),
+  return_3m DECIMAL(12, 6),
+  return_1y DECIMAL(12, 6),
+  volatility_30d DECIMAL(12, 6),
+  sma_50 DECIMAL(20, 4),
+  sma_200 DECIMAL(20, 4),
+  drawdown DECIMAL(12, 6),
+  max_drawdown DECIMAL(12, 6),
+  target_price DECIMAL(20, 4),
+  price_gap_percent DECIMAL(12, 4),
+  data_points INTEGER NOT NULL DEFAULT 0,
+  computed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_company_price_metrics_gap ON company_price_metrics(price_gap_percent);
+CREATE INDEX IF NOT EXISTS idx_company_price_metrics_drawdown ON company_price_metrics(drawdown);
+
+ALTER TABLE company_price_metrics ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Anyone can read company price metrics"
+  ON company_price_metrics FOR SELECT
+  USING (true);
+
+COMMENT ON COLUMN company_price_metrics.return_1m IS 'Simple return over 21 trading days (0.05 = +5%)';
+COMMENT ON COLUMN company_price_metrics.volatility_30d IS 'Annualized std-dev of daily log returns over the last 30 trading days';
+COMMENT ON COLUMN company_price_metrics.drawdown IS 'Current distance from the running high (-0.2 = 20% below)';
+COMMENT ON COLUMN company_price_metrics.price_gap_percent IS 'Current price vs Purchase_$ / IPO_Price_$ from extra_data, in percent';
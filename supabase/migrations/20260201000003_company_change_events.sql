@@ -0,0 +1,39 @@
+-- Outbox for company changes emitted by scripts/sync_excel_to_postgres.py
+--
+-- Downstream jobs (symbol population, price scheduling) keep a cursor per
+-- consumer and only process events after it, so an idle run is a couple of
+-- primary-key lookups instead of a full table scan.
+
+CREATE TABLE IF NOT EXISTS company_change_events (
+  id BIGSERIAL PRIMARY KEY,
+  company_id UUID NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+  event_type TEXT NOT NULL CHECK (event_type IN ('created', 'ticker_changed', 'symbol_fields_changed')),
+  payload JSONB DEFAULT '{}',
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_company_change_events_company ON company_change_events(company_id);
+CREATE INDEX IF NOT EXISTS idx_company_change_events_created_at ON company_change_events(created_at);
+
+-- Last processed event per consumer job
+CREATE TABLE IF NOT EXISTS change_event_cursors (
+  consumer TEXT PRIMARY KEY,
+  last_event_id BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Tickers to refresh, maintained by scripts/update_stock_prices.py from the outbox
+CREATE TABLE IF NOT EXISTS price_update_schedule (
+  company_id UUID PRIMARY KEY REFERENCES companies(id) ON DELETE CASCADE,
+  name TEXT NOT NULL,
+  ticker TEXT NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Service role only (no policies = blocked for anon)
+ALTER TABLE company_change_events ENABLE ROW LEVEL SECURITY;
+ALTER TABLE change_event_cursors ENABLE ROW LEVEL SECURITY;
+ALTER TABLE price_update_schedule ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE company_change_events IS 'Outbox of company changes (created, ticker changed, symbol-relevant field changed)';
+COMMENT ON TABLE change_event_cursors IS 'Per-job position in company_change_events';
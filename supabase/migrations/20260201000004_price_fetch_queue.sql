@@ -0,0 +1,27 @@
+-- Work queue for horizontally sharded price updates (scripts/price_queue.py)
+--
+-- One row per scheduled ticker. Workers claim due rows with
+-- FOR UPDATE SKIP LOCKED and hold a lease; a row whose lease expired
+-- (worker crashed or hung) becomes claimable again. lease_token fences
+-- late completions from a worker that already lost its lease.
+
+CREATE TABLE IF NOT EXISTS price_fetch_queue (
+  company_id UUID PRIMARY KEY REFERENCES price_update_schedule(company_id) ON DELETE CASCADE,
+  ticker TEXT NOT NULL,
+  run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  lease_token UUID,
+  leased_by TEXT,
+  lease_expires_at TIMESTAMPTZ,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  last_completed_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_price_fetch_queue_due ON price_fetch_queue(run_after);
+CREATE INDEX IF NOT EXISTS idx_price_fetch_queue_lease ON price_fetch_queue(lease_expires_at) WHERE lease_expires_at IS NOT NULL;
+
+-- Service role only (no policies = blocked for anon)
+ALTER TABLE price_fetch_queue ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON COLUMN price_fetch_queue.run_after IS 'Earliest time the ticker may be fetched again';
+COMMENT ON COLUMN price_fetch_queue.lease_expires_at IS 'Visibility timeout - the row is claimable again after this';
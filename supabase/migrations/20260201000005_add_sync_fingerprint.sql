@@ -0,0 +1,6 @@
+-- Fingerprint of the Excel data last written for a company (scripts/sync_excel_to_postgres.py)
+-- Lets the sync skip unchanged rows without loading the extra_data blob
+
+ALTER TABLE companies ADD COLUMN IF NOT EXISTS sync_fingerprint TEXT;
+
+COMMENT ON COLUMN companies.sync_fingerprint IS 'SHA-1 of the company data from the last Excel sync (unchanged rows are skipped)';
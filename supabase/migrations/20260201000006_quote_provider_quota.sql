@@ -0,0 +1,81 @@
+-- Quota ledger for the quote providers used by scripts/update_stock_prices.py
+--
+-- One row per provider and window (minute/day/month, UTC). Every process
+-- reserves a call through reserve_quote_call() before hitting a provider, so
+-- the limits hold across restarts and across parallel price workers.
+
+CREATE TABLE IF NOT EXISTS quote_provider_usage (
+  provider TEXT NOT NULL,
+  window_kind TEXT NOT NULL CHECK (window_kind IN ('minute', 'day', 'month')),
+  window_start TIMESTAMPTZ NOT NULL,
+  calls INTEGER NOT NULL DEFAULT 0,
+  exhausted BOOLEAN NOT NULL DEFAULT false,
+  PRIMARY KEY (provider, window_kind, window_start)
+);
+
+-- Reserve one call. Returns NULL if reserved, otherwise the window that is used up.
+-- Limits <= 0 mean unlimited.
+CREATE OR REPLACE FUNCTION reserve_quote_call(
+  p_provider TEXT,
+  p_minute_limit INTEGER,
+  p_day_limit INTEGER,
+  p_month_limit INTEGER
+) RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_now TIMESTAMP := NOW() AT TIME ZONE 'UTC';
+  v_windows TIMESTAMPTZ[] := ARRAY[
+    date_trunc('minute', v_now) AT TIME ZONE 'UTC',
+    date_trunc('day', v_now) AT TIME ZONE 'UTC',
+    date_trunc('month', v_now) AT TIME ZONE 'UTC'
+  ];
+  v_kinds TEXT[] := ARRAY['minute', 'day', 'month'];
+  v_limits INTEGER[] := ARRAY[p_minute_limit, p_day_limit, p_month_limit];
+  v_row quote_provider_usage%ROWTYPE;
+BEGIN
+  -- Serialize reservations per provider across processes
+  PERFORM pg_advisory_xact_lock(hashtext('quote_provider_usage:' || p_provider));
+
+  FOR i IN 1..3 LOOP
+    SELECT * INTO v_row FROM quote_provider_usage
+    WHERE provider = p_provider AND window_kind = v_kinds[i] AND window_start = v_windows[i];
+
+    IF FOUND AND (v_row.exhausted OR (v_limits[i] > 0 AND v_row.calls >= v_limits[i])) THEN
+      RETURN v_kinds[i];
+    END IF;
+  END LOOP;
+
+  FOR i IN 1..3 LOOP
+    INSERT INTO quote_provider_usage (provider, window_kind, window_start, calls)
+    VALUES (p_provider, v_kinds[i], v_windows[i], 1)
+    ON CONFLICT (provider, window_kind, window_start)
+    DO UPDATE SET calls = quote_provider_usage.calls + 1;
+  END LOOP;
+
+  -- Minute rows are only needed while they are current
+  DELETE FROM quote_provider_usage
+  WHERE provider = p_provider AND window_kind = 'minute' AND window_start < v_windows[1] - INTERVAL '1 hour';
+
+  RETURN NULL;
+END;
+$$;
+
+-- Mark the current window as used up (the provider itself reported a rate limit)
+CREATE OR REPLACE FUNCTION exhaust_quote_provider(p_provider TEXT, p_window_kind TEXT)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+  INSERT INTO quote_provider_usage (provider, window_kind, window_start, exhausted)
+  VALUES (p_provider, p_window_kind, date_trunc(p_window_kind, NOW() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', true)
+  ON CONFLICT (provider, window_kind, window_start) DO UPDATE SET exhausted = true;
+$$;
+
+REVOKE EXECUTE ON FUNCTION reserve_quote_call(TEXT, INTEGER, INTEGER, INTEGER) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION exhaust_quote_provider(TEXT, TEXT) FROM PUBLIC;
+
+-- Service role only (no policies = blocked for anon)
+ALTER TABLE quote_provider_usage ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE quote_provider_usage IS 'Calls per quote provider and UTC minute/day/month window (shared rate limit state)';
+COMMENT ON COLUMN quote_provider_usage.exhausted IS 'Provider reported its limit as reached for this window';
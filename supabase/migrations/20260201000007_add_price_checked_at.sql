@@ -0,0 +1,7 @@
+-- Last time scripts/update_stock_prices.py fetched a quote for a company
+-- When the quote hasn't moved the updater only sets this column instead of
+-- rewriting extra_data (no TOAST rewrite, no idx_companies_extra_data churn)
+
+ALTER TABLE companies ADD COLUMN IF NOT EXISTS price_checked_at TIMESTAMPTZ;
+
+COMMENT ON COLUMN companies.price_checked_at IS 'Last quote fetch (extra_data Price_Update only changes when the quote moved)';
@@ -0,0 +1,44 @@
+-- Precomputed valuations per portfolio and watchlist (written by scripts/compute_valuations.py)
+-- Recomputed after every price batch for the portfolios/watchlists holding the
+-- updated companies, so dashboards read one row instead of aggregating holdings.
+--
+-- kind = 'portfolio'      owner_id = portfolios.id  (holdings, transactions)
+-- kind = 'watchlist'      owner_id = watchlists.id  (watchlist_items)
+-- kind = 'user_watchlist' owner_id = auth user id   (watchlist)
+
+CREATE TABLE IF NOT EXISTS portfolio_valuations (
+  kind TEXT NOT NULL CHECK (kind IN ('portfolio', 'watchlist', 'user_watchlist')),
+  owner_id UUID NOT NULL,
+  positions INTEGER NOT NULL DEFAULT 0,
+  priced_positions INTEGER NOT NULL DEFAULT 0,
+  currency TEXT,
+  cost_basis DECIMAL(20, 4),
+  market_value DECIMAL(20, 4),
+  unrealized_pnl DECIMAL(20, 4),
+  unrealized_pnl_percent DECIMAL(12, 4),
+  day_change DECIMAL(20, 4),
+  day_change_percent DECIMAL(12, 4),
+  dividends DECIMAL(20, 4),
+  fees DECIMAL(20, 4),
+  advancers INTEGER NOT NULL DEFAULT 0,
+  decliners INTEGER NOT NULL DEFAULT 0,
+  prices_as_of TIMESTAMPTZ,
+  computed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (kind, owner_id)
+);
+
+ALTER TABLE portfolio_valuations ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view valuations of their portfolios and watchlists"
+  ON portfolio_valuations FOR SELECT
+  USING (
+    (kind = 'portfolio' AND EXISTS (SELECT 1 FROM portfolios p WHERE p.id = owner_id AND p.user_id = auth.uid()))
+    OR (kind = 'watchlist' AND EXISTS (SELECT 1 FROM watchlists w WHERE w.id = owner_id AND w.user_id = auth.uid()))
+    OR (kind = 'user_watchlist' AND owner_id = auth.uid())
+  );
+
+COMMENT ON TABLE portfolio_valuations IS 'Market value, P&L and day change per portfolio/watchlist, refreshed after each price batch';
+COMMENT ON COLUMN portfolio_valuations.currency IS 'Quote currency of all priced positions, NULL if mixed (amounts are not FX-converted)';
+COMMENT ON COLUMN portfolio_valuations.cost_basis IS 'Quantity x average purchase price of the priced positions';
+COMMENT ON COLUMN portfolio_valuations.day_change_percent IS 'Portfolios: value-weighted; watchlists: average of the items';
+COMMENT ON COLUMN portfolio_valuations.prices_as_of IS 'Latest price_checked_at among the positions';
@@ -0,0 +1,18 @@
+-- Quota RPCs are for the price workers (service role) only
+-- REVOKE ... FROM PUBLIC in 20260201000006 leaves the explicit EXECUTE grants
+-- Supabase gives anon/authenticated on new functions, so any API key could
+-- burn or reset provider quota via /rpc. Revoke them per role.
+-- The roles only exist on Supabase, not on self-hosted Postgres.
+
+DO $$
+DECLARE
+  api_role TEXT;
+BEGIN
+  FOREACH api_role IN ARRAY ARRAY['anon', 'authenticated'] LOOP
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = api_role) THEN
+      EXECUTE format('REVOKE EXECUTE ON FUNCTION reserve_quote_call(TEXT, INTEGER, INTEGER, INTEGER) FROM %I', api_role);
+      EXECUTE format('REVOKE EXECUTE ON FUNCTION exhaust_quote_provider(TEXT, TEXT) FROM %I', api_role);
+    END IF;
+  END LOOP;
+END;
+$$;
@@ -0,0 +1,30 @@
+-- Refresh the OHLCV rollups with TimescaleDB refresh policies
+--
+-- The price updater only writes companies.current_price, so refreshing the
+-- continuous aggregates from it per batch recomputed nothing. The background
+-- policies below keep each rollup's trailing window materialized (same windows
+-- as scripts/refresh_price_rollups.py); materialized_only = false serves the
+-- newest bucket in real time. The nightly --full run stays as a catch-up.
+--
+-- Skipped on plain Supabase (no TimescaleDB).
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'timescaledb') THEN
+    RAISE NOTICE 'timescaledb not installed - skipping stock price rollup policies';
+    RETURN;
+  END IF;
+
+  PERFORM add_continuous_aggregate_policy('stock_prices_1h',
+    start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '30 minutes', if_not_exists => true);
+
+  PERFORM add_continuous_aggregate_policy('stock_prices_1d',
+    start_offset => INTERVAL '14 days', end_offset => INTERVAL '1 day',
+    schedule_interval => INTERVAL '1 hour', if_not_exists => true);
+
+  PERFORM add_continuous_aggregate_policy('stock_prices_1w',
+    start_offset => INTERVAL '8 weeks', end_offset => INTERVAL '1 week',
+    schedule_interval => INTERVAL '1 day', if_not_exists => true);
+END
+$$;
@@ -0,0 +1,19 @@
+-- Companies a change-event consumer failed to process
+--
+-- Consumers ack their cursor past failed companies (one bad row must not
+-- block every later event) and retry them from here on the next runs, up
+-- to a capped number of attempts (see scripts/change_events.py).
+
+CREATE TABLE IF NOT EXISTS change_event_retries (
+  consumer TEXT NOT NULL,
+  company_id UUID NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+  attempts INTEGER NOT NULL DEFAULT 1,
+  last_error TEXT,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (consumer, company_id)
+);
+
+-- Service role only (no policies = blocked for anon)
+ALTER TABLE change_event_retries ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE change_event_retries IS 'Per-job companies to retry after a failed change event (capped attempts)';
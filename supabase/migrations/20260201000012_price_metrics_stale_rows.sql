@@ -0,0 +1,5 @@
+-- Stale price metrics (see scripts/compute_price_metrics.py)
+-- Companies whose last real close is older than a few trading days keep
+-- their row (data_points, target) but get no as_of/last_close/metrics.
+
+ALTER TABLE company_price_metrics ALTER COLUMN as_of DROP NOT NULL;